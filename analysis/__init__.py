@@ -1,4 +1,47 @@
-from .fit import *
-from .calibration import *
+# Names are resolved on first access (PEP 562), so importing the package loads
+# neither ROOT nor SciPy. ROOT itself is only imported by the ROOT-backed functions.
+import importlib
 
-__all__ = ['gauspeak', 'bg_exp', 'peak_and_bg', 'fit_peak_expbg', 'calibration_fit', 'calibrated_histogram', 'calibrated_acquisition' ]
\ No newline at end of file
+_exports = {
+    'gauspeak': '.fit',
+    'bg_exp': '.fit',
+    'peak_and_bg': '.fit',
+    'fit_peak_expbg': '.fit',
+    'calibration_fit': '.calibration',
+    'calibrated_histogram': '.calibration',
+    'calibrated_acquisition': '.calibration',
+    'energy_resolution': '.calibration',
+    'subtract_background': '.calibration',
+    'Spectrum': '.spectrum',
+    'acquisition_spectrum': '.spectrum',
+    'PeakFit': '.npfit',
+    'hist_to_numpy': '.npfit',
+    'fit_peak_expbg_np': '.npfit',
+    'fit_gaus_np': '.npfit',
+    'fit_peaks_expbg_batch': '.npfit',
+    'calibration_fit_np': '.npfit',
+    'energy_resolution_np': '.npfit',
+    'PeakCandidate': '.peakfind',
+    'find_peaks': '.peakfind',
+    'seed_peak': '.peakfind',
+    'peak_ranges': '.peakfind',
+    'bootstrap_peaks': '.bootstrap',
+    'bootstrap_summary': '.bootstrap',
+    'bin_indices': '.histfill',
+    'fill_th1': '.histfill',
+    'make_th1': '.histfill',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,172 @@
+# *****************************************************************************
+#   Description: Bootstrap and rebinning-variation uncertainties of peak fits
+#   and energy resolutions. Events are resampled with Poisson weights, the
+#   spectra are rebinned with different bin widths and offsets, and every
+#   replica is refitted with the NumPy backend on a process pool.
+#....
+#   Date: 10/2026
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from .npfit import fit_peak_expbg_np, fit_peaks_expbg_batch, fit_gaus_np, FWHM_FACTOR
+from .spectrum import acquisition_spectrum
+
+REPLICA_COLUMNS = ['replica', 'rebin', 'offset', 'peak', 'centroid', 'sigma', 'chi2', 'ndf']
+
+
+def poisson_replicas(counts, n_replicas, rng):
+    '''
+    Bootstrap replicas of a histogram, shape ``(n_replicas, n_bins)``.
+
+    Giving every event an independent Poisson(1) weight (the Poisson bootstrap)
+    makes the content of each bin the sum of ``counts`` such weights, which is
+    Poisson(``counts``) distributed. Replicas are therefore drawn directly per
+    bin, without looping over the events.
+    '''
+    return rng.poisson(np.asarray(counts, dtype=np.float64), size=(n_replicas, len(counts)))
+
+
+def rebin(counts, edges, factor, offset=0):
+    '''
+    Merges groups of ``factor`` consecutive bins, starting at bin ``offset``.
+    ``counts`` may have shape ``(n_bins,)`` or ``(n_spectra, n_bins)``. Bins that
+    do not fill a whole group at the ends are dropped.
+    '''
+    counts = np.asarray(counts)
+    n_groups = (counts.shape[-1] - offset) // factor
+    stop = offset + n_groups * factor
+    merged = counts[..., offset:stop].reshape(*counts.shape[:-1], n_groups, factor).sum(axis=-1)
+    return merged, edges[offset:stop + 1:factor]
+
+
+def _fit_replicas(base_counts, edges, energy_ranges, nominal, expbg, rebin_factors, shift_bins, n_replicas,
+                  first_replica, seed):
+    '''Worker: ``n_replicas`` bootstrap replicas, fitted. Returns an array with ``REPLICA_COLUMNS``.'''
+    rng = np.random.default_rng(seed)
+    replicas = poisson_replicas(base_counts, n_replicas, rng)
+    factors = np.asarray(rebin_factors)[(first_replica + np.arange(n_replicas)) % len(rebin_factors)]
+    offsets = np.array([rng.integers(f) if shift_bins else 0 for f in factors])
+
+    rows = []
+    for factor, offset in sorted(set(zip(factors.tolist(), offsets.tolist()))):
+        idx = np.flatnonzero((factors == factor) & (offsets == offset))
+        counts, r_edges = rebin(replicas[idx], edges, factor, offset)
+        for peak, (xl, xr) in enumerate(energy_ranges):
+            if expbg:
+                # Nominal parameters, per merged bin: background and peak amplitudes scale with the bin width.
+                p0 = nominal[peak] + np.array([np.log(factor), 0., 0., 0., 0.])
+                p0[2] *= factor
+                params, _, chi2, ndf = fit_peaks_expbg_batch(counts, r_edges, xl, xr, p0=np.tile(p0, (len(idx), 1)))
+                mean, sigma = params[:, 3], params[:, 4]
+            else:
+                fits = [fit_gaus_np(c, r_edges, xl, xr) for c in counts]
+                mean, sigma = np.array([f.mean for f in fits]), np.array([f.sigma for f in fits])
+                chi2, ndf = np.array([f.chi2 for f in fits]), np.array([f.ndf for f in fits])
+            for k, i in enumerate(idx):
+                rows.append([first_replica + i, factor, offset, peak, mean[k], sigma[k], chi2[k], ndf[k]])
+    return np.array(rows, dtype=np.float64).reshape(-1, len(REPLICA_COLUMNS))
+
+
+def bootstrap_peaks(acquisition, energy_ranges, energies=None, n_replicas=200, column='s', nbins=4096,
+                    hist_range=None, n_chs=None, rebin_factors=(1,), shift_bins=False, expbg=True, seed=None,
+                    max_workers=None, batch_size=25, chunksize=None):
+    '''
+    Bootstrap distributions of the centroid, width and energy resolution of
+    one or more peaks of an acquisition.
+
+    The spectrum is built once with the finest binning. Every replica draws
+    Poisson event weights (see :func:`poisson_replicas`), optionally merges
+    bins (``rebin_factors``, cycled over the replicas) with a random offset
+    (``shift_bins``), and refits every peak. Replicas are fitted in batches on a
+    process pool.
+
+    Parameters
+    ----------
+    acquisition : SiphraAcquisition
+    energy_ranges : list of tuple
+        Fit windows ``(xl, xr)`` of the peaks, in the units of the spectrum.
+    energies : list of float, optional
+        Known energies of the peaks. With two or more, every replica is
+        calibrated linearly, as ``calibration_fit`` does, and the resolution is
+        ``FWHM * slope / E``; otherwise it is ``FWHM / centroid``.
+    n_replicas : int
+    column, nbins, hist_range, n_chs, chunksize :
+        Spectrum options, see ``spectrum.acquisition_spectrum``. ``nbins`` is the finest binning.
+    rebin_factors : tuple of int
+        Number of fine bins merged in every replica, e.g. ``(1, 2, 4)`` to
+        include the binning choice in the uncertainty.
+    shift_bins : bool
+        Shift the merged bins by a random number of fine bins in every replica.
+    expbg : bool
+        Fit an exponential background under each peak, as ``fit_peak_expbg``.
+    seed : int or numpy.random.SeedSequence, optional
+        Seed of the replicas. For a given seed and ``batch_size``, results do not depend on ``max_workers``.
+    max_workers : int, optional
+        Maximum number of worker processes (cap on CPU use). With 1, replicas
+        are fitted in the calling process.
+    batch_size : int
+        Replicas fitted together by one worker.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per replica and peak with the columns 'replica', 'rebin',
+        'offset', 'peak', 'centroid', 'sigma', 'chi2', 'ndf', 'fwhm' and 'resolution'.
+        See :func:`bootstrap_summary`.
+    '''
+    spectrum = acquisition_spectrum(acquisition, column, nbins, hist_range, n_chs, chunksize)
+    base_counts, edges = spectrum.values, spectrum.edges
+    energy_ranges = [tuple(r) for r in energy_ranges]
+
+    nominal = np.zeros((len(energy_ranges), 5))
+    if expbg:
+        for peak, (xl, xr) in enumerate(energy_ranges):
+            seed_fit = fit_gaus_np(base_counts, edges, xl, xr)
+            nominal[peak] = fit_peak_expbg_np(base_counts, edges, xl, xr, *seed_fit.params).params
+
+    # One child seed per replica batch: the stream of every batch is fixed by ``seed`` alone.
+    seed_seq = seed if isinstance(seed, np.random.SeedSequence) else np.random.SeedSequence(seed)
+    starts = list(range(0, n_replicas, batch_size))
+    tasks = [(base_counts, edges, energy_ranges, nominal, expbg, tuple(rebin_factors), shift_bins,
+              min(batch_size, n_replicas - start), start, child)
+             for start, child in zip(starts, seed_seq.spawn(len(starts)))]
+
+    if max_workers == 1:
+        results = [_fit_replicas(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(_fit_replicas, *zip(*tasks)))
+
+    df = pd.DataFrame(np.concatenate(results), columns=REPLICA_COLUMNS)
+    df[['replica', 'rebin', 'offset', 'peak', 'ndf']] = df[['replica', 'rebin', 'offset', 'peak', 'ndf']].astype(int)
+    df = df.sort_values(['replica', 'peak'], ignore_index=True)
+    df['fwhm'] = FWHM_FACTOR * df['sigma'].abs()
+
+    if energies is not None and len(energies) >= 2:
+        centroids = df.pivot(index='replica', columns='peak', values='centroid').to_numpy()
+        energies = np.asarray(energies, dtype=np.float64)
+        x_mean = centroids.mean(axis=1, keepdims=True)
+        dx = centroids - x_mean
+        slope = (dx * (energies - energies.mean())).sum(axis=1) / (dx**2).sum(axis=1)
+        df['resolution'] = df['fwhm'] * slope[df['replica']] / energies[df['peak']]
+    else:
+        df['resolution'] = df['fwhm'] / df['centroid']
+    return df
+
+
+def bootstrap_summary(replicas, quantiles=(0.16, 0.5, 0.84)):
+    '''
+    Mean, standard deviation and quantiles (e.g. 'resolution_q16') of the
+    centroid, sigma and resolution of every peak over the replicas of
+    :func:`bootstrap_peaks`. Failed fits (non-finite chi2) are left out.
+    '''
+    grouped = replicas[np.isfinite(replicas['chi2'])].groupby('peak')
+    summary = pd.DataFrame({'n': grouped.size()})
+    for col in ('centroid', 'sigma', 'resolution'):
+        summary[f'{col}_mean'] = grouped[col].mean()
+        summary[f'{col}_std'] = grouped[col].std()
+        for q in quantiles:
+            summary[f'{col}_q{100 * q:g}'] = grouped[col].quantile(q)
+    return summary
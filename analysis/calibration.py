@@ -1,12 +1,22 @@
-import ROOT
 import numpy as np
+from .histfill import fill_th1
+from .spectrum import Spectrum, acquisition_spectrum
 
-def calibration_fit(histogram, energy_ranges, energies, expbg = False):
+def calibration_fit(histogram, energy_ranges, energies, expbg = False, peak_finder = None):
     """Function to create a linear calibration fit based on a histogram. Returns slope and constant of linear fit. 
     Inputs: Histogram to base calibration on.
     Ranges within which the peaks of the histogram are located, input as a list if tuples. AT LEAST 2 points.
+    If None, the ranges of the len(energies) most significant peaks are found automatically (peakfind.peak_ranges,
+    options in peak_finder) and assigned to the energies in increasing order.
     Known energies of these peaks, in MeV."""
-    
+    import ROOT
+
+    if energy_ranges is None:
+        from .npfit import hist_to_numpy
+        from .peakfind import peak_ranges
+        energy_ranges = peak_ranges(*hist_to_numpy(histogram), len(energies), **(peak_finder or {}))
+        energies = sorted(energies)
+
     channels = []
     for i in range(len(energy_ranges)):
         cal_fit=ROOT.TF1("cal_fit_" + str(i), "gaus", energy_ranges[i][0], energy_ranges[i][1])
@@ -27,6 +37,8 @@ def calibration_fit(histogram, energy_ranges, energies, expbg = False):
 
 
 def calibrated_histogram(linear_fit, acquisition, n_of_bins):
+    import ROOT
+
     a = linear_fit[0]
     b = linear_fit[1]
     data_cal = a * (acquisition['s']/len(acquisition.active_chs)) + b
@@ -35,7 +47,7 @@ def calibrated_histogram(linear_fit, acquisition, n_of_bins):
     emin = b
 
     hist_cal = ROOT.TH1F("h_cal", "Calibrated Spectrum", n_of_bins, emin, emax)
-    hist_cal.Fill(data_cal)
+    fill_th1(hist_cal, data_cal)
 
     return(hist_cal)
     
@@ -54,6 +66,8 @@ def calibrated_acquisition(linear_fit, acquisition, n_of_bins):
 def energy_resolution(hist, peak_ranges, peak_energies):
     """Calculates energy resolution. Input peak_ranges as a list of tuples. 
     Outputs a list of resolutions for the different energies."""
+    import ROOT
+
     resolutions = []
     for i in range (len(peak_ranges)):
         resolution_fit = ROOT.TF1("res_fit_" + str(i), "gaus", peak_ranges[i][0], peak_ranges[i][1])
@@ -65,6 +79,65 @@ def energy_resolution(hist, peak_ranges, peak_energies):
 
     return resolutions
 
-def subtract_background(acq_sgnl, acq_bg, name=None, n_chs=None):
+def subtract_background(acq_sgnl, acq_bg, name=None, n_chs=None, column='s', nbins=4096, hist_range=None,
+                        chunksize=None, use_cache=True, live_time=False):
     '''Subtract the background from the signal acquisition and return a
-    subtracted histogram'''
\ No newline at end of file
+    subtracted histogram.
+
+    Both acquisitions are binned identically and scaled by their exposure
+    (``SiphraAcquisition.exposure``), so the result is the net count rate per
+    bin (counts/s) with Poisson errors propagated:
+    rate = S/t_S - B/t_B, var = S/t_S^2 + B/t_B^2.
+
+    Parameters
+    ----------
+    acq_sgnl, acq_bg : SiphraAcquisition
+        Signal (source) and background acquisitions.
+    name : str, optional
+        Name of the returned spectrum.
+    n_chs : int, optional
+        Divide the data by this number (e.g. the number of active channels, as in ``calibrated_acquisition``).
+    column : int or str
+        Register to histogram. Default: 's' (summed).
+    nbins, hist_range :
+        Binning. The default range is the full ADC range of the column.
+    chunksize : int, optional
+        Stream the files in chunks of this many events instead of loading them at once.
+    use_cache : bool
+        Keep the background spectrum in the acquisition index (persisted next to the file), so that one
+        long background run can be subtracted from many source runs without being read again.
+    live_time : bool
+        Normalise by the live time estimated from the event timestamps (see
+        ``processing.rateanalytics``) instead of ``exposure``, correcting for dead time.
+        A ValueError is raised if the dead time of either run cannot be estimated.
+
+    Returns
+    -------
+    Spectrum
+        Net rate spectrum. Use ``.to_th1()`` for a ROOT histogram or ``.to_numpy()`` for the NumPy fitters.
+    '''
+    binning = dict(column=column, nbins=nbins, hist_range=hist_range, n_chs=n_chs)
+    signal = acquisition_spectrum(acq_sgnl, chunksize=chunksize, **binning)
+
+    if use_cache:
+        from processing.acquisitionindex import AcquisitionIndex
+        index = AcquisitionIndex(acq_bg.filepath, persist=True)
+        entry = AcquisitionIndex.entry_name('spectrum', column=acq_bg.column_name(column), nbins=nbins,
+                                            hist_range=None if hist_range is None else tuple(hist_range),
+                                            n_chs=n_chs, corrections=acq_bg.corrections_key)
+        bg_counts = index.get(entry, lambda: acquisition_spectrum(acq_bg, chunksize=chunksize, **binning).values)
+        background = Spectrum.from_counts(bg_counts, signal.edges)
+    else:
+        background = acquisition_spectrum(acq_bg, chunksize=chunksize, **binning)
+
+    if live_time:
+        t_sgnl, t_bg = (acq.run_statistics(use_cache=use_cache).live_time for acq in (acq_sgnl, acq_bg))
+        for acq, t in ((acq_sgnl, t_sgnl), (acq_bg, t_bg)):
+            if not np.isfinite(t) or t <= 0:
+                raise ValueError(f"No live time for {acq.name or acq.filepath.stem}: the dead time could not be "
+                                 "estimated from the inter-event times. Use live_time=False to normalise by exposure.")
+    else:
+        t_sgnl, t_bg = acq_sgnl.exposure, acq_bg.exposure
+    net = signal.scaled(1 / t_sgnl) - background.scaled(1 / t_bg)
+    net.name = name if name else f"{acq_sgnl.name or acq_sgnl.filepath.stem} - bg"
+    return net
@@ -1,11 +1,11 @@
 # *****************************************************************************
 #   Description: A set of utilities to ease SIPHRA spectra analysis.
-#   Implements PyROOT dependencies.
+#   Implements PyROOT dependencies. ROOT is imported when a fit is performed,
+#   so importing this module is cheap.
 #   Written by: Oscar Rosero (KTH)
 #....
 #   Date: 02/2026
 
-import ROOT
 import numpy as np
 
 def gauspeak(n_init: int):
@@ -42,11 +42,12 @@ def estimate_exp_params(hist, xl, xr, peak_margin=0.15):
 
     return a, b
 
-def fit_peak_expbg(hist: ROOT.TF1,
+def fit_peak_expbg(hist: "ROOT.TH1",
                    name: str,
-                   xl: float, xr: float,
-                   norm: float, mean: float, sigma: float,
-                   showFit: bool =False, keep_prev_fncs: bool =True):
+                   xl: float | None = None, xr: float | None = None,
+                   norm: float | None = None, mean: float | None = None, sigma: float | None = None,
+                   showFit: bool =False, keep_prev_fncs: bool =True,
+                   peak_finder: dict | None = None):
     '''
     Fits a gaussian peak in a part of a spectrum assuming exponentially decaying background.
     Parameters
@@ -65,7 +66,21 @@ def fit_peak_expbg(hist: ROOT.TF1,
         If false the fit will be executed in silent mode, so the fit function is not displayed
     keep_prev_fncs : bool
         If true the new fit function is added to the list of functions, otherwise it overwrites previous ones.
+    peak_finder : dict, optional
+        Options passed to ``peakfind.find_peaks`` (e.g. ``sigma_bins``, ``xmin``).
+
+    Any of ``xl``, ``xr``, ``norm``, ``mean`` and ``sigma`` left as None is proposed by the automatic peak
+    finder (see ``peakfind.seed_peak``): the peak closest to ``mean`` if given, otherwise the most significant
+    peak inside [xl, xr] or in the whole spectrum.
     '''
+    import ROOT
+
+    if None in (xl, xr, norm, mean, sigma):
+        from .npfit import hist_to_numpy
+        from .peakfind import seed_peak
+        xl, xr, norm, mean, sigma = seed_peak(*hist_to_numpy(hist), xl, xr, norm, mean, sigma,
+                                              **(peak_finder or {}))
+
     # if not const or not decay:
     const, decay = estimate_exp_params(hist, xl, xr)
 
@@ -0,0 +1,106 @@
+# *****************************************************************************
+#   Description: Bulk filling of ROOT histograms from NumPy arrays. Values are
+#   binned with NumPy and the bin contents are set in a single call, instead of
+#   calling ``TH1.Fill`` once per entry from Python.
+#....
+#   Date: 10/2026
+
+import numpy as np
+
+
+def th1_edges(hist):
+    '''Bin edges of the x axis of a ``TH1`` (uniform or variable binning).'''
+    axis = hist.GetXaxis()
+    nbins = hist.GetNbinsX()
+    if axis.GetXbins().GetSize() == 0:
+        return np.linspace(axis.GetXmin(), axis.GetXmax(), nbins + 1)
+    return np.array([axis.GetBinLowEdge(i) for i in range(1, nbins + 2)], dtype=np.float64)
+
+
+def bin_indices(values, edges, include_upper=True):
+    '''
+    Bin of every entry of ``values`` for the bin ``edges``. Bins include their
+    lower edge; with ``include_upper`` the last one also includes its upper
+    edge (``x == edges[-1]``), as in ``np.histogram``, otherwise such entries
+    are above the range, as in ``TH1::Fill``. Entries below the range and NaN
+    get -1, entries above it ``nbins``.
+
+    ``edges`` may be variable (1D) or uniform with one row per column of
+    ``values`` (shape ``(n_columns, nbins + 1)``).
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    edges = np.asarray(edges, dtype=np.float64)
+    nbins = edges.shape[-1] - 1
+    lo, hi = edges[..., 0], edges[..., -1]
+    widths = np.diff(edges, axis=-1)
+    if np.allclose(widths, widths[..., :1]):
+        idx = np.floor((values - lo) * (nbins / (hi - lo)))
+    elif edges.ndim == 1:
+        idx = np.searchsorted(edges, values, side='right') - 1.
+    else:
+        raise ValueError("Per-column edges must be uniform")
+    idx = np.clip(idx, -1, nbins)
+    idx[values == hi] = nbins - 1 if include_upper else nbins
+    idx[np.isnan(values)] = -1
+    return idx.astype(np.int64)
+
+
+def bin_with_flows(values, edges, weights=None):
+    '''
+    Bins ``values`` following ROOT conventions: the returned arrays have
+    ``len(edges) + 1`` entries, the first one being the underflow and the last
+    one the overflow (``x == xmax`` goes to the overflow, as in ``TH1::Fill``).
+
+    Returns ``(sum_of_weights, sum_of_squared_weights)`` per bin.
+    '''
+    values = np.asarray(values, dtype=np.float64).ravel()
+    idx = bin_indices(values, edges, include_upper=False) + 1
+    n = len(edges) + 1
+    if weights is None:
+        counts = np.bincount(idx, minlength=n).astype(np.float64)
+        return counts, counts
+    weights = np.asarray(weights, dtype=np.float64).ravel()
+    return np.bincount(idx, weights, minlength=n), np.bincount(idx, weights**2, minlength=n)
+
+
+def fill_th1(hist, values, weights=None):
+    '''
+    Fills a ROOT ``TH1`` with all the entries of ``values`` (optionally weighted)
+    at once and returns it.
+
+    If the histogram is still empty, the contents (and errors, for weighted
+    fills or histograms with ``Sumw2``) are binned with NumPy and set in bulk
+    with ``SetContent``/``SetError``; otherwise the entries are added with a
+    single ``FillN`` call. Both paths follow ``TH1::Fill``: ``x == xmax`` goes
+    to the overflow. Statistics (mean, RMS) are recomputed from the bins.
+    '''
+    values = np.ascontiguousarray(values, dtype=np.float64).ravel()
+    if weights is not None:
+        weights = np.ascontiguousarray(weights, dtype=np.float64).ravel()
+
+    if hist.GetEntries() == 0 and hist.GetSumOfWeights() == 0:
+        sumw, sumw2 = bin_with_flows(values, th1_edges(hist), weights)
+        hist.SetContent(sumw)
+        if weights is not None or hist.GetSumw2N() > 0:
+            hist.SetError(np.sqrt(sumw2))
+        hist.ResetStats()
+        hist.SetEntries(len(values))
+    else:
+        hist.FillN(len(values), values, weights if weights is not None else np.ones(len(values)))
+    return hist
+
+
+def make_th1(name, title, values, nbins, xmin=None, xmax=None, weights=None, kind='TH1D'):
+    '''
+    Creates a ROOT histogram of class ``kind`` ('TH1D', 'TH1F', 'TH1I', ...) and
+    fills it in bulk with ``values``. The range defaults to that of the data.
+    '''
+    import ROOT
+
+    values = np.asarray(values, dtype=np.float64).ravel()
+    xmin = values.min() if xmin is None else xmin
+    xmax = values.max() if xmax is None else xmax
+    if xmax <= xmin:
+        xmax = xmin + 1.
+    hist = getattr(ROOT, kind)(name, title, nbins, xmin, xmax)
+    return fill_th1(hist, values, weights)
@@ -0,0 +1,296 @@
+# *****************************************************************************
+#   Description: NumPy/SciPy implementation of the spectrum fits in fit.py and
+#   calibration.py. Works on ``np.histogram`` output (counts, bin edges) and
+#   does not need ROOT, so it can run in worker processes. The model and
+#   parameter order are the same as in ``fit.peak_and_bg``:
+#   exp([Const] + [Decay]*x) + [Norm]*exp(-0.5*((x - [Mean])/[Sigma])^2)
+#....
+#   Date: 10/2026
+
+import numpy as np
+from dataclasses import dataclass
+from scipy.optimize import least_squares
+
+from .peakfind import seed_peak, peak_ranges
+
+PAR_NAMES = ("Const", "Decay", "Norm", "Mean", "Sigma")
+FWHM_FACTOR = 2.355
+_MAX_EXPONENT = 700. # Avoids overflows of np.exp while iterating.
+
+
+@dataclass
+class PeakFit:
+    '''Result of a peak fit. ``params`` and ``errors`` follow the order of ``names``.'''
+    params: np.ndarray
+    errors: np.ndarray
+    chi2: float
+    ndf: int
+    success: bool
+    names: tuple = PAR_NAMES
+
+    def parameter(self, name: str) -> float:
+        '''Same role as ``TF1.GetParameter(name)``.'''
+        return self.params[self.names.index(name)]
+
+    def error(self, name: str) -> float:
+        '''Same role as ``TF1.GetParError(index)``.'''
+        return self.errors[self.names.index(name)]
+
+    @property
+    def mean(self) -> float:
+        return self.parameter("Mean")
+
+    @property
+    def sigma(self) -> float:
+        return abs(self.parameter("Sigma"))
+
+    @property
+    def fwhm(self) -> float:
+        return FWHM_FACTOR * self.sigma
+
+
+# ---------- Models and analytic Jacobians ----------
+# ``p`` has the parameters in the last axis, so the same functions evaluate a
+# single fit (p.shape == (n_par,)) or a batch of fits (p.shape == (n_fits, n_par)).
+
+def gaus(x, p):
+    p = np.asarray(p, dtype=np.float64)[..., None]
+    return p[..., 0, :] * np.exp(-0.5 * ((x - p[..., 1, :]) / p[..., 2, :])**2)
+
+
+def gaus_jac(x, p):
+    p = np.asarray(p, dtype=np.float64)[..., None]
+    norm, mean, sigma = p[..., 0, :], p[..., 1, :], p[..., 2, :]
+    u = (x - mean) / sigma
+    g = np.exp(-0.5 * u**2)
+    return np.stack([g, norm * g * u / sigma, norm * g * u**2 / sigma], axis=-1)
+
+
+def peak_and_bg(x, p):
+    p = np.asarray(p, dtype=np.float64)
+    bg = np.exp(np.minimum(p[..., 0, None] + p[..., 1, None] * x, _MAX_EXPONENT))
+    return bg + gaus(x, p[..., 2:])
+
+
+def peak_and_bg_jac(x, p):
+    p = np.asarray(p, dtype=np.float64)
+    bg = np.exp(np.minimum(p[..., 0, None] + p[..., 1, None] * x, _MAX_EXPONENT))
+    x = np.broadcast_to(x, bg.shape)
+    return np.concatenate([np.stack([bg, x * bg], axis=-1), gaus_jac(x, p[..., 2:])], axis=-1)
+
+
+# ---------- Helpers ----------
+
+def hist_to_numpy(hist):
+    '''
+    Converts a ROOT ``TH1`` into ``(counts, edges)``, the format returned by
+    ``np.histogram``, so both backends can be cross-checked on the same data.
+    '''
+    n = hist.GetNbinsX()
+    counts = np.array([hist.GetBinContent(i) for i in range(1, n + 1)], dtype=np.float64)
+    edges = np.array([hist.GetBinLowEdge(i) for i in range(1, n + 2)], dtype=np.float64)
+    return counts, edges
+
+
+def _window(counts, edges, xl, xr):
+    '''Bin centres and counts of the bins whose centre lies in [xl, xr].'''
+    centres = 0.5 * (edges[:-1] + edges[1:])
+    mask = (centres >= xl) & (centres <= xr)
+    return centres[mask], np.asarray(counts, dtype=np.float64)[..., mask]
+
+
+def _weights(y):
+    '''Neyman chi-square weights 1/sqrt(y); empty bins are ignored, as in ROOT.'''
+    return np.where(y > 0, 1 / np.sqrt(np.maximum(y, 1)), 0.)
+
+
+def estimate_exp_params(counts, edges, xl, xr, peak_margin=0.15):
+    '''
+    NumPy version of ``fit.estimate_exp_params``. Estimates the parameters of
+    the exponential using the range bounds, avoiding the peak region.
+    '''
+    margin = (xr - xl) * peak_margin
+    x1, x2 = xl + margin, xr - margin
+    idx = np.clip(np.searchsorted(edges, [x1, x2], side='right') - 1, 0, len(counts) - 1)
+    y1, y2 = counts[idx[0]], counts[idx[1]]
+    if y1 <= 0 or y2 <= 0:
+        return 0, -0.01 # fallback
+    b = (np.log(y2) - np.log(y1)) / (x2 - x1)
+    a = np.log(y1) - b * x1
+    return a, b
+
+
+def _moments_seed(x, y):
+    '''Starting Gaussian parameters from the moments of the data in the window.'''
+    total = y.sum()
+    if total <= 0:
+        return np.array([0., 0.5 * (x[0] + x[-1]), x[-1] - x[0]])
+    mean = (x * y).sum() / total
+    sigma = np.sqrt(max((y * (x - mean)**2).sum() / total, 1e-12))
+    return np.array([y.max(), mean, sigma])
+
+
+def _least_squares(model, jac, x, y, p0):
+    w = _weights(y)
+    res = least_squares(lambda p: w * (model(x, p) - y),
+                        p0,
+                        jac=lambda p: w[:, None] * jac(x, p),
+                        method='lm')
+    ndf = int(np.count_nonzero(w)) - len(p0)
+    try:
+        cov = np.linalg.inv(res.jac.T @ res.jac)
+        errors = np.sqrt(np.abs(np.diag(cov)))
+    except np.linalg.LinAlgError:
+        errors = np.full(len(p0), np.nan)
+    return res.x, errors, float(2 * res.cost), ndf, bool(res.success)
+
+
+# ---------- Fits ----------
+
+def fit_peak_expbg_np(counts, edges, xl=None, xr=None, norm=None, mean=None, sigma=None,
+                      const=None, decay=None, peak_finder=None) -> PeakFit:
+    '''
+    Fits a gaussian peak in a part of a spectrum assuming exponentially decaying
+    background. Counterpart of ``fit.fit_peak_expbg`` for NumPy histograms.
+
+    Parameters
+    ----------
+    counts, edges : numpy.ndarray
+        Histogram as returned by ``np.histogram``.
+    xl, xr : float
+        Lower and upper limits of the section of the spectrum to be fitted.
+    norm, mean, sigma : float
+        Starting parameters of the gaussian.
+    const, decay : float, optional
+        Starting parameters of the background. Estimated from the window bounds
+        with ``estimate_exp_params`` if not given.
+    peak_finder : dict, optional
+        Options passed to ``peakfind.find_peaks``. Window bounds and gaussian
+        parameters left as None are proposed by ``peakfind.seed_peak``.
+    '''
+    counts = np.asarray(counts, dtype=np.float64)
+    if None in (xl, xr, norm, mean, sigma):
+        xl, xr, norm, mean, sigma = seed_peak(counts, edges, xl, xr, norm, mean, sigma, **(peak_finder or {}))
+    if const is None or decay is None:
+        const, decay = estimate_exp_params(counts, edges, xl, xr)
+    x, y = _window(counts, edges, xl, xr)
+    p, errors, chi2, ndf, success = _least_squares(peak_and_bg, peak_and_bg_jac, x, y,
+                                                   np.array([const, decay, norm, mean, sigma], dtype=np.float64))
+    p[4] = abs(p[4])
+    return PeakFit(p, errors, chi2, ndf, success)
+
+
+def fit_gaus_np(counts, edges, xl, xr, p0=None) -> PeakFit:
+    '''Plain gaussian fit in [xl, xr] (ROOT's "gaus"). Seeded from the data moments if ``p0`` is not given.'''
+    x, y = _window(np.asarray(counts, dtype=np.float64), edges, xl, xr)
+    p0 = _moments_seed(x, y) if p0 is None else np.asarray(p0, dtype=np.float64)
+    p, errors, chi2, ndf, success = _least_squares(gaus, gaus_jac, x, y, p0)
+    p[2] = abs(p[2])
+    return PeakFit(p, errors, chi2, ndf, success, names=("Norm", "Mean", "Sigma"))
+
+
+def fit_peaks_expbg_batch(counts, edges, xl, xr, p0=None, max_iter=100, tol=1e-8, peak_finder=None):
+    '''
+    Vectorised Levenberg-Marquardt fit of the peak + exponential background model
+    to many spectra at once.
+
+    Parameters
+    ----------
+    counts : numpy.ndarray
+        Array of shape ``(n_spectra, n_bins)``. All spectra share ``edges``.
+    xl, xr : float or numpy.ndarray
+        Fit window, common to all spectra or one per spectrum.
+    p0 : numpy.ndarray
+        Starting parameters, shape ``(n_spectra, 5)`` in the order of ``PAR_NAMES``.
+        ``np.nan`` in the background columns requests ``estimate_exp_params``.
+        ``np.nan`` in the gaussian columns (or ``p0=None``) requests a seed from
+        the most significant peak found in [xl, xr] (options in ``peak_finder``).
+
+    Returns
+    -------
+    params, errors : numpy.ndarray
+        Shape ``(n_spectra, 5)``.
+    chi2 : numpy.ndarray
+    ndf : numpy.ndarray
+    '''
+    counts = np.atleast_2d(np.asarray(counts, dtype=np.float64))
+    n_fits = len(counts)
+    xl = np.broadcast_to(np.asarray(xl, dtype=np.float64), (n_fits,))
+    xr = np.broadcast_to(np.asarray(xr, dtype=np.float64), (n_fits,))
+    p = np.array(np.broadcast_to(np.nan if p0 is None else p0, (n_fits, 5)), dtype=np.float64)
+
+    for k in np.flatnonzero(np.isnan(p[:, 2:]).any(axis=1)):
+        try:
+            _, _, norm, mean, sigma = seed_peak(counts[k], edges, xl[k], xr[k], **(peak_finder or {}))
+        except RuntimeError: # No significant peak in the window: seed from the moments of the data
+            norm, mean, sigma = _moments_seed(*_window(counts[k], edges, xl[k], xr[k]))
+        p[k, 2:] = np.where(np.isnan(p[k, 2:]), [norm, mean, sigma], p[k, 2:])
+
+    for k in np.flatnonzero(np.isnan(p[:, :2]).any(axis=1)):
+        p[k, :2] = estimate_exp_params(counts[k], edges, xl[k], xr[k])
+
+    # Restrict all fits to the union of the windows; bins outside each window get weight 0.
+    x, y = _window(counts, edges, xl.min(), xr.max())
+    w = _weights(y) * ((x >= xl[:, None]) & (x <= xr[:, None]))
+    eye = np.eye(5)
+
+    def chi2_of(params):
+        with np.errstate(over='ignore', invalid='ignore'): # Diverging trial steps are rejected below
+            return (w**2 * (peak_and_bg(x, params) - y)**2).sum(axis=1)
+
+    lam = np.full(n_fits, 1e-3)
+    chi2 = chi2_of(p)
+    active = np.ones(n_fits, dtype=bool)
+    for _ in range(max_iter):
+        if not active.any():
+            break
+        r = w * (y - peak_and_bg(x, p))
+        J = w[..., None] * peak_and_bg_jac(x, p)
+        JTJ = np.einsum('nbi,nbj->nij', J, J)
+        g = np.einsum('nbi,nb->ni', J, r)
+        A = JTJ + lam[:, None, None] * JTJ * eye + 1e-12 * eye
+        try:
+            step = np.linalg.solve(A, g[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            step = (np.linalg.pinv(A) @ g[..., None])[..., 0]
+        step[~active] = 0
+        candidate = p + step
+        chi2_new = chi2_of(candidate)
+        better = np.isfinite(chi2_new) & (chi2_new <= chi2)
+        converged = better & (np.abs(chi2 - chi2_new) <= tol * np.maximum(chi2, 1))
+        p[better] = candidate[better]
+        chi2 = np.where(better, chi2_new, chi2)
+        lam = np.where(better, lam / 10, lam * 10)
+        active &= ~converged & (lam < 1e10)
+
+    J = w[..., None] * peak_and_bg_jac(x, p)
+    JTJ = np.einsum('nbi,nbj->nij', J, J)
+    errors = np.sqrt(np.abs(np.diagonal(np.linalg.pinv(JTJ), axis1=1, axis2=2)))
+    p[:, 4] = np.abs(p[:, 4])
+    ndf = np.count_nonzero(w, axis=1) - 5
+    return p, errors, chi2, ndf
+
+
+def calibration_fit_np(counts, edges, energy_ranges, energies, peak_finder=None):
+    '''
+    Counterpart of ``calibration.calibration_fit``: fits a gaussian in each of the
+    ``energy_ranges`` (list of tuples, at least 2) and a straight line between the
+    fitted means and the known ``energies``. Returns ``[slope, constant]``.
+    If ``energy_ranges`` is None, the windows of the ``len(energies)`` most
+    significant peaks are used and assigned to the energies in increasing order.
+    '''
+    if energy_ranges is None:
+        energy_ranges = peak_ranges(counts, edges, len(energies), **(peak_finder or {}))
+        energies = sorted(energies)
+    channels = np.array([fit_gaus_np(counts, edges, lo, hi).mean for lo, hi in energy_ranges], dtype=np.float64)
+    a, b = np.polyfit(channels, np.asarray(energies, dtype=np.float64), 1)
+    return [a, b]
+
+
+def energy_resolution_np(counts, edges, peak_ranges, peak_energies):
+    '''
+    Counterpart of ``calibration.energy_resolution``. Outputs a list of
+    resolutions FWHM/E for the different energies.
+    '''
+    return [fit_gaus_np(counts, edges, lo, hi).fwhm / energy
+            for (lo, hi), energy in zip(peak_ranges, peak_energies)]
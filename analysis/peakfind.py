@@ -0,0 +1,231 @@
+# *****************************************************************************
+#   Description: Automatic peak finding in spectra. Peaks are located as
+#   significant minima of the Gaussian-smoothed second derivative, searched
+#   over a range of smoothing widths so that narrow and broad peaks are both
+#   found, and fit windows and starting parameters for ``fit_peak_expbg`` are
+#   derived from them. The rising trigger-threshold edge at low channels is
+#   left out by default. Works on ``np.histogram`` output; many spectra sharing
+#   the same binning are processed at once.
+#....
+#   Date: 10/2026
+
+import numpy as np
+from collections import namedtuple
+from scipy.ndimage import gaussian_filter1d, correlate1d
+
+# Fit window [xl, xr] and starting parameters for ``fit_peak_expbg`` of one peak.
+PeakCandidate = namedtuple('PeakCandidate', ['xl', 'xr', 'norm', 'mean', 'sigma', 'significance'])
+
+MIN_SCALE = 2. # Narrowest smoothing kernel of the scale search, in bins
+SCALE_STEP = np.sqrt(2.) # Ratio of consecutive smoothing widths
+MAX_SCALE_FRACTION = 1 / 32 # Widest smoothing kernel, as a fraction of the number of bins
+
+
+def _second_derivative_kernel(sigma_bins):
+    radius = int(4 * sigma_bins + 0.5)
+    u = np.arange(-radius, radius + 1) / sigma_bins
+    kernel = (u**2 - 1) * np.exp(-0.5 * u**2)
+    return kernel / (np.sqrt(2 * np.pi) * sigma_bins**3)
+
+
+def second_derivative_significance(counts, sigma_bins=3.):
+    '''
+    Significance of the negative curvature of the spectra, bin by bin:
+    ``-d2 / std(d2)``, where ``d2`` is the second derivative of the spectrum
+    smoothed with a Gaussian of ``sigma_bins`` and ``std(d2)`` follows from
+    Poisson statistics. Peaks show up as large positive values.
+
+    ``counts`` has shape ``(n_bins,)`` or ``(n_spectra, n_bins)``.
+    '''
+    counts = np.asarray(counts, dtype=np.float64)
+    kernel = _second_derivative_kernel(sigma_bins)
+    d2 = correlate1d(counts, kernel, axis=-1, mode='nearest')
+    var = correlate1d(np.maximum(counts, 1.), kernel**2, axis=-1, mode='nearest')
+    return -d2 / np.sqrt(var), d2
+
+
+def smoothing_scales(nbins, sigma_bins=None):
+    '''
+    Widths, in bins, of the smoothing kernels searched: ``[sigma_bins]`` if
+    given, otherwise from ``MIN_SCALE`` to ``nbins * MAX_SCALE_FRACTION`` in
+    steps of ``SCALE_STEP``.
+    '''
+    if sigma_bins is not None:
+        return [float(sigma_bins)]
+    n_scales = int(np.floor(np.log(max(nbins * MAX_SCALE_FRACTION, MIN_SCALE) / MIN_SCALE) / np.log(SCALE_STEP))) + 1
+    return list(MIN_SCALE * SCALE_STEP ** np.arange(n_scales))
+
+
+def threshold_edge(counts, sigma_bins=None, max_significance=3.):
+    '''
+    Index of the first local minimum of the spectrum after its rising
+    trigger-threshold edge. Starting from the first non-empty bin, the
+    spectrum is followed while it is not significantly falling (the rise),
+    then while it is not significantly rising (the fall); the slope is that of the spectrum
+    smoothed with a Gaussian of ``sigma_bins`` (default: ``nbins / 256``, at
+    least ``MIN_SCALE``) and its significance follows from Poisson statistics.
+    '''
+    counts = np.asarray(counts, dtype=np.float64)
+    if sigma_bins is None:
+        sigma_bins = max(MIN_SCALE, len(counts) / 256)
+    radius = int(4 * sigma_bins + 0.5)
+    u = np.arange(-radius, radius + 1) / sigma_bins
+    kernel = u * np.exp(-0.5 * u**2) / (np.sqrt(2 * np.pi) * sigma_bins**2)
+    slope = correlate1d(counts, kernel, mode='nearest')
+    slope /= np.sqrt(correlate1d(np.maximum(counts, 1.), kernel**2, mode='nearest'))
+
+    nonzero = np.flatnonzero(counts > 0)
+    i = int(nonzero[0]) if len(nonzero) else 0
+    while i + 1 < len(counts) and slope[i] > -max_significance:
+        i += 1
+    while i + 1 < len(counts) and slope[i] < max_significance:
+        i += 1
+    return i
+
+
+def find_peaks(counts, edges, sigma_bins=None, min_significance=5., window_sigmas=3., xmin=None, xmax=None,
+               suppress_edge=True):
+    '''
+    Proposes fit windows and starting parameters for all the significant peaks
+    of a spectrum.
+
+    Parameters
+    ----------
+    counts, edges : numpy.ndarray
+        Histogram as returned by ``np.histogram`` (uniform binning). ``counts``
+        may also be an array of shape ``(n_spectra, n_bins)``.
+    sigma_bins : float, optional
+        Width, in bins, of the smoothing kernel, comparable to the width of the
+        peaks of interest. Default: every width of :func:`smoothing_scales`;
+        each peak is then reported at the width where it is most significant.
+    min_significance : float
+        Minimum significance (in standard deviations) of the curvature.
+    window_sigmas : float
+        Half-width of the proposed fit window, in units of the peak sigma.
+    xmin, xmax : float, optional
+        Only peaks within these bounds are reported.
+    suppress_edge : bool
+        If ``xmin`` is not given, skip the trigger-threshold edge at low
+        channels: peaks below the first local minimum of the spectrum (see
+        :func:`threshold_edge`) are not reported.
+
+    Returns
+    -------
+    list of PeakCandidate
+        Sorted by position. For 2D input, one such list per spectrum.
+    '''
+    counts = np.asarray(counts, dtype=np.float64)
+    spectra = np.atleast_2d(counts)
+    centres = 0.5 * (edges[:-1] + edges[1:])
+    if xmin is None and suppress_edge:
+        lower = [centres[threshold_edge(spectrum)] for spectrum in spectra]
+    else:
+        lower = [xmin] * len(spectra)
+
+    found = [[] for _ in spectra]
+    for scale in smoothing_scales(spectra.shape[-1], sigma_bins):
+        signif, d2 = second_derivative_significance(spectra, scale)
+        smooth = gaussian_filter1d(spectra, scale, axis=-1, mode='nearest')
+        for k in range(len(spectra)):
+            found[k] += _candidates(spectra[k], signif[k], d2[k], smooth[k], edges, scale, min_significance,
+                                    window_sigmas, lower[k], xmax)
+    peaks = [_merge_scales(candidates) for candidates in found]
+    return peaks if counts.ndim == 2 else peaks[0]
+
+
+def _merge_scales(candidates):
+    '''
+    One candidate per peak from the candidates found at all the scales: the
+    most significant ones are kept, and those closer than two sigmas to a kept one are dropped.
+    '''
+    kept = []
+    for c in sorted(candidates, key=lambda c: -c.significance):
+        if all(abs(c.mean - k.mean) > 2 * max(c.sigma, k.sigma) for k in kept):
+            kept.append(c)
+    return sorted(kept, key=lambda c: c.mean)
+
+
+def _candidates(counts, signif, d2, smooth, edges, sigma_bins, min_significance, window_sigmas, xmin, xmax):
+    centres = 0.5 * (edges[:-1] + edges[1:])
+    width = edges[1] - edges[0]
+    n = len(counts)
+
+    is_max = np.zeros(n, dtype=bool)
+    is_max[1:-1] = (signif[1:-1] > signif[:-2]) & (signif[1:-1] >= signif[2:])
+    is_max &= signif >= min_significance
+    if xmin is not None:
+        is_max &= centres >= xmin
+    if xmax is not None:
+        is_max &= centres <= xmax
+
+    # Keep a single maximum (the most significant) per region of negative curvature.
+    negative = d2 < 0
+    region = np.cumsum(np.diff(negative.astype(np.int8), prepend=0) == 1)
+    peaks = np.flatnonzero(is_max & negative)
+    peaks = peaks[np.lexsort((-signif[peaks], region[peaks]))]
+    peaks = np.sort(peaks[np.r_[True, np.diff(region[peaks]) != 0]]) if len(peaks) else peaks
+
+    # Zero crossings of d2 at both sides of every peak, at +-sqrt(sigma_peak^2 + sigma_kernel^2).
+    candidates = []
+    for i in peaks:
+        left = i
+        while left > 0 and negative[left - 1]:
+            left -= 1
+        right = i
+        while right < n - 1 and negative[right + 1]:
+            right += 1
+        half_width = 0.5 * (right - left + 1)
+        sigma = width * np.sqrt(max(half_width**2 - sigma_bins**2, 1.))
+
+        mean = centres[i]
+        xl, xr = mean - window_sigmas * sigma, mean + window_sigmas * sigma
+        lo = max(int(np.searchsorted(centres, xl)), 0)
+        hi = min(int(np.searchsorted(centres, xr)), n - 1)
+        background = np.interp(mean, [centres[lo], centres[hi]], [smooth[lo], smooth[hi]])
+        norm = max(counts[max(i - 1, 0):i + 2].mean() - background, counts[i] * 0.1, 1.)
+        candidates.append(PeakCandidate(float(xl), float(xr), float(norm), float(mean), float(sigma), float(signif[i])))
+    return candidates
+
+
+def seed_peak(counts, edges, xl=None, xr=None, norm=None, mean=None, sigma=None, **kwargs):
+    '''
+    Completes the fit window and starting parameters of ``fit_peak_expbg``.
+    Values already given are kept. The peak used is the candidate closest to
+    ``mean`` if given, otherwise the most significant one inside [xl, xr] (or
+    in the whole spectrum). ``kwargs`` are passed to :func:`find_peaks`; the
+    threshold edge is only suppressed if neither ``xl`` nor ``mean`` is given.
+
+    Returns ``(xl, xr, norm, mean, sigma)``.
+    '''
+    if None not in (xl, xr, norm, mean, sigma):
+        return xl, xr, norm, mean, sigma
+
+    kwargs.setdefault('suppress_edge', xl is None and mean is None)
+    candidates = find_peaks(counts, edges, **kwargs)
+    if mean is not None:
+        candidates = sorted(candidates, key=lambda c: abs(c.mean - mean))
+    else:
+        candidates = [c for c in candidates
+                      if (xl is None or c.mean >= xl) and (xr is None or c.mean <= xr)]
+        candidates = sorted(candidates, key=lambda c: -c.significance)
+    if not candidates:
+        raise RuntimeError("No significant peak found to seed the fit. Provide the starting parameters.")
+
+    best = candidates[0]
+    return (best.xl if xl is None else xl,
+            best.xr if xr is None else xr,
+            best.norm if norm is None else norm,
+            best.mean if mean is None else mean,
+            best.sigma if sigma is None else sigma)
+
+
+def peak_ranges(counts, edges, n_peaks, **kwargs):
+    '''
+    Fit windows ``[(xl, xr), ...]`` of the ``n_peaks`` most significant peaks,
+    sorted by position, as used by ``calibration_fit`` and ``energy_resolution``.
+    ``kwargs`` are passed to :func:`find_peaks`.
+    '''
+    candidates = sorted(find_peaks(counts, edges, **kwargs), key=lambda c: -c.significance)[:n_peaks]
+    if len(candidates) < n_peaks:
+        raise RuntimeError(f"Only {len(candidates)} significant peaks found, {n_peaks} requested.")
+    return [(c.xl, c.xr) for c in sorted(candidates, key=lambda c: c.mean)]
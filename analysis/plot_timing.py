@@ -7,9 +7,11 @@
 # *****************************************************************************
 
 import argparse
-import csv
 import sys
+import numpy as np
+import pandas as pd
 import ROOT
+from histfill import fill_th1
 
 
 def parse_args():
@@ -37,12 +39,7 @@ def parse_args():
 
 
 def read_times(csv_file):
-    times = []
-    with open(csv_file, newline="") as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            times.append(float(row["time_s"]))
-    return times
+    return pd.read_csv(csv_file)["time_s"].to_numpy(dtype=np.float64)
 
 
 def main():
@@ -56,12 +53,12 @@ def main():
     except KeyError:
         sys.exit("[ERROR] CSV does not contain a 'time_s' column.")
 
-    if not times:
+    if len(times) == 0:
         sys.exit("[ERROR] No data found in the file.")
 
     n_events = len(times)
-    t_min    = args.xmin if args.xmin is not None else min(times)
-    t_max    = args.xmax if args.xmax is not None else max(times)
+    t_min    = args.xmin if args.xmin is not None else times.min()
+    t_max    = args.xmax if args.xmax is not None else times.max()
 
     # Add a small margin on the right so the last entry is not cut off
     if t_max == t_min:
@@ -69,9 +66,9 @@ def main():
     t_max *= 1.05
 
     print(f"  Events read : {n_events}")
-    print(f"  t min       : {min(times):.6e} s")
-    print(f"  t max       : {max(times):.6e} s")
-    print(f"  t mean      : {sum(times)/n_events:.6e} s")
+    print(f"  t min       : {times.min():.6e} s")
+    print(f"  t max       : {times.max():.6e} s")
+    print(f"  t mean      : {times.mean():.6e} s")
 
     # ── Build histogram ────────────────────────────────────────────────────
     title = args.title if args.title else f"Inter-event timing  ({args.csv_file})"
@@ -80,8 +77,7 @@ def main():
     h.GetXaxis().SetTitle("t  [s]")
     h.GetYaxis().SetTitle("Counts")
 
-    for t in times:
-        h.Fill(t)
+    fill_th1(h, times)
 
     # ── Style ──────────────────────────────────────────────────────────────
     ROOT.gStyle.SetOptStat("nemr")   # show N, mean, RMS in stats box
@@ -0,0 +1,126 @@
+# *****************************************************************************
+#   Description: Definition of :class:`Spectrum`, a binned spectrum with
+#   propagated errors that can be scaled, subtracted and converted to a ROOT
+#   histogram or to ``np.histogram`` output for the NumPy fitting backend.
+#....
+#   Date: 10/2026
+
+import numpy as np
+from dataclasses import dataclass
+
+from .histfill import bin_indices
+
+ADC_FULL_SCALE = 4096 # 12-bit channel readings
+N_CHANNELS = 16
+
+
+@dataclass
+class Spectrum:
+    '''
+    Binned spectrum. ``values`` are counts (or rates once scaled) per bin and
+    ``variance`` their variance, Poisson (``variance == counts``) for raw
+    spectra. Binary operations require identical binning.
+    '''
+    values: np.ndarray
+    variance: np.ndarray
+    edges: np.ndarray
+    name: str | None = None
+
+    @classmethod
+    def from_counts(cls, counts, edges, name=None):
+        counts = np.asarray(counts, dtype=np.float64)
+        return cls(counts, counts.copy(), np.asarray(edges, dtype=np.float64), name)
+
+    @property
+    def errors(self) -> np.ndarray:
+        return np.sqrt(self.variance)
+
+    @property
+    def centres(self) -> np.ndarray:
+        return 0.5 * (self.edges[:-1] + self.edges[1:])
+
+    @property
+    def nbins(self) -> int:
+        return len(self.values)
+
+    def _check_binning(self, other):
+        if not (len(self.edges) == len(other.edges) and np.allclose(self.edges, other.edges)):
+            raise ValueError("Spectra with different binning cannot be combined")
+
+    def scaled(self, factor, name=None):
+        '''Spectrum multiplied by ``factor`` (errors scale accordingly).'''
+        return Spectrum(self.values * factor, self.variance * factor**2, self.edges, name or self.name)
+
+    def __mul__(self, factor):
+        return self.scaled(factor)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, factor):
+        return self.scaled(1 / factor)
+
+    def __add__(self, other):
+        self._check_binning(other)
+        return Spectrum(self.values + other.values, self.variance + other.variance, self.edges, self.name)
+
+    def __sub__(self, other):
+        self._check_binning(other)
+        return Spectrum(self.values - other.values, self.variance + other.variance, self.edges, self.name)
+
+    def to_numpy(self):
+        '''``(values, edges)``, the format of ``np.histogram`` used by ``npfit`` and ``peakfind``.'''
+        return self.values, self.edges
+
+    def to_th1(self, name=None, title=None):
+        '''ROOT ``TH1D`` with the contents and errors of the spectrum.'''
+        import ROOT
+
+        name = name or self.name or "spectrum"
+        hist = ROOT.TH1D(name, title or name, self.nbins, self.edges)
+        hist.Sumw2()
+        hist.SetContent(np.concatenate([[0.], self.values, [0.]]))
+        hist.SetError(np.concatenate([[0.], self.errors, [0.]]))
+        hist.ResetStats()
+        return hist
+
+    def __repr__(self):
+        return f"Spectrum(name={self.name!r}, nbins={self.nbins}, range=({self.edges[0]:g}, {self.edges[-1]:g}))"
+
+
+def default_range(column, n_chs=None):
+    '''Full ADC range of a column: 16 channels for 'Summed', one otherwise.'''
+    full_scale = ADC_FULL_SCALE * (N_CHANNELS if column == 'Summed' else 1)
+    return 0., full_scale / (n_chs if n_chs else 1)
+
+
+def acquisition_spectrum(acquisition, column='s', nbins=4096, hist_range=None, n_chs=None, chunksize=None):
+    '''
+    Spectrum of one column of a :class:`SiphraAcquisition`.
+
+    Parameters
+    ----------
+    column : int or str
+        Any key accepted by ``SiphraAcquisition.column_name`` ('s' for 'Summed', channel number, register name).
+    nbins : int
+    hist_range : tuple, optional
+        Default: full ADC range of the column (see :func:`default_range`), so that spectra of different
+        acquisitions are binned identically.
+    n_chs : int, optional
+        The data are divided by ``n_chs`` (e.g. the number of active channels for 'Summed').
+    chunksize : int, optional
+        If given, the file is streamed in chunks of this many rows instead of loaded at once.
+    '''
+    col_name = acquisition.column_name(column)
+    lo, hi = default_range(col_name, n_chs) if hist_range is None else hist_range
+    edges = np.linspace(lo, hi, nbins + 1)
+
+    counts = np.zeros(nbins + 2, dtype=np.int64)
+    chunks = acquisition.iter_column(col_name, chunksize) if chunksize else [acquisition[col_name]]
+    for data in chunks:
+        data = np.asarray(data, dtype=np.float64)
+        data = data[np.isfinite(data)]
+        if n_chs:
+            data = data / n_chs
+        idx = bin_indices(data, edges) + 1
+        counts += np.bincount(idx, minlength=nbins + 2)
+    return Spectrum.from_counts(counts[1:-1], edges, name=acquisition.name)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# *****************************************************************************
+# Description: Start-up time benchmark. Imports the packages in fresh
+#              interpreters and checks that the imports done by workers and
+#              CLIs (``from processing import SiphraAcquisition``) stay under
+#              the time budget and do not load ROOT or SciPy as a side effect.
+#              One budget applies to the time spent in the project modules
+#              (NumPy and pandas, which SiphraAcquisition needs anyway, are
+#              imported first and timed apart), another to the total.
+# Usage:       python benchmarks/bench_import.py [-n REPEAT] [--budget-ms MS] [--total-budget-ms MS]
+#....
+#   Date: 10/2026
+
+import argparse
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# Statement timed in a fresh interpreter -> whether it is subject to the budget
+# and must not load the modules of FORBIDDEN.
+STATEMENTS = {
+    "import processing": True,
+    "from processing import SiphraAcquisition": True,
+    "from processing import SpectrumCube, RunStatistics": True,
+    "import analysis": False,
+    "import visualization": False,
+}
+PRELOADED = "import numpy, pandas"
+FORBIDDEN = ("ROOT", "scipy")
+
+_PROBE = """
+import sys, time
+t0 = time.perf_counter()
+{preload}
+t1 = time.perf_counter()
+{stmt}
+t2 = time.perf_counter()
+print(t1 - t0, t2 - t1, ','.join(m for m in {forbidden!r} if m in sys.modules) or '-')
+"""
+
+
+def time_statement(stmt):
+    '''(seconds importing NumPy and pandas, seconds running ``stmt``, forbidden modules loaded by ``stmt``).'''
+    probe = _PROBE.format(preload=PRELOADED, stmt=stmt, forbidden=FORBIDDEN)
+    out = subprocess.run([sys.executable, "-c", probe],
+                         cwd=PROJECT_ROOT, capture_output=True, text=True, check=True).stdout.split()
+    return float(out[0]), float(out[1]), [] if out[2] == '-' else out[2].split(',')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark package import times.")
+    parser.add_argument("-n", "--repeat", type=int, default=5,
+                        help="Fresh interpreters per statement. Default: 5.")
+    parser.add_argument("--budget-ms", type=float, default=200.,
+                        help="Maximum median time of the budgeted imports, NumPy and pandas excluded. "
+                             "Default: 200 ms.")
+    parser.add_argument("--total-budget-ms", type=float, default=1000.,
+                        help="Maximum median time of the budgeted imports, NumPy and pandas included. "
+                             "Default: 1000 ms.")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"  {'':<52} {'project':>10} {'numpy+pandas':>14}")
+    for stmt, budgeted in STATEMENTS.items():
+        runs = [time_statement(stmt) for _ in range(args.repeat)]
+        deps_ms = 1e3 * statistics.median(d for d, _, _ in runs)
+        median_ms = 1e3 * statistics.median(t for _, t, _ in runs)
+        loaded = sorted({m for _, _, mods in runs for m in mods})
+        status = ""
+        if "ROOT" in loaded or (budgeted and loaded):
+            status, failed = f"  <-- loads {', '.join(loaded)}", True
+        if budgeted and median_ms > args.budget_ms:
+            status, failed = f"{status}  <-- over budget ({args.budget_ms:.0f} ms)", True
+        if budgeted and median_ms + deps_ms > args.total_budget_ms:
+            status, failed = f"{status}  <-- over total budget ({args.total_budget_ms:.0f} ms)", True
+        print(f"  {stmt:<52} {median_ms:7.1f} ms {deps_ms:11.1f} ms{status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# *****************************************************************************
+# Description: Per-transfer overhead of the D2a SPI path. A D2a object is
+#              built on an anonymous mmap and a loopback SPI device, so only
+#              the Python cost of chip-select toggling and framing is timed.
+#              The cached chip-select path is compared with the generic
+#              read-modify-write of the CTRL register, and the SIPHRA layer
+#              is timed against the simulated board (d2a_backend).
+# Usage:       python benchmarks/bench_spi.py [-n TRANSFERS]
+#....
+#   Date: 10/2026
+
+import argparse
+import mmap
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from siphractrl.d2a_lib import D2a, CTRL_ADDR_0, CTRL_0, ANTICHIP2BIN, UIO_SIZE
+from siphractrl.d2a_backend import SimulatedBackend
+from siphractrl.siphra_controller import SIPHRA
+
+
+class LoopbackBackend:
+    '''Anonymous mmap and an SPI device returning the bytes sent.'''
+    def open_uio(self):
+        return mmap.mmap(-1, UIO_SIZE)
+
+    def open_spi(self):
+        return self
+
+    def xfer2(self, bytelist, speed_hz=0):
+        return list(bytelist)
+
+
+def make_d2a():
+    return D2a(backend=LoopbackBackend())
+
+
+def uncached_xfer(d2a, bytelist, chip):
+    '''SPI transfer with chip select done as a full read-modify-write of CTRL.'''
+    for cs in (ANTICHIP2BIN[chip], None):
+        ctrl = d2a.readStruct(CTRL_ADDR_0, CTRL_0)
+        ctrl['cs'] = 15 if cs is None else cs
+        d2a.writeMMap(CTRL_0.build(ctrl), CTRL_ADDR_0)
+        if cs is not None:
+            readback = d2a.spi.xfer2(bytelist, 100_000)
+    return readback
+
+
+def time_per_call(func, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        func()
+    return (time.perf_counter() - t0) / n
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Python overhead of D2a SPI transfers.")
+    parser.add_argument("-n", "--transfers", type=int, default=20_000,
+                        help="Transfers timed per case. Default: 20000.")
+    args = parser.parse_args()
+
+    d2a = make_d2a()
+    frame = [0x29, 0, 0, 0, 0]
+    cases = {
+        "spiXfer (cached chip select)": lambda: d2a.spiXfer(frame, 'A'),
+        "read-modify-write chip select": lambda: uncached_xfer(d2a, frame, 'A'),
+        "readSIPHRA": lambda: d2a.readSIPHRA(0x14, 'A'),
+        "writeSIPHRA": lambda: d2a.writeSIPHRA(b"\x00\x00\x00\x2a", 0x14, 'A'),
+    }
+    for name, func in cases.items():
+        print(f"  {name:<32} {1e6 * time_per_call(func, args.transfers):8.2f} us/transfer")
+    assert d2a.reg[CTRL_ADDR_0:CTRL_ADDR_0 + 2] == d2a._csBytes[None], "CS left asserted"
+
+    siphra = SIPHRA(backend=SimulatedBackend())
+    n = max(args.transfers // 100, 1)
+    thresholds = iter(range(10**9))
+    cases = {
+        "SIPHRA.write_param (simulated)": lambda: siphra.write_param('qc_threshold', next(thresholds) % 256, ch=3),
+        "SIPHRA.read_param (shadow)": lambda: siphra.read_param('qc_threshold', ch=3),
+        "SIPHRA.read_param (force)": lambda: siphra.read_param('qc_threshold', ch=3, force=True),
+    }
+    for name, func in cases.items():
+        print(f"  {name:<32} {1e6 * time_per_call(func, n):8.2f} us/call")
+
+
+if __name__ == "__main__":
+    main()
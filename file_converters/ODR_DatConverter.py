@@ -32,7 +32,28 @@ def temp(x, a, b):
     return -245 + 2.3519 * res + 0.00103 * (res * res)
 
 
-def process_events(f, crystal_code, subtract_baselines=False, get_external=False):
+def load_gain_calibration(path):
+    '''
+    Loads a per-channel gain calibration saved with
+    ``processing.gaincalibration.GainCalibration.save``.
+    '''
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1])) # Project root, to import ``processing``
+    from processing.gaincalibration import GainCalibrationLoader
+    return GainCalibrationLoader.load(path)
+
+
+def load_temperature_correction(path):
+    '''
+    Loads a temperature-drift correction saved with
+    ``processing.tempdrift.TemperatureCorrection.save``.
+    '''
+    sys.path.insert(0, str(Path(__file__).resolve().parents[1])) # Project root, to import ``processing``
+    from processing.tempdrift import TemperatureCorrectionLoader
+    return TemperatureCorrectionLoader.load(path)
+
+
+def process_events(f, crystal_code, subtract_baselines=False, get_external=False, gain_calibration=None,
+                   temperature_correction=None):
     filepath = Path(f).resolve()
     if not filepath.exists():
         raise FileNotFoundError(f'File {filepath} does not exist')
@@ -79,13 +100,31 @@ def process_events(f, crystal_code, subtract_baselines=False, get_external=False
     det_a_external = np.append(det_a_external, np.zeros((np.shape(det_a_external)[0], 2), dtype=np.uint32), axis=1)
     det_a_internal[:, -2] = np.argmax(det_a_internal[:, 7:-2], axis=1) + 1 # Highest-value channel
 
-    # Calibrate temperature
-    det_a_internal[:, 6] = temp(det_a_internal[:,6], pt100_calib[1, crystal_code], pt100_calib[0, crystal_code])
+    # Calibrate temperature. A float copy is kept for the temperature correction, since the
+    # uint32 column cannot hold negative values and is shifted by the baseline subtraction.
+    temperature = temp(det_a_internal[:, 6].astype(np.float64), pt100_calib[1, crystal_code], pt100_calib[0, crystal_code])
+    det_a_internal[:, 6] = temperature
 
     if subtract_baselines:
         print(f'      {len(det_a_external)} external-trigger events detected')
-        det_a_baselines = np.mean(det_a_external[:, 6:-2], axis=0, dtype=np.float64)
-        det_a_internal[:,6:-2] = np.maximum(det_a_internal[:,6:-2].astype(np.float64) - det_a_baselines, 0).astype(np.uint32)
+        first = 7 if temperature_correction is not None else 6 # Keep the calibrated temperature if it is used
+        det_a_baselines = np.mean(det_a_external[:, first:-2], axis=0, dtype=np.float64)
+        det_a_internal[:,first:-2] = np.maximum(det_a_internal[:,first:-2].astype(np.float64) - det_a_baselines, 0).astype(np.uint32)
+
+    # Gain equalisation of the channels, after baseline subtraction and before summing
+    if gain_calibration is not None:
+        det_a_internal = det_a_internal.astype(np.float64)
+        det_a_internal[:, 7:-2] = gain_calibration.apply(det_a_internal[:, 7:-2])
+
+    # Temperature-drift correction of the channels, using the calibrated temperature of every event
+    if temperature_correction is not None:
+        det_a_internal = det_a_internal.astype(np.float64)
+        det_a_internal[:, 6] = temperature
+        det_a_internal[:, 7:-2] = temperature_correction.apply(det_a_internal[:, 7:-2], temperature)
+
+    # Highest-value channel of the corrected readings
+    if gain_calibration is not None or temperature_correction is not None:
+        det_a_internal[:, -2] = np.argmax(det_a_internal[:, 7:-2], axis=1) + 1
 
     # Summing performed after baseline subtraction
     det_a_internal[:, -1] = summed_channel(det_a_internal[:, 7:-2])
@@ -95,7 +134,17 @@ def process_events(f, crystal_code, subtract_baselines=False, get_external=False
 
     if get_external:
         det_a_external[:, -2] = np.argmax(det_a_external[:, 7:-2], axis=1) + 1 # Highest-value channel
-        det_a_external[:,6] = temp(det_a_external[:,6], pt100_calib[1, crystal_code], pt100_calib[0, crystal_code])
+        temperature = temp(det_a_external[:, 6].astype(np.float64), pt100_calib[1, crystal_code], pt100_calib[0, crystal_code])
+        det_a_external[:, 6] = temperature
+        if gain_calibration is not None:
+            det_a_external = det_a_external.astype(np.float64)
+            det_a_external[:, 7:-2] = gain_calibration.apply(det_a_external[:, 7:-2])
+        if temperature_correction is not None:
+            det_a_external = det_a_external.astype(np.float64)
+            det_a_external[:, 6] = temperature
+            det_a_external[:, 7:-2] = temperature_correction.apply(det_a_external[:, 7:-2], temperature)
+        if gain_calibration is not None or temperature_correction is not None:
+            det_a_external[:, -2] = np.argmax(det_a_external[:, 7:-2], axis=1) + 1
         det_a_external[:, -1] = summed_channel(det_a_external[:, 7:-2])
         dataset_external = dataset_from_arr(det_a_external)
 
@@ -177,6 +226,16 @@ def build_parser():
     parser.add_argument("--bf", "--baseline-file",
                         action="store_true",
                         help="In addition to the events file, output the file containing only readings triggered from external HOLD, i.e. the baseline")
+    parser.add_argument("--gains",
+                        action="store",
+                        help="Path to a per-channel gain calibration (\'.json\') to equalise the channels before summing",
+                        type=Path,
+                        )
+    parser.add_argument("--temp-correction",
+                        action="store",
+                        help="Path to a temperature-drift correction (\'.json\') applied to the channels before summing",
+                        type=Path,
+                        )
     parser.add_argument("--prefix",
                         action="store",
                         help="the prefix to add to all the output file names, even if no explicit output name is specified",
@@ -230,6 +289,9 @@ if __name__ == "__main__":
     if not input_path.exists():
         raise FileNotFoundError(f"Path {input_path} not found!")
 
+    gain_calibration = load_gain_calibration(args.gains) if args.gains else None
+    temperature_correction = load_temperature_correction(args.temp_correction) if args.temp_correction else None
+
     # Handle file-extension and output path options
     output_suffixes = []
     output_path = Path(args.output).resolve() if args.output else input_path.with_suffix('')
@@ -255,7 +317,9 @@ if __name__ == "__main__":
         data, baseline = process_events(input_path,
                               crystal_code=args.cry,
                               subtract_baselines=args.sb,
-                              get_external=args.bf,)
+                              get_external=args.bf,
+                              gain_calibration=gain_calibration,
+                              temperature_correction=temperature_correction,)
         output_path = output_path.parent/(args.prefix+output_path.name) if args.prefix else output_path
         handle_outputs(data, output_suffixes, output_path)
         if args.bf:
@@ -287,7 +351,9 @@ if __name__ == "__main__":
             data, baseline = process_events(file,
                                   crystal_code=args.cry,
                                   subtract_baselines=args.sb,
-                                  get_external=args.bf,)
+                                  get_external=args.bf,
+                                  gain_calibration=gain_calibration,
+                                  temperature_correction=temperature_correction,)
             output_path = file.parent/(args.prefix+file.name) if args.prefix else file
             handle_outputs(data, output_suffixes, output_path)
             if args.bf:
@@ -299,6 +365,10 @@ if __name__ == "__main__":
                     vprint(f"Baseline file could not be generated: {e}")
             vprint('')
         print(f"Done! {qty} files processed.")
+    if gain_calibration is not None:
+        print(f"\nWARNING: Channels have been gain-equalised with {args.gains.name}. Do not apply it again when loading!\n")
+    if temperature_correction is not None:
+        print(f"\nWARNING: Channels have been corrected for temperature drift with {args.temp_correction.name}. Do not apply it again when loading!\n")
     if args.sb:
         print("\nWARNING: Please note that baseline subtraction has been performed in every channel!\n")
     print()
@@ -1,8 +1,50 @@
-from analysis.fit import fit_peak_expbg
-from .siphraacquisition import SiphraAcquisition
-from .matchedsiphraaquisition import MatchedSiphraAcquisition
-from .metadata import Metadata, MetadataLoader
-from .summingsiphras import match_events
+# Names are resolved on first access (PEP 562): ``import processing`` is cheap,
+# and loading e.g. ``SiphraAcquisition`` never pulls in ROOT.
+import importlib
 
-__all__ = ["fit_peak_expbg", "SiphraAcquisition", "Metadata", "MetadataLoader", "match_events", "MatchedSiphraAcquisition"]
+_exports = {
+    "fit_peak_expbg": "analysis.fit",
+    "SiphraAcquisition": ".siphraacquisition",
+    "MatchedSiphraAcquisition": ".matchedsiphraaquisition",
+    "Metadata": ".metadata",
+    "MetadataLoader": ".metadata",
+    "AcquisitionIndex": ".acquisitionindex",
+    "DatTail": ".datstream",
+    "decode_frames": ".datstream",
+    "OnlineCoincidenceMatcher": ".onlinematching",
+    "live_match": ".onlinematching",
+    "LiveSpectrumMonitor": ".livemonitor",
+    "monitor_stream": ".livemonitor",
+    "match_events": ".summingsiphras",
+    "scan_tolerances": ".summingsiphras",
+    "calibrate_acquisitions": ".batchcalibration",
+    "SpectrumCube": ".spectrumcube",
+    "spectrum_cube": ".spectrumcube",
+    "GainCalibration": ".gaincalibration",
+    "GainCalibrationLoader": ".gaincalibration",
+    "fit_channel_gains": ".gaincalibration",
+    "HistogramPyramid": ".histpyramid",
+    "histogram_pyramid": ".histpyramid",
+    "PixelLayout": ".hitmap",
+    "HitMap": ".hitmap",
+    "hit_map": ".hitmap",
+    "TemperatureCorrection": ".tempdrift",
+    "TemperatureCorrectionLoader": ".tempdrift",
+    "fit_temperature_drift": ".tempdrift",
+    "RunStatistics": ".rateanalytics",
+    "run_statistics": ".rateanalytics",
+}
 
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,195 @@
+# *****************************************************************************
+#   Description: Definition of the :class:`AcquisitionIndex`, a memoised and
+#   optionally persisted store of arrays derived from acquisition files.
+#....
+#   Date: 10/2026
+
+import hashlib
+import os
+import tempfile
+import numpy as np
+from collections import OrderedDict
+from typing import TypeVar, Callable
+from pathlib import Path
+
+PathLike = TypeVar("PathLike", str, Path, None)
+
+CACHE_DIR_NAME = ".siphra_cache" # Default cache directory, created next to the acquisition file.
+MEMORY_LIMIT_BYTES = 512 * 2**20 # Size of the in-memory store; least recently used entries are dropped beyond it.
+
+
+def file_identity(filepath: PathLike) -> tuple[str, int, int]:
+    '''
+    Identity of a file on disk: resolved path, size in bytes and modification
+    time in nanoseconds. Any rewrite of the file changes its identity.
+    '''
+    filepath = Path(filepath).resolve()
+    stat = filepath.stat()
+    return str(filepath), stat.st_size, stat.st_mtime_ns
+
+
+def identity_key(*items) -> str:
+    '''
+    Short, stable hash of any combination of file identities and
+    configuration values with a deterministic ``repr``.
+    '''
+    return hashlib.sha1(repr(items).encode()).hexdigest()[:16]
+
+
+class AcquisitionIndex:
+    '''
+    Store of arrays derived from one acquisition file, keyed on the identity of that file.
+
+    Entries are computed on first request, memoised in a store shared by all the indices of the process (up to
+    ``MEMORY_LIMIT_BYTES``, least recently used entries first out) and, if ``persist`` is true, written as ``.npz``
+    files to a cache directory next to the acquisition. If that directory cannot be written (e.g. read-only data),
+    entries are only kept in memory. Since the key includes the size and modification time of the file, entries
+    are invalidated automatically when the file is rewritten.
+
+    An entry is either a :class:`numpy.ndarray` or a ``dict`` of arrays (scalars are stored as 0-d arrays). Entries
+    are returned as read-only arrays, since they are shared by all the callers.
+    '''
+
+    _memory = OrderedDict()
+    _memory_bytes = 0
+
+    def __init__(self, filepath: PathLike, persist: bool = False, cache_dir: PathLike = None):
+        self.filepath = Path(filepath).resolve()
+        self.persist = persist
+        self.cache_dir = Path(cache_dir) if cache_dir else self.filepath.parent / CACHE_DIR_NAME
+
+    @staticmethod
+    def entry_name(prefix: str, **config) -> str:
+        '''
+        Name of an entry that depends on a configuration, e.g.
+        ``entry_name('cube', nbins=4096, split_by='Trigger')``.
+        '''
+        if not config:
+            return prefix
+        return f"{prefix}-{identity_key(sorted(config.items()))}"
+
+    @property
+    def key(self) -> str:
+        return identity_key(file_identity(self.filepath))
+
+    def _entry_path(self, name: str, key: str) -> Path:
+        return self.cache_dir / f"{self.filepath.stem}.{key}" / f"{name}.npz"
+
+    @staticmethod
+    def _save(path: Path, value) -> bool:
+        '''
+        Writes an entry to disk. The file is written under a temporary name and
+        renamed, so that other processes sharing the cache never load a partial
+        entry. Returns False if the cache directory is not writable.
+        '''
+        arrays = value if isinstance(value, dict) else {'__array__': value}
+        tmp = None
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(suffix='.tmp', prefix=f"{path.stem}.", dir=path.parent)
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp, path)
+        except OSError:
+            if tmp is not None:
+                try:
+                    os.unlink(tmp)
+                except OSError:
+                    pass
+            return False
+        return True
+
+    @staticmethod
+    def _read_only(value):
+        if isinstance(value, dict):
+            return {k: AcquisitionIndex._read_only(v) for k, v in value.items()}
+        view = np.asarray(value).view()
+        view.flags.writeable = False
+        return view
+
+    @staticmethod
+    def _nbytes(value) -> int:
+        return sum(v.nbytes for v in value.values()) if isinstance(value, dict) else value.nbytes
+
+    @classmethod
+    def _remember(cls, item: tuple, value):
+        '''Adds an entry to the memory store, dropping the least recently used ones beyond ``MEMORY_LIMIT_BYTES``.'''
+        cls._forget(item)
+        cls._memory[item] = value
+        cls._memory_bytes += cls._nbytes(value)
+        while cls._memory_bytes > MEMORY_LIMIT_BYTES and len(cls._memory) > 1:
+            cls._forget(next(iter(cls._memory)))
+
+    @classmethod
+    def _forget(cls, item: tuple):
+        if item in cls._memory:
+            cls._memory_bytes -= cls._nbytes(cls._memory.pop(item))
+
+    @staticmethod
+    def _load(path: Path):
+        with np.load(path, allow_pickle=False) as data:
+            if data.files == ['__array__']:
+                return data['__array__']
+            return {k: data[k] for k in data.files}
+
+    def __contains__(self, name: str) -> bool:
+        key = self.key
+        return (key, name) in self._memory or self._entry_path(name, key).is_file()
+
+    def get(self, name: str, compute: Callable | None = None, persist: bool | None = None):
+        '''
+        Returns the entry ``name``. If it is neither in memory nor on disk, it is
+        computed by calling ``compute()`` and stored.
+
+        Parameters
+        ----------
+        name : str
+            Name of the entry.
+        compute : callable, optional
+            Function without arguments returning the value of the entry.
+        persist : bool, optional
+            Overrides the ``persist`` setting of the index for this entry.
+        '''
+        key = self.key
+        if (key, name) in self._memory:
+            self._memory.move_to_end((key, name))
+            return self._memory[(key, name)]
+
+        path = self._entry_path(name, key)
+        if path.is_file():
+            value = self._load(path)
+        elif compute is None:
+            raise KeyError(f"Entry {name!r} not found for file {self.filepath.name}")
+        else:
+            value = compute()
+            if self.persist if persist is None else persist:
+                self._save(path, value)
+
+        value = self._read_only(value)
+        self._remember((key, name), value)
+        return value
+
+    def put(self, name: str, value, persist: bool | None = None):
+        '''Stores ``value`` as the entry ``name``, replacing any previous one.'''
+        key = self.key
+        self._remember((key, name), self._read_only(value))
+        if self.persist if persist is None else persist:
+            self._save(self._entry_path(name, key), value)
+
+    def clear(self, persisted: bool = False):
+        '''
+        Drops the in-memory entries of this file. If ``persisted`` is true, the
+        entries stored on disk for the current file identity are removed too.
+        '''
+        key = self.key
+        for k in [k for k in self._memory if k[0] == key]:
+            self._forget(k)
+        if persisted:
+            entry_dir = self._entry_path('', key).parent
+            if entry_dir.is_dir():
+                for f in [*entry_dir.glob('*.npz'), *entry_dir.glob('*.tmp')]:
+                    f.unlink()
+                entry_dir.rmdir()
+
+    def __repr__(self):
+        return f"AcquisitionIndex(File: \'{self.filepath.name}\', persist={self.persist})"
@@ -0,0 +1,147 @@
+# *****************************************************************************
+#   Description: Energy calibration of many acquisitions in parallel. Spectra
+#   are built and fitted on a process pool with the NumPy fitting backend
+#   (no ROOT), and the results are cached per file and fit configuration.
+#....
+#   Date: 10/2026
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+
+from .acquisitionindex import AcquisitionIndex
+
+RESULT_COLUMNS = ['centroid', 'centroid_err', 'sigma', 'sigma_err', 'chi2', 'ndf']
+
+
+def _spectrum(acquisition, nbins, hist_range, per_channel):
+    '''Spectrum of the 'Summed' register, divided by the number of active
+    channels as in ``calibrated_acquisition`` if ``per_channel``.'''
+    data = acquisition['s'].astype(np.float64)
+    if per_channel and acquisition.active_chs:
+        data /= len(acquisition.active_chs)
+    return np.histogram(data, bins=nbins, range=hist_range)
+
+
+def _calibrate_one(acquisition, energies, energy_ranges, config):
+    '''Worker: fits the peaks of one acquisition. Returns a dict of arrays.'''
+    from analysis.npfit import fit_peak_expbg_np, fit_gaus_np
+    from analysis.peakfind import peak_ranges
+
+    counts, edges = _spectrum(acquisition, config['nbins'], config['hist_range'], config['per_channel'])
+    peak_finder = dict(config['peak_finder'])
+    if energy_ranges is None:
+        energy_ranges = peak_ranges(counts, edges, len(energies), **peak_finder)
+
+    results = []
+    for xl, xr in energy_ranges:
+        if config['expbg']:
+            fit = fit_peak_expbg_np(counts, edges, xl, xr, peak_finder=peak_finder)
+        else:
+            fit = fit_gaus_np(counts, edges, xl, xr)
+        results.append([fit.mean, fit.error('Mean'), fit.sigma, fit.error('Sigma'), fit.chi2, fit.ndf])
+    results = np.array(results, dtype=np.float64)
+
+    slope, offset = np.polyfit(results[:, 0], energies, 1)
+    return {'fits': results, 'energy_ranges': np.asarray(energy_ranges, dtype=np.float64),
+            'slope': np.float64(slope), 'offset': np.float64(offset)}
+
+
+def calibrate_acquisitions(acquisitions, energies, energy_ranges=None, nbins=4096, hist_range=None,
+                           per_channel=True, expbg=True, peak_finder=None, max_workers=None, use_cache=True):
+    '''
+    Linear energy calibration and energy resolution of many acquisitions.
+
+    For every acquisition, the spectrum of the 'Summed' register is built, each
+    peak is fitted (Gaussian plus exponential background, or plain Gaussian) and
+    a straight line between the fitted centroids and the known ``energies`` is
+    obtained, as in ``calibration_fit``. Acquisitions are processed on a process
+    pool, and results are cached in the :class:`AcquisitionIndex` of each file,
+    keyed on the file identity and the fit configuration.
+
+    Parameters
+    ----------
+    acquisitions : list of SiphraAcquisition
+    energies : list of float
+        Known energies of the peaks (e.g. in MeV). If ``energy_ranges`` is None
+        they are sorted and assigned to the peaks in increasing order.
+    energy_ranges : list of tuple, optional
+        Fit windows ``(xl, xr)`` in the spectrum units, common to all
+        acquisitions. If None, the most significant peaks of each spectrum are
+        used (see ``analysis.peakfind.peak_ranges``).
+    nbins : int
+        Number of bins of the spectra.
+    hist_range : tuple, optional
+        Range of the spectra. Default: range of the data.
+    per_channel : bool
+        Divide 'Summed' by the number of active channels, as ``calibrated_acquisition`` does.
+    expbg : bool
+        Fit an exponential background under each peak.
+    peak_finder : dict, optional
+        Options passed to ``analysis.peakfind.find_peaks``.
+    max_workers : int, optional
+        Maximum number of worker processes.
+    use_cache : bool
+        Reuse and store results in the acquisition index (persisted next to the files).
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per acquisition and peak with the columns 'name', 'file', 'status',
+        'energy', 'slope', 'offset', 'centroid', 'centroid_err', 'sigma', 'sigma_err',
+        'chi2', 'ndf', 'xl', 'xr' and 'resolution' (FWHM/E). An acquisition whose fit
+        failed gets a single row with ``status='failed'`` and the exception in 'error'
+        (empty for the others).
+    '''
+    energies = np.asarray(sorted(energies) if energy_ranges is None else energies, dtype=np.float64)
+    config = {'energies': tuple(energies.tolist()),
+              'energy_ranges': None if energy_ranges is None else tuple(map(tuple, energy_ranges)),
+              'nbins': nbins,
+              'hist_range': None if hist_range is None else tuple(hist_range),
+              'per_channel': per_channel,
+              'expbg': expbg,
+              'peak_finder': tuple(sorted((peak_finder or {}).items()))}
+    # The spectrum also depends on the corrections attached to each acquisition and on its active channels.
+    entries = [AcquisitionIndex.entry_name('calibration', **config, active_chs=tuple(acq.active_chs),
+                                           corrections=getattr(acq, 'corrections_key', None))
+               for acq in acquisitions]
+
+    indices = [AcquisitionIndex(acq.filepath, persist=True) for acq in acquisitions]
+    results = [index.get(entry) if use_cache and entry in index else None for index, entry in zip(indices, entries)]
+
+    pending = [i for i, r in enumerate(results) if r is None]
+    if pending:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            futures = {i: pool.submit(_calibrate_one, acquisitions[i], energies, energy_ranges, config)
+                       for i in pending}
+            for i, future in futures.items():
+                try:
+                    results[i] = future.result()
+                except Exception as e: # One failed run (e.g. no peak found) does not stop the batch
+                    results[i] = e
+                    continue
+                if use_cache:
+                    indices[i].put(entries[i], results[i])
+
+    from analysis.npfit import FWHM_FACTOR
+    rows = []
+    for acq, result in zip(acquisitions, results):
+        name = acq.name if acq.name else acq.filepath.stem
+        if isinstance(result, Exception):
+            rows.append({'name': name, 'file': str(acq.filepath), 'status': 'failed', 'error': repr(result)})
+            continue
+        slope, offset = float(result['slope']), float(result['offset'])
+        for energy, fit, (xl, xr) in zip(energies, result['fits'], result['energy_ranges']):
+            row = {'name': name,
+                   'file': str(acq.filepath),
+                   'status': 'ok',
+                   'energy': energy,
+                   'slope': slope,
+                   'offset': offset,
+                   **dict(zip(RESULT_COLUMNS, fit)),
+                   'xl': xl,
+                   'xr': xr}
+            row['resolution'] = FWHM_FACTOR * slope * row['sigma'] / energy
+            rows.append(row)
+    columns = ['name', 'file', 'status', 'energy', 'slope', 'offset', *RESULT_COLUMNS, 'xl', 'xr', 'resolution', 'error']
+    return pd.DataFrame(rows, columns=columns)
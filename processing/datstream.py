@@ -0,0 +1,181 @@
+# *****************************************************************************
+#   Description: Vectorised decoding of the 64-byte D2a frames written by
+#   dma_to_raw_file, and incremental reading of growing '.dat' files.
+#   The frame layout is the one of :class:`D2a.Event` in
+#   file_converters/d2a_decoder.py; decoded rows are identical to
+#   ``D2a.Event(io).ret``.
+#....
+#   Date: 10/2026
+
+import os
+import time
+import numpy as np
+import pandas as pd
+from typing import TypeVar
+from pathlib import Path
+
+PathLike = TypeVar("PathLike", str, Path, None)
+
+MAGIC = b"\xC2\x10\x00\x00"
+FRAME_SIZE = 64 # bytes
+SYNC_SEARCH_LIMIT = 128 # bytes. Same limit used by the converter to find the first frame.
+
+FRAME_DTYPE = np.dtype([('magic', '<u4'),
+                        ('source', 'u1'),
+                        ('pad1', '<u2'),
+                        ('frametype', 'u1'),
+                        ('ts_sub', '<u4'),
+                        ('ts_sec', '<u4'),
+                        ('ts_gps', '<u4'),
+                        ('event_id', '<u4'),
+                        ('ts_offset', '<u2'),
+                        ('values', '<u2', (17,)),
+                        ('coincidence_window', 'u1'),
+                        ('endpad', 'V3')])
+
+# Columns of a decoded row (same order as ``D2a.Event.ret``).
+COLUMNS = ['Detector', 'ID', 'Trigger', 'Time_sub', 'Time_sec', 'Time_gps', 'Temp', *[f'Ch{_}' for _ in range(1, 17)]]
+
+# ADC words are stored bit-reversed (see ``reverse_bits`` in d2a_decoder.py).
+_REVERSED_12BIT = np.array([int(f'{i:012b}'[::-1], 2) for i in range(4096)], dtype=np.uint32)
+_MAGIC_U4 = np.frombuffer(MAGIC, dtype='<u4')[0]
+
+
+def decode_frames(buffer, return_invalid=False):
+    '''
+    Decodes a buffer of consecutive, aligned 64-byte frames into an array of
+    shape ``(n_frames, 23)`` with the columns listed in ``COLUMNS``. Trailing
+    bytes that do not form a complete frame are ignored. Frames with a wrong
+    magic word or end padding are dropped.
+
+    If ``return_invalid`` is true, the number of dropped frames is returned as
+    a second value.
+    '''
+    n_frames = len(buffer) // FRAME_SIZE
+    frames = np.frombuffer(buffer, dtype=FRAME_DTYPE, count=n_frames)
+    valid = (frames['magic'] == _MAGIC_U4) & (frames['endpad'] == np.void(b"\x00\x00\x00"))
+    frames = frames[valid]
+
+    values = frames['values'].astype(np.uint32)
+    decoded = np.empty((len(frames), 23), dtype=np.uint32)
+    decoded[:, 0] = frames['source']
+    decoded[:, 1] = frames['event_id']
+    decoded[:, 2] = 10 * ((values[:, 0] >> 2) & 0b11) + frames['pad1']
+    decoded[:, 3] = frames['ts_sub']
+    decoded[:, 4] = frames['ts_sec']
+    decoded[:, 5] = frames['ts_gps']
+    decoded[:, 6:] = _REVERSED_12BIT[(values >> 4) & 0xFFF]
+
+    if return_invalid:
+        return decoded, int(n_frames - valid.sum())
+    return decoded
+
+
+def select_events(decoded, crystal_code=0, external=False):
+    '''
+    Keeps the readouts of one crystal, as ``process_events`` does: internal
+    HOLD readouts (``Trigger < 25``, actual events) by default, or external
+    HOLD readouts (baselines) if ``external`` is true.
+    '''
+    decoded = decoded[decoded[:, 0] == 5 + crystal_code]
+    return decoded[decoded[:, 2] > 25] if external else decoded[decoded[:, 2] < 25]
+
+
+def frames_to_dataframe(decoded):
+    '''
+    Same layout as the converter output, including ``Argmax`` and ``Summed``.
+    ``Temp`` is left in raw ADC counts.
+    '''
+    df = pd.DataFrame(decoded, columns=COLUMNS, dtype=np.float64)
+    channels = decoded[:, 7:]
+    df['Argmax'] = np.argmax(channels, axis=1) + 1
+    df['Summed'] = np.sum(channels, axis=1, dtype=np.float64)
+    return df
+
+
+def find_sync(filepath: PathLike):
+    '''
+    Byte offset of the first frame in a '.dat' file, or ``None`` if the file
+    is still too short to tell.
+    '''
+    with open(filepath, 'rb') as f:
+        head = f.read(SYNC_SEARCH_LIMIT + len(MAGIC))
+    for offset in range(0, len(head) - len(MAGIC) + 1, 4):
+        if head[offset:offset + len(MAGIC)] == MAGIC:
+            return offset
+    if len(head) > SYNC_SEARCH_LIMIT:
+        raise ValueError(f'File {filepath} is corrupted or format is invalid')
+    return None
+
+
+class DatTail:
+    '''
+    Incremental reader of a '.dat' file that is still being written.
+
+    Every call to :meth:`read_new` decodes only the complete frames appended
+    since the previous call; an incomplete trailing frame is left for the next
+    call. Memory use is bounded by ``max_frames`` per call.
+    '''
+
+    def __init__(self, filepath: PathLike, max_frames: int = 100_000):
+        self.filepath = Path(filepath)
+        self.max_frames = max_frames
+        self.offset = None # Byte offset of the next undecoded frame.
+        self.n_frames = 0
+        self.n_invalid = 0
+
+    def read_new(self):
+        '''Decoded rows (see ``COLUMNS``) of the newly completed frames.'''
+        if self.offset is None:
+            if not self.filepath.is_file():
+                return np.empty((0, 23), dtype=np.uint32)
+            self.offset = find_sync(self.filepath)
+            if self.offset is None:
+                return np.empty((0, 23), dtype=np.uint32)
+
+        available = (os.path.getsize(self.filepath) - self.offset) // FRAME_SIZE
+        n_frames = min(available, self.max_frames)
+        if n_frames <= 0:
+            return np.empty((0, 23), dtype=np.uint32)
+
+        with open(self.filepath, 'rb') as f:
+            f.seek(self.offset)
+            buffer = f.read(n_frames * FRAME_SIZE)
+        n_frames = len(buffer) // FRAME_SIZE
+        self.offset += n_frames * FRAME_SIZE
+        self.n_frames += n_frames
+
+        decoded, n_invalid = decode_frames(buffer, return_invalid=True)
+        self.n_invalid += n_invalid
+        return decoded
+
+    def __repr__(self):
+        return f"DatTail(File: \'{self.filepath.name}\', frames={self.n_frames})"
+
+
+def replay_dat(source: PathLike, destination: PathLike, speed: float = 1.0, block_frames: int = 256):
+    '''
+    Writes the frames of a recorded '.dat' file to ``destination`` at the pace
+    given by their timestamps (``speed`` times real time), emulating a file
+    growing during an acquisition. Blocking; run it in a thread to feed a
+    :class:`DatTail`.
+    '''
+    source = Path(source)
+    offset = find_sync(source)
+    if offset is None:
+        raise ValueError(f'File {source} contains no frame to replay')
+    with open(source, 'rb') as f:
+        f.seek(offset)
+        data = f.read()
+    n_frames = len(data) // FRAME_SIZE
+    frames = np.frombuffer(data, dtype=FRAME_DTYPE, count=n_frames)
+    times = frames['ts_sec'] + frames['ts_sub'] / 100_000
+
+    t0_wall = time.monotonic()
+    with open(destination, 'wb', buffering=0) as out:
+        for start in range(0, n_frames, block_frames):
+            stop = min(start + block_frames, n_frames)
+            delay = (times[stop - 1] - times[0]) / speed - (time.monotonic() - t0_wall)
+            if delay > 0:
+                time.sleep(delay)
+            out.write(data[start * FRAME_SIZE:stop * FRAME_SIZE])
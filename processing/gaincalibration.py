@@ -0,0 +1,241 @@
+# *****************************************************************************
+#   Description: Per-channel gain equalisation. Photopeak positions are fitted
+#   in the spectra of the 16 channels, linear gain and offset coefficients that
+#   map every channel onto a common reference are derived, and the result is
+#   stored as a versioned JSON calibration that the converter and
+#   :class:`SiphraAcquisition` apply before summing the channels.
+#....
+#   Date: 10/2026
+
+import json
+import numpy as np
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TypeVar
+from pathlib import Path
+
+from .acquisitionindex import identity_key
+
+PathLike = TypeVar("PathLike", str, Path, None)
+
+SCHEMA_VERSION = "1.0"
+N_CHANNELS = 16
+CHANNEL_COLUMNS = [f"Ch{_}" for _ in range(1, N_CHANNELS + 1)]
+
+
+@dataclass
+class GainCalibration:
+    '''
+    Linear per-channel correction ``equalised = gain * reading + offset``.
+
+    ``gain`` and ``offset`` have one entry per channel (index ``ch - 1``). Channels that were not fitted have
+    ``gain = 1`` and ``offset = 0`` and are flagged in ``valid``. ``reference`` holds the common positions the
+    photopeaks are mapped onto, and ``peak_positions`` the fitted positions, shape ``(16, n_peaks)``.
+    '''
+    gain: np.ndarray
+    offset: np.ndarray
+    reference: np.ndarray
+    peak_positions: np.ndarray
+    valid: np.ndarray
+    source: str | None = None
+    created: str = field(default_factory=lambda: datetime.now().isoformat(timespec='seconds'))
+    schema_version: str = SCHEMA_VERSION
+
+    @property
+    def key(self) -> str:
+        '''Hash of the coefficients, used to tell cached data of different calibrations apart.'''
+        return identity_key(self.gain.tolist(), self.offset.tolist())
+
+    def apply(self, channels: np.ndarray) -> np.ndarray:
+        '''Equalises an array of readings of shape ``(n_events, 16)``.'''
+        return np.asarray(channels, dtype=np.float64) * self.gain + self.offset
+
+    def apply_channel(self, ch: int, values: np.ndarray) -> np.ndarray:
+        '''Equalises the readings of channel ``ch`` (1 - 16).'''
+        return np.asarray(values, dtype=np.float64) * self.gain[ch - 1] + self.offset[ch - 1]
+
+    def equalised_sum(self, channels: np.ndarray) -> np.ndarray:
+        ''''Summed' register recomputed from the equalised readings of shape ``(n_events, 16)``.'''
+        return self.apply(channels).sum(axis=1)
+
+    @staticmethod
+    def required_columns(col_names: list[str]) -> list[str]:
+        '''Registers that must be read to equalise ``col_names``: all the channels if 'Summed' or 'Argmax' is requested.'''
+        return CHANNEL_COLUMNS if 'Summed' in col_names or 'Argmax' in col_names else []
+
+    def apply_dataframe(self, df):
+        '''
+        Copy of ``df`` with every channel column equalised and, if present,
+        'Summed' and 'Argmax' recomputed from the 16 equalised channels.
+        '''
+        df = df.copy()
+        for ch, col in enumerate(CHANNEL_COLUMNS, start=1):
+            if col in df:
+                df[col] = self.apply_channel(ch, df[col].to_numpy())
+        if 'Summed' in df:
+            df['Summed'] = df[CHANNEL_COLUMNS].to_numpy(dtype=np.float64).sum(axis=1)
+        if 'Argmax' in df:
+            df['Argmax'] = np.argmax(df[CHANNEL_COLUMNS].to_numpy(dtype=np.float64), axis=1) + 1
+        return df
+
+    def save(self, path: PathLike):
+        raw = {
+            "schema_version": self.schema_version,
+            "calibration": {
+                "type": "channel_gain",
+                "gain": self.gain.tolist(),
+                "offset": self.offset.tolist(),
+                "reference": self.reference.tolist(),
+                "valid": self.valid.tolist(),
+            },
+            "fit": {
+                "peak_positions": np.where(np.isfinite(self.peak_positions), self.peak_positions, None).tolist(),
+                "source": self.source,
+                "created": self.created,
+            },
+        }
+        with open(path, "w") as f:
+            json.dump(raw, f, indent=2)
+
+
+class GainCalibrationLoader:
+
+    @staticmethod
+    def load(path: PathLike) -> GainCalibration:
+        with open(path, "r") as f:
+            raw = json.load(f)
+
+        version = raw.get("schema_version", "1.0")
+
+        if version == "1.0":
+            return GainCalibrationLoader._parse_v1(raw)
+        else:
+            raise ValueError(f"Unsupported schema version: {version}")
+
+    @staticmethod
+    def _parse_v1(raw: dict) -> GainCalibration:
+        cal = raw["calibration"]
+        fit = raw.get("fit", {})
+        if cal.get("type", "channel_gain") != "channel_gain":
+            raise ValueError(f"Not a channel gain calibration: {cal['type']}")
+
+        positions = np.array(fit.get("peak_positions", [[]] * N_CHANNELS), dtype=np.float64)
+        return GainCalibration(
+            gain=np.array(cal["gain"], dtype=np.float64),
+            offset=np.array(cal["offset"], dtype=np.float64),
+            reference=np.array(cal.get("reference", []), dtype=np.float64),
+            peak_positions=positions,
+            valid=np.array(cal.get("valid", [True] * N_CHANNELS), dtype=bool),
+            source=fit.get("source"),
+            created=fit.get("created", ""),
+            schema_version="1.0",
+        )
+
+
+def resolve_gain_calibration(calibration) -> GainCalibration | None:
+    '''Accepts a :class:`GainCalibration`, the path to a saved one, or None.'''
+    if calibration is None or isinstance(calibration, GainCalibration):
+        return calibration
+    return GainCalibrationLoader.load(calibration)
+
+
+def _line_through(positions, reference, valid):
+    '''Least-squares line ``reference = gain * position + offset`` for every row of ``positions``.'''
+    n_peaks = positions.shape[1]
+    if n_peaks == 1:
+        gain = reference[0] / positions[:, 0]
+        return np.where(valid, gain, 1.), np.zeros(len(positions))
+    x_mean = positions.mean(axis=1, keepdims=True)
+    y_mean = reference.mean()
+    dx = positions - x_mean
+    gain = (dx * (reference - y_mean)).sum(axis=1) / (dx**2).sum(axis=1)
+    offset = y_mean - gain * x_mean[:, 0]
+    return np.where(valid, gain, 1.), np.where(valid, offset, 0.)
+
+
+def fit_channel_gains(acquisition, n_peaks=1, energy_ranges=None, reference=None, channels=None, nbins=4096,
+                      hist_range=None, expbg=True, peak_finder=None, use_cache=True) -> GainCalibration:
+    '''
+    Fits the photopeak positions in the spectra of each channel and derives the
+    gain and offset that map them onto a common reference.
+
+    The raw channel spectra are taken from the spectrum cube of the acquisition
+    (see ``processing.spectrumcube``), and each peak is fitted in all the
+    channels at once with the NumPy backend.
+
+    Parameters
+    ----------
+    acquisition : SiphraAcquisition
+    n_peaks : int
+        Number of photopeaks per channel. With one peak only the gain is
+        corrected; with more, gain and offset.
+    energy_ranges : array_like, optional
+        Fit windows ``(xl, xr)`` in raw channel units, shape ``(n_peaks, 2)``
+        (common to all channels) or ``(16, n_peaks, 2)``. If None, the
+        ``n_peaks`` most significant peaks of each channel are used.
+    reference : array_like, optional
+        Target position of each peak. Default: median of the fitted positions
+        over the channels, so that the overall scale is preserved.
+    channels : list of int, optional
+        Channels to equalise. Default: ``acquisition.active_chs``, or all.
+    nbins, hist_range :
+        Binning of the channel spectra.
+    expbg : bool
+        Fit an exponential background under each peak.
+    peak_finder : dict, optional
+        Options passed to ``analysis.peakfind.find_peaks``.
+    use_cache : bool
+        Reuse the cached spectrum cube of the acquisition.
+    '''
+    from analysis.npfit import fit_peaks_expbg_batch, fit_gaus_np
+    from analysis.peakfind import peak_ranges
+    from .spectrumcube import spectrum_cube
+
+    channels = np.asarray(channels if channels is not None else (acquisition.active_chs or range(1, N_CHANNELS + 1)))
+    cube = spectrum_cube(acquisition, nbins=nbins, hist_range=hist_range, raw=True, use_cache=use_cache)
+    counts, edges = cube.total()[channels], cube.edges[1]
+
+    windows = np.full((len(channels), n_peaks, 2), np.nan)
+    if energy_ranges is None:
+        for k, spectrum in enumerate(counts):
+            try:
+                windows[k] = peak_ranges(spectrum, edges, n_peaks, **(peak_finder or {}))
+            except RuntimeError:
+                pass
+    else:
+        ranges = np.asarray(energy_ranges, dtype=np.float64)
+        windows[:] = ranges[channels - 1] if ranges.ndim == 3 else ranges
+
+    fitted = np.isfinite(windows).all(axis=(1, 2))
+    positions = np.full((len(channels), n_peaks), np.nan)
+    for j in range(n_peaks):
+        idx = np.flatnonzero(fitted)
+        if not len(idx):
+            break
+        if expbg:
+            params, _, chi2, _ = fit_peaks_expbg_batch(counts[idx], edges, windows[idx, j, 0], windows[idx, j, 1],
+                                                       peak_finder=peak_finder)
+            positions[idx, j] = np.where(np.isfinite(chi2), params[:, 3], np.nan)
+        else:
+            for k in idx:
+                fit = fit_gaus_np(counts[k], edges, *windows[k, j])
+                positions[k, j] = fit.mean if fit.success else np.nan
+        # Diverged fits end up outside their window
+        inside = (positions[:, j] >= windows[:, j, 0]) & (positions[:, j] <= windows[:, j, 1])
+        positions[~inside, j] = np.nan
+        fitted &= inside
+
+    if not fitted.any():
+        raise RuntimeError("No channel could be fitted. Provide the fit windows in energy_ranges.")
+    if reference is None:
+        reference = np.median(positions[fitted], axis=0)
+    reference = np.asarray(reference, dtype=np.float64).reshape(n_peaks)
+
+    gain, offset = np.ones(N_CHANNELS), np.zeros(N_CHANNELS)
+    all_positions = np.full((N_CHANNELS, n_peaks), np.nan)
+    valid = np.zeros(N_CHANNELS, dtype=bool)
+    gain[channels - 1], offset[channels - 1] = _line_through(np.where(fitted[:, None], positions, 1.),
+                                                             reference, fitted)
+    all_positions[channels - 1] = positions
+    valid[channels - 1] = fitted
+    return GainCalibration(gain, offset, reference, all_positions, valid, source=str(acquisition.filepath))
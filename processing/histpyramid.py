@@ -0,0 +1,134 @@
+# *****************************************************************************
+#   Description: Definition of the :class:`HistogramPyramid`, multi-resolution
+#   spectra of all the channels and of 'Summed' of an acquisition. The finest
+#   spectra are built once (see :mod:`processing.spectrumcube`), coarser levels
+#   are obtained by summing pairs of bins, and any range and bin count is then
+#   served from the closest level without touching the data again.
+#....
+#   Date: 10/2026
+
+import numpy as np
+from dataclasses import dataclass
+
+from .acquisitionindex import AcquisitionIndex
+from .spectrumcube import CUBE_COLUMNS, build_spectrum_cube, _corrections_key
+
+MIN_NBINS = 16 # Coarsest level
+
+
+def _pyramid_levels(counts, min_nbins=MIN_NBINS):
+    '''``[counts, counts with pairs of bins summed, ...]`` along the last axis, down to ``min_nbins`` bins.'''
+    levels = [counts]
+    while levels[-1].shape[-1] % 2 == 0 and levels[-1].shape[-1] // 2 >= min_nbins:
+        fine = levels[-1]
+        levels.append(fine.reshape(*fine.shape[:-1], -1, 2).sum(axis=-1))
+    return levels
+
+
+@dataclass
+class HistogramPyramid:
+    '''
+    ``levels[l]`` has shape ``(17, base_nbins / 2**l)``, row 0 being 'Summed'
+    and row ``ch`` channel ``ch`` (as in :class:`SpectrumCube`). Row ``r`` spans
+    ``lo[r]`` to ``hi[r]`` at every level.
+    '''
+    levels: list
+    lo: np.ndarray
+    hi: np.ndarray
+
+    @classmethod
+    def from_counts(cls, counts, lo, hi, min_nbins=MIN_NBINS):
+        return cls(_pyramid_levels(np.asarray(counts), min_nbins), np.asarray(lo), np.asarray(hi))
+
+    @property
+    def base_nbins(self) -> int:
+        return self.levels[0].shape[-1]
+
+    @staticmethod
+    def _row(item) -> int:
+        if any(item == _ for _ in ('s', '+', 'S', 'Summed')):
+            return 0
+        return CUBE_COLUMNS.index(item) if isinstance(item, str) else item
+
+    def edges(self, item, level=0) -> np.ndarray:
+        row = self._row(item)
+        return np.linspace(self.lo[row], self.hi[row], self.levels[level].shape[-1] + 1)
+
+    def level_for(self, item, nbins=None, hist_range=None) -> int:
+        '''
+        Level the requested histogram is built from: the coarsest level whose
+        bins are not wider than the requested ones and whose edges include all
+        the requested edges, or the finest level if there is none.
+        '''
+        row = self._row(item)
+        lo, hi = (self.lo[row], self.hi[row]) if hist_range is None else hist_range
+        edges = np.linspace(lo, hi, (nbins or self.base_nbins) + 1)
+        base_width = (self.hi[row] - self.lo[row]) / self.base_nbins
+        width = (hi - lo) / (nbins or self.base_nbins)
+        level = min(int(np.floor(np.log2(width / base_width) + 1e-9)) if width > base_width else 0,
+                    len(self.levels) - 1)
+        for level in range(level, 0, -1):
+            position = (edges - self.lo[row]) / (base_width * 2**level)
+            if np.allclose(position, np.round(position), rtol=0., atol=1e-6):
+                return level
+        return 0
+
+    def histogram(self, item, nbins=None, hist_range=None):
+        '''
+        ``(counts, edges)`` of one register with ``nbins`` bins over
+        ``hist_range`` (default: the whole range of the pyramid, at the finest
+        level), as returned by ``np.histogram``.
+
+        Counts are summed from the level chosen by :meth:`level_for`. They are
+        exact when the requested edges fall on edges of the finest level (e.g.
+        integer edges for the channels with the default binning); otherwise the
+        counts of a level bin split by a requested edge are shared in proportion
+        to the overlap.
+        '''
+        row = self._row(item)
+        lo, hi = (self.lo[row], self.hi[row]) if hist_range is None else hist_range
+        level = self.level_for(row, nbins, (lo, hi))
+        nbins = nbins or self.base_nbins
+        edges = np.linspace(lo, hi, nbins + 1)
+
+        counts = self.levels[level][row]
+        cumulative = np.concatenate([[0.], np.cumsum(counts, dtype=np.float64)])
+        return np.diff(np.interp(edges, self.edges(row, level), cumulative)), edges
+
+    def __getitem__(self, item):
+        return self.histogram(item)
+
+
+def build_histogram_pyramid(acquisition, base_nbins=4096, hist_range=None, summed_range=None, min_nbins=MIN_NBINS,
+                            chunksize=None, raw=False):
+    '''
+    Builds the :class:`HistogramPyramid` of an acquisition from a single pass
+    over the data. ``base_nbins`` is the binning of the finest level (default:
+    one bin per ADC unit for the channels); the other arguments are those of
+    :func:`processing.spectrumcube.build_spectrum_cube`.
+    '''
+    cube = build_spectrum_cube(acquisition, base_nbins, hist_range, summed_range, None, chunksize, raw)
+    return HistogramPyramid.from_counts(cube.counts, cube.edges[:, 0], cube.edges[:, -1], min_nbins)
+
+
+def histogram_pyramid(acquisition, base_nbins=4096, hist_range=None, summed_range=None, min_nbins=MIN_NBINS,
+                      chunksize=None, raw=False, use_cache=True):
+    '''
+    :func:`build_histogram_pyramid`, with all the levels persisted in the
+    :class:`AcquisitionIndex` of the acquisition file.
+    '''
+    args = (acquisition, base_nbins, hist_range, summed_range, min_nbins, chunksize, raw)
+    if not use_cache:
+        return build_histogram_pyramid(*args)
+
+    def compute():
+        pyramid = build_histogram_pyramid(*args)
+        return {'lo': pyramid.lo, 'hi': pyramid.hi, **{f'level{l}': c for l, c in enumerate(pyramid.levels)}}
+
+    entry = AcquisitionIndex.entry_name('pyramid', base_nbins=base_nbins,
+                                        hist_range=None if hist_range is None else tuple(hist_range),
+                                        summed_range=None if summed_range is None else tuple(summed_range),
+                                        min_nbins=min_nbins, corrections=_corrections_key(acquisition, raw))
+    stored = AcquisitionIndex(acquisition.filepath, persist=True).get(entry, compute)
+    n_levels = sum(key.startswith('level') for key in stored)
+    return HistogramPyramid([stored[f'level{l}'] for l in range(n_levels)], stored['lo'], stored['hi'])
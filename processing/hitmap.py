@@ -0,0 +1,209 @@
+# *****************************************************************************
+#   Description: Pixel hit maps of an acquisition. Channels are mapped to the
+#   pixels of the SiPM array by a :class:`PixelLayout`, and 2D maps (optionally
+#   sliced in time) are built in a single ``np.bincount`` pass and cached.
+#....
+#   Date: 10/2026
+
+import numpy as np
+from dataclasses import dataclass
+
+from .acquisitionindex import AcquisitionIndex, identity_key
+from .summingsiphras import SUBSEC_PER_SEC, _absolute_ticks
+
+N_CHANNELS = 16
+CHANNEL_COLUMNS = [f"Ch{_}" for _ in range(1, N_CHANNELS + 1)]
+
+
+@dataclass(frozen=True)
+class PixelLayout:
+    '''
+    Position of every channel in the pixel array. ``pixels[ch]`` is the flat
+    (row-major) index of the pixel read by channel ``ch``, or -1 if the channel
+    is not connected; ``pixels[0]`` is unused and always -1.
+    '''
+    rows: int
+    cols: int
+    pixels: tuple
+
+    @classmethod
+    def grid(cls, rows=4, cols=4, order=None):
+        '''
+        Layout of a ``rows`` x ``cols`` array. ``order`` lists the channel of
+        every pixel in row-major order (0 for an empty pixel). Default: channel 1
+        at the top left, channel 2 to its right and so on.
+        '''
+        order = range(1, rows * cols + 1) if order is None else order
+        if len(order) != rows * cols:
+            raise ValueError(f"{len(order)} channels given for a {rows}x{cols} layout")
+        pixels = [-1] * (N_CHANNELS + 1)
+        for pixel, ch in enumerate(order):
+            if ch:
+                pixels[ch] = pixel
+        return cls(rows, cols, tuple(pixels))
+
+    @classmethod
+    def from_mapping(cls, mapping, rows=4, cols=4):
+        '''Layout from a ``{channel: (row, col)}`` dictionary.'''
+        pixels = [-1] * (N_CHANNELS + 1)
+        for ch, (row, col) in mapping.items():
+            pixels[ch] = row * cols + col
+        return cls(rows, cols, tuple(pixels))
+
+    @property
+    def n_pixels(self) -> int:
+        return self.rows * self.cols
+
+    @property
+    def key(self) -> str:
+        return identity_key(self.rows, self.cols, self.pixels)
+
+    def channel_map(self) -> np.ndarray:
+        '''Image of shape ``(rows, cols)`` with the channel number of every pixel (0 if empty).'''
+        image = np.zeros(self.n_pixels, dtype=np.int64)
+        for ch, pixel in enumerate(self.pixels):
+            if pixel >= 0:
+                image[pixel] = ch
+        return image.reshape(self.rows, self.cols)
+
+
+DEFAULT_LAYOUT = PixelLayout.grid()
+
+
+@dataclass
+class HitMap:
+    '''
+    ``image`` has shape ``(rows, cols)``, or ``(n_slices, rows, cols)`` when
+    sliced in time, in which case ``slice_edges`` holds the slice limits in
+    seconds since the first event of the acquisition.
+    '''
+    image: np.ndarray
+    slice_edges: np.ndarray
+    layout: PixelLayout
+    mode: str
+    weight: str
+
+    def total(self) -> np.ndarray:
+        '''Map summed over all the time slices.'''
+        return self.image if self.image.ndim == 2 else self.image.sum(axis=0)
+
+
+def _chunk_pixels(chunk, layout, mode, weight, threshold):
+    '''Flat pixel index and weight of every hit in ``chunk`` (-1 for hits outside the layout).'''
+    pixel_of = np.asarray(layout.pixels)
+    if mode == 'argmax':
+        pixels = pixel_of[chunk['Argmax'].to_numpy().astype(np.int64)]
+        weights = None if weight == 'counts' else chunk['Summed'].to_numpy(dtype=np.float64)
+        return pixels, weights, np.arange(len(chunk))
+
+    readings = chunk[CHANNEL_COLUMNS].to_numpy(dtype=np.float64)
+    hit = readings > threshold
+    event, ch = np.nonzero(hit)
+    weights = None if weight == 'counts' else readings[event, ch]
+    return pixel_of[ch + 1], weights, event
+
+
+def build_hit_map(acquisition, layout=None, mode='argmax', weight='counts', energy_window=None, time_window=None,
+                  time_slice=None, threshold=0., chunksize=None):
+    '''
+    Builds the :class:`HitMap` of an acquisition in a single pass.
+
+    Parameters
+    ----------
+    acquisition : SiphraAcquisition
+    layout : PixelLayout, optional
+        Channel-to-pixel mapping. Default: 4x4 grid, channels in row-major order.
+    mode : str
+        'argmax': every event hits the pixel of its highest-value channel
+        ('Argmax' register). 'channels': every channel reading above
+        ``threshold`` is a hit in its pixel.
+    weight : str
+        'counts': every hit counts one. 'energy': hits are weighted by 'Summed'
+        ('argmax' mode) or by the channel reading ('channels' mode).
+    energy_window : tuple, optional
+        Only events with ``energy_window[0] <= Summed < energy_window[1]``.
+    time_window : tuple, optional
+        Only events within these limits, in seconds since the first event.
+    time_slice : float, optional
+        Width, in seconds, of the time slices. If given, one map per slice is built.
+    threshold : float
+        Minimum channel reading of a hit in 'channels' mode.
+    chunksize : int, optional
+        Stream the file in chunks of this many events.
+    '''
+    if mode not in ('argmax', 'channels'):
+        raise ValueError(f"Unknown mode {mode!r}. Use 'argmax' or 'channels'")
+    if weight not in ('counts', 'energy'):
+        raise ValueError(f"Unknown weight {weight!r}. Use 'counts' or 'energy'")
+    layout = layout or DEFAULT_LAYOUT
+
+    columns = ['Argmax'] if mode == 'argmax' else list(CHANNEL_COLUMNS)
+    if energy_window is not None or (mode == 'argmax' and weight == 'energy'):
+        columns.append('Summed')
+    timed = time_window is not None or time_slice is not None
+    if timed:
+        columns += ['Time_sec', 'Time_sub']
+
+    n_pix = layout.n_pixels
+    image = np.zeros(0)
+    t0 = None
+    for chunk in acquisition.iter_columns(columns, chunksize):
+        if not len(chunk):
+            continue
+        keep = np.ones(len(chunk), dtype=bool)
+        if energy_window is not None:
+            summed = chunk['Summed'].to_numpy()
+            keep &= (summed >= energy_window[0]) & (summed < energy_window[1])
+        if timed:
+            ticks = _absolute_ticks(chunk)
+            t0 = ticks.min() if t0 is None else t0 # From the first non-empty chunk
+            t = (ticks - t0) / SUBSEC_PER_SEC
+            if time_window is not None:
+                keep &= (t >= time_window[0]) & (t < time_window[1])
+        chunk = chunk[keep]
+
+        pixels, weights, event = _chunk_pixels(chunk, layout, mode, weight, threshold)
+        if time_slice is not None:
+            start = 0. if time_window is None else time_window[0]
+            slices = np.floor((t[keep][event] - start) / time_slice).astype(np.int64)
+            pixels = np.where(pixels >= 0, slices * n_pix + pixels, -1)
+        valid = pixels >= 0
+        counts = np.bincount(pixels[valid], None if weights is None else weights[valid]).astype(np.float64)
+        if len(counts) > len(image):
+            counts[:len(image)] += image
+            image = counts
+        else:
+            image[:len(counts)] += counts
+
+    if time_slice is None:
+        image = np.pad(image, (0, n_pix - len(image))).reshape(layout.rows, layout.cols)
+        return HitMap(image, np.array([]), layout, mode, weight)
+
+    n_slices = max(-(-len(image) // n_pix), 1)
+    image = np.pad(image, (0, n_slices * n_pix - len(image))).reshape(n_slices, layout.rows, layout.cols)
+    start = 0. if time_window is None else time_window[0]
+    return HitMap(image, start + time_slice * np.arange(n_slices + 1), layout, mode, weight)
+
+
+def hit_map(acquisition, layout=None, mode='argmax', weight='counts', energy_window=None, time_window=None,
+            time_slice=None, threshold=0., chunksize=None, use_cache=True):
+    '''
+    :func:`build_hit_map`, persisted in the :class:`AcquisitionIndex` of the
+    acquisition file, so that maps of many runs are only built once per
+    configuration.
+    '''
+    args = (acquisition, layout, mode, weight, energy_window, time_window, time_slice, threshold, chunksize)
+    if not use_cache:
+        return build_hit_map(*args)
+
+    def compute():
+        result = build_hit_map(*args)
+        return {'image': result.image, 'slice_edges': result.slice_edges}
+
+    entry = AcquisitionIndex.entry_name('hitmap', layout=(layout or DEFAULT_LAYOUT).key, mode=mode, weight=weight,
+                                        energy_window=None if energy_window is None else tuple(energy_window),
+                                        time_window=None if time_window is None else tuple(time_window),
+                                        time_slice=time_slice, threshold=threshold,
+                                        corrections=getattr(acquisition, 'corrections_key', None))
+    stored = AcquisitionIndex(acquisition.filepath, persist=True).get(entry, compute)
+    return HitMap(stored['image'], stored['slice_edges'], layout or DEFAULT_LAYOUT, mode, weight)
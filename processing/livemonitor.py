@@ -0,0 +1,223 @@
+# *****************************************************************************
+#   Description: Live monitor of an acquisition. Tails the growing '.dat' file
+#   written by dma_to_raw_file, decodes only the newly appended frames and
+#   updates running channel and 'Summed' spectra and rate counters, refreshing
+#   a text summary or a plot at a fixed cadence. Memory use does not grow with
+#   the length of the run.
+#   Usage: python -m processing.livemonitor FILE.dat [options]
+#....
+#   Date: 10/2026
+
+import argparse
+import tempfile
+import threading
+import time
+import numpy as np
+from pathlib import Path
+
+from .datstream import DatTail, select_events, replay_dat
+from .rateanalytics import id_gaps
+from .spectrumcube import CUBE_COLUMNS, CHANNEL_RANGE, SUMMED_RANGE, SpectrumCube, _bin_chunk
+
+
+class LiveSpectrumMonitor:
+    '''
+    Running spectra and rates of one crystal, updated block by block.
+
+    :meth:`push` takes blocks of decoded frames (rows as produced by
+    ``datstream.decode_frames``). ``counts`` has the layout of a
+    :class:`SpectrumCube` (row 0 'Summed', row ``ch`` channel ``ch``). Event
+    rates are kept in a ring of ``rate_window`` one-second counters indexed by
+    the event timestamps, so only the last ``rate_window`` seconds are held.
+    '''
+
+    def __init__(self, nbins=1024, hist_range=None, summed_range=None, crystal=0, rate_window=60):
+        ranges = [summed_range or SUMMED_RANGE] + [hist_range or CHANNEL_RANGE] * 16
+        lo = np.array([r[0] for r in ranges], dtype=np.float64)
+        hi = np.array([r[1] for r in ranges], dtype=np.float64)
+        self.nbins = nbins
+        self.edges = lo[:, None] + (hi - lo)[:, None] * np.linspace(0., 1., nbins + 1)
+        self.crystal = crystal
+        self.counts = np.zeros((len(CUBE_COLUMNS), nbins), dtype=np.int64)
+
+        self.rate_window = rate_window
+        self._ring = np.zeros(rate_window, dtype=np.int64) # Events per second, slot ``sec % rate_window``
+        self._last_sec = None
+        self._last_id = None
+
+        self.n_frames = 0
+        self.n_events = 0
+        self.n_baselines = 0
+        self.missing_ids = 0
+        self.first_sec = None
+
+    def push(self, rows):
+        '''Adds a block of decoded frames (all detectors and trigger types).'''
+        if not len(rows):
+            return
+        self.n_frames += len(rows)
+        # The ID counter runs over all the frames (every crystal, baselines included)
+        self.missing_ids += int(id_gaps(rows[:, 1], self._last_id).sum())
+        self._last_id = int(rows[-1, 1])
+
+        self.n_baselines += len(select_events(rows, self.crystal, external=True))
+        events = select_events(rows, self.crystal)
+        if not len(events):
+            return
+        self.n_events += len(events)
+
+        channels = events[:, 7:].astype(np.float64)
+        values = np.column_stack([channels.sum(axis=1), channels])
+        flat = _bin_chunk(values, self.edges)
+        self.counts += np.bincount(flat[flat >= 0], minlength=self.counts.size).reshape(self.counts.shape)
+
+        self._count_seconds(events[:, 4].astype(np.int64))
+
+    def _count_seconds(self, secs):
+        new_last = int(secs.max())
+        self.first_sec = int(secs.min()) if self.first_sec is None else min(self.first_sec, int(secs.min()))
+        if self._last_sec is None:
+            self._last_sec = new_last
+        elif new_last > self._last_sec:
+            # Clear the slots of the seconds entering the window.
+            for sec in range(self._last_sec + 1, min(new_last, self._last_sec + self.rate_window) + 1):
+                self._ring[sec % self.rate_window] = 0
+            self._last_sec = new_last
+        recent = secs[secs > self._last_sec - self.rate_window]
+        self._ring += np.bincount(recent % self.rate_window, minlength=self.rate_window)
+
+    def rate(self, seconds=None):
+        '''
+        Mean event rate, in Hz, over the last ``seconds`` complete seconds
+        (default: the whole window). The current second, still being filled, is left out.
+        '''
+        if self._last_sec is None:
+            return np.nan
+        seconds = min(seconds or self.rate_window - 1, self.rate_window - 1,
+                      self._last_sec - self.first_sec)
+        if seconds <= 0:
+            return np.nan
+        secs = np.arange(self._last_sec - seconds, self._last_sec)
+        return self._ring[secs % self.rate_window].sum() / seconds
+
+    def spectrum(self, item):
+        '''``(counts, edges)`` of a channel or 's' for 'Summed', as in :class:`SpectrumCube`.'''
+        return self.snapshot().spectrum(item)
+
+    def snapshot(self):
+        '''Copy of the running spectra as a :class:`SpectrumCube`.'''
+        return SpectrumCube(self.counts.copy(), self.edges, np.array([]))
+
+    def summary(self):
+        busiest = int(np.argmax(self.counts[1:].sum(axis=1))) + 1
+        return (f"frames: {self.n_frames:>10,} | events: {self.n_events:>9,} | "
+                f"rate: {self.rate(1):8.1f} Hz (last s), {self.rate():8.1f} Hz (mean) | "
+                f"baselines: {self.n_baselines:>7,} | missing IDs: {self.missing_ids:>7,} | "
+                f"busiest: Ch{busiest}")
+
+
+def monitor_stream(source, monitor, refresh=1.0, poll_interval=0.1, idle_timeout=10.0):
+    '''
+    Feeds ``monitor`` from ``source`` (any object with a ``read_new()`` method,
+    e.g. a :class:`DatTail`) and yields it every ``refresh`` seconds of wall
+    clock time, whatever the data rate. Stops, after a last yield, when the
+    source delivers nothing for ``idle_timeout`` seconds.
+    '''
+    last_data = next_refresh = time.monotonic()
+    next_refresh += refresh
+    while True:
+        rows = source.read_new()
+        now = time.monotonic()
+        if len(rows):
+            monitor.push(rows)
+            last_data = now
+        elif now - last_data > idle_timeout:
+            yield monitor
+            return
+        if now >= next_refresh:
+            yield monitor
+            next_refresh += refresh * max(1, np.ceil((now - next_refresh) / refresh))
+        if not len(rows):
+            time.sleep(poll_interval)
+
+
+class MonitorPlot:
+    '''
+    Matplotlib figure with the running 'Summed' and channel spectra, redrawn in
+    place. With ``output``, every update is also saved to that file (headless use).
+    '''
+
+    def __init__(self, monitor, channels=None, output=None, log=True):
+        import matplotlib
+        if output is not None:
+            matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+
+        self.plt = plt
+        self.output = output
+        self.channels = list(channels or range(1, 17))
+        if output is None:
+            plt.ion()
+        self.fig, (self.ax_s, self.ax_c) = plt.subplots(1, 2, figsize=(12, 4.5))
+        counts, edges = monitor.spectrum('s')
+        self.summed = self.ax_s.stairs(counts, edges)
+        self.lines = {ch: self.ax_c.stairs(*monitor.spectrum(ch), label=f'Ch{ch}') for ch in self.channels}
+        for ax, label in ((self.ax_s, 'Summed [ADC]'), (self.ax_c, 'Channel [ADC]')):
+            ax.set(xlabel=label, ylabel='Counts', yscale='log' if log else 'linear')
+        self.ax_c.legend(ncol=2, fontsize='x-small')
+
+    def update(self, monitor):
+        self.summed.set_data(monitor.counts[0])
+        for ch, line in self.lines.items():
+            line.set_data(monitor.counts[ch])
+        for ax in (self.ax_s, self.ax_c):
+            ax.relim()
+            ax.autoscale_view()
+        self.fig.suptitle(f"{monitor.n_events:,} events | {monitor.rate():.1f} Hz")
+        if self.output is not None:
+            self.fig.savefig(self.output)
+        else:
+            self.fig.canvas.draw_idle()
+            self.plt.pause(0.001)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='livemonitor',
+        description='Show running spectra and rates of an acquisition while its \'.dat\' file is being written',
+    )
+    parser.add_argument("file", type=Path, help="Growing \'.dat\' file")
+    parser.add_argument("--cry", type=int, default=0, help="Crystal code. Default: 0")
+    parser.add_argument("--nbins", type=int, default=1024, help="Bins of every spectrum. Default: 1024")
+    parser.add_argument("--refresh", type=float, default=1.0, help="Seconds between updates. Default: 1")
+    parser.add_argument("--rate-window", type=int, default=60,
+                        help="Seconds of data used for the mean rate. Default: 60")
+    parser.add_argument("--idle-timeout", type=float, default=10.0,
+                        help="Stop when no data arrives during this many seconds. Default: 10")
+    parser.add_argument("--plot", action="store_true", help="Show the spectra in a window")
+    parser.add_argument("--snapshot", type=Path, default=None,
+                        help="Save the spectra to this image file at every update (no window needed)")
+    parser.add_argument("--replay", action="store_true",
+                        help="Treat the input as a recorded file and replay it at real-time speed")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor. Default: 1")
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+
+    dat_file = args.file
+    if args.replay:
+        dat_file = Path(tempfile.mkdtemp(prefix='siphra_replay_')) / args.file.name
+        threading.Thread(target=replay_dat, args=(args.file, dat_file, args.speed), daemon=True).start()
+
+    monitor = LiveSpectrumMonitor(nbins=args.nbins, crystal=args.cry, rate_window=args.rate_window)
+    plot = MonitorPlot(monitor, output=args.snapshot) if args.plot or args.snapshot else None
+    tail = DatTail(dat_file)
+    t_start = time.monotonic()
+    for monitor in monitor_stream(tail, monitor, args.refresh, idle_timeout=args.idle_timeout):
+        print(f"[{time.monotonic() - t_start:7.1f} s] {monitor.summary()}")
+        if plot is not None:
+            plot.update(monitor)
+
+    print(f"\nDone. {monitor.summary()} | invalid frames: {tail.n_invalid:,}")
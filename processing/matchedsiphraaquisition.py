@@ -4,6 +4,8 @@ from typing import TypeVar
 from pathlib import Path
 
 from .metadata import MetadataLoader
+from .acquisitionindex import AcquisitionIndex
+from .summingsiphras import SUBSEC_PER_SEC
 
 PathLike = TypeVar("PathLike", str, Path, None)
 
@@ -31,6 +33,8 @@ class MatchedSiphraAcquisition:
     - dictionary-like indexing
     - retrieval of detector A/B channels
     - retrieval of matched timing information
+    - lazily computed, memoised derived columns (see ``derived_columns``),
+      optionally persisted next to the file when ``persist_derived`` is true
     """
 
     ch_strs_A = [f"A_Ch{_}" for _ in range(17)]
@@ -42,10 +46,13 @@ class MatchedSiphraAcquisition:
                  exposure_sec: float = 1,
                  sipm_chs: str | None = None,
                  n_events: int = 100_000,
-                 name: str | None = None):
+                 name: str | None = None,
+                 persist_derived: bool = False):
 
         self.filepath = self._resolve_path(filepath)
 
+        self.index = AcquisitionIndex(self.filepath, persist=persist_derived)
+
         self.metadataFile = self._resolve_metadata_file(self.filepath)
 
         if self.metadataFile and self.metadataFile.is_file():
@@ -152,6 +159,115 @@ class MatchedSiphraAcquisition:
                 f"{self.filepath.name}: {e}"
             )
 
+    def _read_columns(self, col_names: list[str]) -> dict:
+
+        try:
+
+            if self.filepath.suffix == '.csv':
+
+                df = pd.read_csv(
+                    self.filepath,
+                    usecols=col_names
+                )
+
+            elif self.filepath.suffix == '.pkl':
+
+                df = pd.read_pickle(self.filepath)[col_names]
+
+            return {col: df[col].to_numpy() for col in col_names}
+
+        except Exception as e:
+
+            raise ValueError(
+                f"Cannot retrieve data from fields "
+                f"{col_names} in file "
+                f"{self.filepath.name}: {e}"
+            )
+
+    # ==========================================================
+    # DERIVED COLUMNS
+    # ==========================================================
+
+    def _compute_times(self, detector):
+
+        cols = self._read_columns(
+            [f"{detector}_Time_sec", f"{detector}_Time_sub"]
+        )
+
+        return (
+            cols[f"{detector}_Time_sec"]
+            + cols[f"{detector}_Time_sub"] / SUBSEC_PER_SEC
+        )
+
+    def _compute_argmax(self, detector):
+
+        ch_strs = (
+            self.ch_strs_A
+            if detector == 'A'
+            else self.ch_strs_B
+        )
+
+        cols = self._read_columns(ch_strs[1:])
+
+        return np.argmax(
+            np.column_stack([cols[c] for c in ch_strs[1:]]),
+            axis=1
+        ) + 1
+
+    def _compute_summed_energy(self):
+
+        cols = self._read_columns(['A_Summed', 'B_Summed'])
+
+        return cols['A_Summed'] + cols['B_Summed']
+
+    # Name -> function computing the column from the file or other
+    # derived columns.
+    derived_columns = {
+        'A_time': lambda self: self._compute_times('A'),
+        'B_time': lambda self: self._compute_times('B'),
+        'time_difference': lambda self: (
+            self.derived('A_time') - self.derived('B_time')
+        ),
+        'subsec_difference': lambda self: (
+            self._read_column('subsec_difference')
+        ),
+        'summed_energy': lambda self: self._compute_summed_energy(),
+        'A_argmax': lambda self: self._compute_argmax('A'),
+        'B_argmax': lambda self: self._compute_argmax('B'),
+    }
+
+    def derived(self, name):
+        """
+        Returns the derived column ``name``. It is computed on first use
+        and memoised in ``self.index``, keyed on the identity of the file,
+        so later calls (from this or any other instance pointing to the
+        same unchanged file) do not read the file again. The array returned
+        is a writable copy of the memoised one.
+
+        Available columns:
+
+            A_time, B_time      absolute event times (s)
+            time_difference     A_time - B_time (s)
+            subsec_difference   stored |A_Time_sub - B_Time_sub|
+            summed_energy       A_Summed + B_Summed
+            A_argmax, B_argmax  highest-value channel (1 - 16)
+        """
+
+        if name not in self.derived_columns:
+            raise ValueError(
+                f"Unknown derived column {name!r}. "
+                f"Available: {list(self.derived_columns)}"
+            )
+
+        return self.index.get(
+            name,
+            lambda: self.derived_columns[name](self)
+        ).copy()
+
+    def clear_derived(self, persisted=False):
+
+        self.index.clear(persisted=persisted)
+
     # ==========================================================
     # ACTIVE CHANNEL DATA
     # ==========================================================
@@ -200,6 +316,13 @@ class MatchedSiphraAcquisition:
         elif items in ('sumB', '+B', 'SB'):
             return self._read_column('B_Summed')
 
+        # ----------------------------------------------
+        # Derived column
+        # ----------------------------------------------
+
+        elif isinstance(items, str) and items in self.derived_columns:
+            return self.derived(items)
+
         # ----------------------------------------------
         # Single column
         # ----------------------------------------------
@@ -261,21 +384,15 @@ class MatchedSiphraAcquisition:
 
     def timing_difference(self):
 
-        return self._read_column("subsec_difference")
+        return self.derived("subsec_difference")
 
     def detector_A_times(self):
 
-        sec = self._read_column("A_Time_sec")
-        sub = self._read_column("A_Time_sub")
-
-        return sec + sub / 100000
+        return self.derived("A_time")
 
     def detector_B_times(self):
 
-        sec = self._read_column("B_Time_sec")
-        sub = self._read_column("B_Time_sub")
-
-        return sec + sub / 100000
+        return self.derived("B_time")
 
     # ==========================================================
     # REPRESENTATION
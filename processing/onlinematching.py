@@ -0,0 +1,259 @@
+# *****************************************************************************
+#   Description: Online coincidence matching of two SIPHRA detectors while the
+#   acquisitions are still running. Complements the offline ``match_events``.
+#   Usage: python -m processing.onlinematching A.dat B.dat [options]
+#....
+#   Date: 10/2026
+
+import argparse
+import tempfile
+import threading
+import time
+import numpy as np
+import pandas as pd
+from collections import namedtuple
+from pathlib import Path
+
+from .datstream import DatTail, COLUMNS, select_events, replay_dat
+from .summingsiphras import SUBSEC_PER_SEC
+
+# Matched events: decoded rows of detectors A and B and their time difference
+# (B - A) in subsecond ticks.
+Coincidences = namedtuple('Coincidences', ['A', 'B', 'dt'])
+
+
+def _ticks(rows):
+    return rows[:, 4].astype(np.int64) * SUBSEC_PER_SEC + rows[:, 3].astype(np.int64)
+
+
+class OnlineCoincidenceMatcher:
+    '''
+    Incremental counterpart of :func:`match_events`.
+
+    Blocks of decoded events (rows as produced by ``datstream.decode_frames``)
+    are pushed per detector into rolling, time-ordered buffers. :meth:`poll`
+    matches every event of detector A whose coincidence window is already
+    covered by the data received from detector B, using the same greedy rule
+    as ``match_events``: each A event takes the closest free B event in the
+    same second within ``tolerance``. Events that can no longer be matched are
+    evicted, so memory stays bounded.
+
+    Latency is bounded by ``max_latency_sec``: if one detector lags behind (or
+    stops), the other one is processed anyway once its data are older than
+    that. ``max_buffer`` caps the number of buffered events per detector; the
+    oldest events are dropped (and counted in ``n_dropped``) beyond it.
+    '''
+
+    def __init__(self, tolerance=999, same_second=True, max_latency_sec=2.0, max_buffer=100_000):
+        self.tolerance = int(tolerance)
+        self.same_second = same_second
+        self.max_latency = int(max_latency_sec * SUBSEC_PER_SEC)
+        self.max_buffer = max_buffer
+
+        self._rows = {d: np.empty((0, 23), dtype=np.uint32) for d in 'AB'}
+        self._ticks = {d: np.empty(0, dtype=np.int64) for d in 'AB'}
+        self._used_B = np.empty(0, dtype=bool)
+        self._watermark = {'A': None, 'B': None}
+
+        self.n_events = {'A': 0, 'B': 0}
+        self.n_unmatched = {'A': 0, 'B': 0}
+        self.n_dropped = {'A': 0, 'B': 0}
+        self.n_matched = 0
+
+    def push(self, detector, rows):
+        '''Adds a block of decoded events of detector ``'A'`` or ``'B'``.'''
+        detector = detector.upper()
+        if len(rows) == 0:
+            return
+        ticks = _ticks(rows)
+        all_ticks = np.concatenate([self._ticks[detector], ticks])
+        order = np.argsort(all_ticks, kind='stable')
+        self._ticks[detector] = all_ticks[order]
+        self._rows[detector] = np.concatenate([self._rows[detector], rows])[order]
+        if detector == 'B':
+            self._used_B = np.concatenate([self._used_B, np.zeros(len(rows), dtype=bool)])[order]
+
+        last = int(ticks.max())
+        prev = self._watermark[detector]
+        self._watermark[detector] = last if prev is None else max(prev, last)
+        self.n_events[detector] += len(rows)
+
+        excess = len(self._ticks[detector]) - self.max_buffer
+        if excess > 0:
+            if detector == 'B':
+                self.n_dropped['B'] += int(np.count_nonzero(~self._used_B[:excess]))
+                self._used_B = self._used_B[excess:]
+            else:
+                self.n_dropped['A'] += excess
+            self._ticks[detector] = self._ticks[detector][excess:]
+            self._rows[detector] = self._rows[detector][excess:]
+
+    def _horizon(self, flush):
+        '''A events strictly before the horizon are ready to be matched.'''
+        marks = [w for w in self._watermark.values() if w is not None]
+        if flush:
+            return np.iinfo(np.int64).max
+        if not marks:
+            return None
+        horizon = max(marks) - self.max_latency
+        if len(marks) == 2:
+            horizon = max(horizon, self._watermark['B'] - self.tolerance)
+        return horizon
+
+    def poll(self, flush=False):
+        '''
+        Matches and evicts all events that are ready. With ``flush`` (end of
+        the acquisition) every buffered event is processed.
+
+        Returns a :class:`Coincidences` tuple with the new matches.
+        '''
+        horizon = self._horizon(flush)
+        empty = Coincidences(np.empty((0, 23), dtype=np.uint32), np.empty((0, 23), dtype=np.uint32),
+                             np.empty(0, dtype=np.int64))
+        if horizon is None:
+            return empty
+
+        ticks_A, ticks_B = self._ticks['A'], self._ticks['B']
+        n_ready = int(np.searchsorted(ticks_A, horizon))
+        lo = np.searchsorted(ticks_B, ticks_A[:n_ready] - self.tolerance, side='left')
+        hi = np.searchsorted(ticks_B, ticks_A[:n_ready] + self.tolerance, side='right')
+
+        idx_A, idx_B = [], []
+        for i in range(n_ready):
+            if lo[i] == hi[i]:
+                continue
+            dist = np.abs(ticks_B[lo[i]:hi[i]] - ticks_A[i])
+            invalid = self._used_B[lo[i]:hi[i]]
+            if self.same_second:
+                invalid = invalid | (ticks_B[lo[i]:hi[i]] // SUBSEC_PER_SEC != ticks_A[i] // SUBSEC_PER_SEC)
+            if invalid.all():
+                continue
+            k = np.argmin(np.where(invalid, np.iinfo(np.int64).max, dist))
+            idx_A.append(i)
+            idx_B.append(lo[i] + k)
+            self._used_B[lo[i] + k] = True
+
+        matches = Coincidences(self._rows['A'][idx_A], self._rows['B'][idx_B],
+                               ticks_B[idx_B] - ticks_A[idx_A]) if idx_A else empty
+        self.n_matched += len(idx_A)
+        self.n_unmatched['A'] += n_ready - len(idx_A)
+
+        # Evict processed A events, used B events and B events too old for any future A event.
+        # Pending A events are later than the horizon; A events still to arrive are later than
+        # the A watermark, unless A lags by more than the maximum latency.
+        self._ticks['A'] = ticks_A[n_ready:]
+        self._rows['A'] = self._rows['A'][n_ready:]
+        if flush:
+            stale = np.ones(len(ticks_B), dtype=bool)
+        else:
+            latest = max(w for w in self._watermark.values() if w is not None)
+            front_A = max(self._watermark['A'] if self._watermark['A'] is not None else -self.max_latency,
+                          latest - self.max_latency)
+            stale = ticks_B < min(horizon, front_A) - self.tolerance
+        self.n_unmatched['B'] += int(np.count_nonzero(stale & ~self._used_B))
+        keep = ~(stale | self._used_B)
+        self._ticks['B'] = ticks_B[keep]
+        self._rows['B'] = self._rows['B'][keep]
+        self._used_B = self._used_B[keep]
+
+        return matches
+
+    def buffered(self):
+        return {d: len(self._ticks[d]) for d in 'AB'}
+
+    def summary(self):
+        return (f"A: {self.n_events['A']:>9,} ev | B: {self.n_events['B']:>9,} ev | "
+                f"matched: {self.n_matched:>9,} | buffered: {self.buffered()} | "
+                f"dropped: {self.n_dropped['A'] + self.n_dropped['B']}")
+
+
+def coincidences_to_dataframe(coincidences: Coincidences):
+    '''Same layout as the output of ``match_events`` (``Temp`` in raw ADC counts).'''
+    data = {}
+    for det, rows in (('A', coincidences.A), ('B', coincidences.B)):
+        for col, values in zip(COLUMNS, rows.T.astype(np.float64)):
+            data[f"{det}_{col}"] = values
+        data[f"{det}_Argmax"] = np.argmax(rows[:, 7:], axis=1) + 1
+        data[f"{det}_Summed"] = np.sum(rows[:, 7:], axis=1, dtype=np.float64)
+    data["subsec_difference"] = np.abs(coincidences.A[:, 3].astype(np.float64) - coincidences.B[:, 3])
+    return pd.DataFrame(data)
+
+
+def live_match(source_A, source_B, matcher=None, crystal_A=0, crystal_B=0,
+               poll_interval=0.2, idle_timeout=5.0):
+    '''
+    Generator of :class:`Coincidences` from two live sources.
+
+    A source is any object with a ``read_new()`` method returning blocks of
+    decoded frames, e.g. a :class:`DatTail` or a decoder pipeline. The
+    generator stops, after flushing the buffers, when neither source delivers
+    data for ``idle_timeout`` seconds.
+    '''
+    matcher = matcher if matcher else OnlineCoincidenceMatcher()
+    last_data = time.monotonic()
+    while True:
+        got_data = False
+        for det, source, crystal in (('A', source_A, crystal_A), ('B', source_B, crystal_B)):
+            rows = source.read_new()
+            if len(rows):
+                got_data = True
+                matcher.push(det, select_events(rows, crystal))
+        if got_data:
+            last_data = time.monotonic()
+        elif time.monotonic() - last_data > idle_timeout:
+            yield matcher.poll(flush=True)
+            return
+        yield matcher.poll()
+        if not got_data:
+            time.sleep(poll_interval)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='onlinematching',
+        description='Match coincident events of two detectors while their \'.dat\' files are being written',
+    )
+    parser.add_argument("file_A", type=Path, help="Growing \'.dat\' file of detector A")
+    parser.add_argument("file_B", type=Path, help="Growing \'.dat\' file of detector B")
+    parser.add_argument("-t", "--tolerance", type=int, default=999,
+                        help="Maximum difference in subseconds to consider as the same event. Default: 999")
+    parser.add_argument("-o", "--output", type=Path, default=None,
+                        help="Append matched events to this \'.csv\' file")
+    parser.add_argument("--cry-a", type=int, default=0, help="Crystal code of detector A. Default: 0")
+    parser.add_argument("--cry-b", type=int, default=0, help="Crystal code of detector B. Default: 0")
+    parser.add_argument("--max-latency", type=float, default=2.0,
+                        help="Maximum time (s) an event waits for the other detector. Default: 2")
+    parser.add_argument("--refresh", type=float, default=1.0,
+                        help="Seconds between status lines. Default: 1")
+    parser.add_argument("--idle-timeout", type=float, default=5.0,
+                        help="Stop when no data arrives during this many seconds. Default: 5")
+    parser.add_argument("--replay", action="store_true",
+                        help="Treat the inputs as recorded files and replay them at real-time speed")
+    parser.add_argument("--speed", type=float, default=1.0, help="Replay speed factor. Default: 1")
+    return parser
+
+
+if __name__ == '__main__':
+    args = build_parser().parse_args()
+
+    file_A, file_B = args.file_A, args.file_B
+    if args.replay:
+        tmp_dir = Path(tempfile.mkdtemp(prefix='siphra_replay_'))
+        file_A, file_B = tmp_dir / args.file_A.name, tmp_dir / ('B_' + args.file_B.name)
+        for src, dst in ((args.file_A, file_A), (args.file_B, file_B)):
+            threading.Thread(target=replay_dat, args=(src, dst, args.speed), daemon=True).start()
+
+    matcher = OnlineCoincidenceMatcher(tolerance=args.tolerance, max_latency_sec=args.max_latency)
+    write_header = not (args.output and args.output.is_file())
+    t_start = last_print = time.monotonic()
+    for matches in live_match(DatTail(file_A), DatTail(file_B), matcher, args.cry_a, args.cry_b,
+                              idle_timeout=args.idle_timeout):
+        if args.output and len(matches.dt):
+            coincidences_to_dataframe(matches).to_csv(args.output, mode='a', header=write_header, index=False)
+            write_header = False
+        now = time.monotonic()
+        if now - last_print >= args.refresh:
+            print(f"[{now - t_start:7.1f} s] {matcher.summary()} | rate: {matcher.n_matched / (now - t_start):.1f} Hz")
+            last_print = now
+
+    print(f"\nDone. {matcher.summary()}")
@@ -0,0 +1,215 @@
+# *****************************************************************************
+#   Description: Event-rate, dead-time and data-loss analytics of an
+#   acquisition from the event timestamps and the event ID counter. Rate time
+#   series, inter-event time distributions, ID gaps (dropped frames), dead time
+#   and live time are obtained in one pass and cached in the acquisition index.
+#....
+#   Date: 10/2026
+
+import numpy as np
+from dataclasses import dataclass
+
+from .acquisitionindex import AcquisitionIndex
+from .summingsiphras import SUBSEC_PER_SEC, _absolute_ticks
+
+ID_MODULUS = 2**32 # 'ID' is the u4 event_id of the D2a frames
+
+SUMMARY_FIELDS = ['n_events', 'elapsed_sec', 'measured_rate', 'true_rate', 'dead_time_sec', 'live_time_sec',
+                  'live_fraction', 'missing_ids', 'unordered']
+
+
+def id_gaps(ids, previous=None):
+    '''
+    Number of event IDs missing before every event (0 for consecutive IDs),
+    taking the wrap-around of the 32-bit counter into account. ``previous`` is
+    the ID preceding ``ids[0]``, if known (e.g. the last ID of the previous chunk).
+
+    Repeated or decreasing IDs count as no gap; only a step of more than half
+    the counter range is taken as a crossing of the wrap-around.
+    '''
+    ids = np.asarray(ids).astype(np.int64)
+    prev = np.concatenate([[ids[0] - 1 if previous is None else previous], ids[:-1]]) if len(ids) else ids
+    delta = ids - prev
+    delta[delta < -ID_MODULUS // 2] += ID_MODULUS
+    delta[delta > ID_MODULUS // 2] -= ID_MODULUS
+    return np.maximum(delta - 1, 0)
+
+
+def rate_timeseries(ticks, interval=1.):
+    '''
+    Counts per ``interval`` seconds. ``ticks`` are event times in subsecond
+    ticks (see ``summingsiphras._absolute_ticks``). Returns ``(edges, counts)``
+    with the edges in seconds since the first event.
+    '''
+    ticks = np.asarray(ticks, dtype=np.int64)
+    t = (ticks - ticks.min()) / SUBSEC_PER_SEC
+    counts = np.bincount(np.floor(t / interval).astype(np.int64))
+    return interval * np.arange(len(counts) + 1), counts
+
+
+def inter_event_times(ticks, max_ticks=10_000):
+    '''
+    Distribution of the time between consecutive events, in ticks of
+    ``1 / SUBSEC_PER_SEC`` seconds: ``counts[k]`` is the number of intervals of
+    ``k`` ticks; longer intervals are added to the last entry.
+    '''
+    dt = np.diff(np.asarray(ticks, dtype=np.int64))
+    return np.bincount(np.minimum(dt[dt >= 0], max_ticks), minlength=max_ticks + 1)
+
+
+@dataclass
+class RunStatistics:
+    '''
+    Timing statistics of one run.
+
+    ``summary`` holds: 'n_events', 'elapsed_sec' (first to last timestamp),
+    'measured_rate', 'true_rate' (from the exponential tail of the inter-event
+    times), 'dead_time_sec' (per event), 'live_time_sec', 'live_fraction',
+    'missing_ids' (frames lost according to the ID counter) and 'unordered'
+    (intervals with a negative time difference).
+    '''
+    summary: dict
+    rate_edges: np.ndarray
+    rate_counts: np.ndarray
+    dt_counts: np.ndarray
+    gap_index: np.ndarray
+    gap_size: np.ndarray
+
+    @property
+    def live_time(self) -> float:
+        '''Live time in seconds, to normalise spectra to the true exposure.'''
+        return self.summary['live_time_sec']
+
+    @property
+    def dt_seconds(self) -> np.ndarray:
+        '''Inter-event time of every entry of ``dt_counts``, in seconds.'''
+        return np.arange(len(self.dt_counts)) / SUBSEC_PER_SEC
+
+
+def _dead_time(n_events, elapsed_ticks, dt_counts, tail_cut):
+    '''
+    Non-paralysable dead-time model. Above the dead time, intervals between
+    events are exponential with the true rate ``r``; ``r`` is the maximum
+    likelihood estimate over the intervals longer than ``tail_cut`` (geometric,
+    since intervals are whole ticks; longer intervals are censored at the last
+    entry of ``dt_counts``), and the dead time per event is ``mean(dt) - 1 / r``.
+    '''
+    dt = np.arange(len(dt_counts))
+    tail = dt_counts[tail_cut:-1]
+    n_overflow = dt_counts[-1]
+    excess = (tail * (dt[tail_cut:-1] - tail_cut)).sum() + n_overflow * (len(dt_counts) - 1 - tail_cut)
+    if n_events < 2 or tail.sum() == 0 or excess == 0 or elapsed_ticks <= 0:
+        return np.nan, np.nan
+    true_rate = SUBSEC_PER_SEC * np.log1p(tail.sum() / excess)
+    mean_dt = elapsed_ticks / dt_counts.sum() / SUBSEC_PER_SEC
+    return float(true_rate), max(float(mean_dt - 1 / true_rate), 0.)
+
+
+def build_run_statistics(acquisition, interval=1., max_dt_sec=0.1, tail_cut_sec=None, chunksize=None):
+    '''
+    Computes the :class:`RunStatistics` of an acquisition in one pass over the
+    'ID', 'Time_sec' and 'Time_sub' registers.
+
+    Parameters
+    ----------
+    acquisition : SiphraAcquisition
+    interval : float
+        Width, in seconds, of the bins of the rate time series.
+    max_dt_sec : float
+        Longest inter-event time histogrammed; longer intervals are counted in the last bin.
+    tail_cut_sec : float, optional
+        Intervals longer than this are used to estimate the true rate. Default:
+        twice the shortest interval observed, so that the dead-time region is excluded.
+    chunksize : int, optional
+        Stream the file in chunks of this many events.
+
+    Notes
+    -----
+    The ID counter runs over all the frames of the readout. In converted files,
+    which only keep the internal-trigger events of one crystal, 'missing_ids'
+    also counts the frames of the other crystals and the baseline readouts.
+    '''
+    max_ticks = int(round(max_dt_sec * SUBSEC_PER_SEC))
+    dt_counts = np.zeros(max_ticks + 1, dtype=np.int64)
+    rate_counts = np.zeros(0, dtype=np.int64)
+    gap_index, gap_size = [], []
+    t0 = last_tick = last_id = None
+    n_events = unordered = 0
+    first_tick, end_tick = None, None
+
+    for chunk in acquisition.iter_columns(['ID', 'Time_sec', 'Time_sub'], chunksize):
+        if not len(chunk):
+            continue
+        ticks = _absolute_ticks(chunk)
+        ids = chunk['ID'].to_numpy()
+
+        gaps = id_gaps(ids, last_id)
+        idx = np.flatnonzero(gaps)
+        gap_index.append(idx + n_events)
+        gap_size.append(gaps[idx])
+
+        dt = np.diff(ticks if last_tick is None else np.concatenate([[last_tick], ticks]))
+        unordered += int((dt < 0).sum())
+        dt_counts += np.bincount(np.minimum(dt[dt >= 0], max_ticks), minlength=max_ticks + 1)
+
+        t0 = ticks.min() if t0 is None else t0
+        bins = np.bincount(np.maximum((ticks - t0) // int(round(interval * SUBSEC_PER_SEC)), 0))
+        if len(bins) > len(rate_counts):
+            bins[:len(rate_counts)] += rate_counts
+            rate_counts = bins
+        else:
+            rate_counts[:len(bins)] += bins
+
+        first_tick = ticks.min() if first_tick is None else min(first_tick, ticks.min())
+        end_tick = ticks.max() if end_tick is None else max(end_tick, ticks.max())
+        last_tick, last_id = ticks[-1], ids[-1]
+        n_events += len(chunk)
+
+    elapsed_ticks = 0 if first_tick is None else int(end_tick - first_tick)
+    if tail_cut_sec is None:
+        nonzero = np.flatnonzero(dt_counts)
+        tail_cut = min(2 * (int(nonzero[0]) if len(nonzero) else 0) + 1, max_ticks // 2)
+    else:
+        tail_cut = int(round(tail_cut_sec * SUBSEC_PER_SEC))
+    true_rate, dead_time = _dead_time(n_events, elapsed_ticks, dt_counts, tail_cut)
+
+    elapsed = elapsed_ticks / SUBSEC_PER_SEC
+    gap_size = np.concatenate(gap_size) if gap_size else np.zeros(0, dtype=np.int64)
+    live_time = elapsed - n_events * dead_time
+    summary = {'n_events': n_events,
+               'elapsed_sec': elapsed,
+               'measured_rate': n_events / elapsed if elapsed > 0 else np.nan,
+               'true_rate': true_rate,
+               'dead_time_sec': dead_time,
+               'live_time_sec': live_time,
+               'live_fraction': live_time / elapsed if elapsed > 0 else np.nan,
+               'missing_ids': int(gap_size.sum()),
+               'unordered': unordered}
+    return RunStatistics(summary,
+                         interval * np.arange(len(rate_counts) + 1),
+                         rate_counts,
+                         dt_counts,
+                         np.concatenate(gap_index) if gap_index else np.zeros(0, dtype=np.int64),
+                         gap_size)
+
+
+def run_statistics(acquisition, interval=1., max_dt_sec=0.1, tail_cut_sec=None, chunksize=None, use_cache=True):
+    '''
+    :func:`build_run_statistics`, persisted in the :class:`AcquisitionIndex` of
+    the acquisition file.
+    '''
+    args = (acquisition, interval, max_dt_sec, tail_cut_sec, chunksize)
+    if not use_cache:
+        return build_run_statistics(*args)
+
+    def compute():
+        stats = build_run_statistics(*args)
+        return {**{k: np.asarray(v) for k, v in stats.summary.items()},
+                'rate_edges': stats.rate_edges, 'rate_counts': stats.rate_counts, 'dt_counts': stats.dt_counts,
+                'gap_index': stats.gap_index, 'gap_size': stats.gap_size}
+
+    entry = AcquisitionIndex.entry_name('rates', interval=interval, max_dt_sec=max_dt_sec, tail_cut_sec=tail_cut_sec)
+    stored = AcquisitionIndex(acquisition.filepath, persist=True).get(entry, compute)
+    summary = {k: stored[k].item() for k in SUMMARY_FIELDS}
+    return RunStatistics(summary, stored['rate_edges'], stored['rate_counts'], stored['dt_counts'],
+                         stored['gap_index'], stored['gap_size'])
@@ -6,9 +6,12 @@
 #   Date: 02/2026
 
 import pandas as pd
+import numpy as np
 from typing import TypeVar
 from pathlib import Path
 from .metadata import Metadata, MetadataLoader
+from .gaincalibration import GainCalibration, resolve_gain_calibration
+from .tempdrift import TemperatureCorrection, resolve_temperature_correction
 
 PathLike = TypeVar("PathLike", str, Path, None)
 
@@ -28,7 +31,9 @@ class SiphraAcquisition:
                  exposure_sec:float = 1,
                  sipm_chs:str | None = None,
                  n_events:int = 100_000,
-                 name: str | None = None,):
+                 name: str | None = None,
+                 gain_calibration: GainCalibration | PathLike = None,
+                 temperature_correction: TemperatureCorrection | PathLike = None,):
 
         self.filepath = self._resolve_path(filepath)
         self.metadataFile = self._resolve_metadata_file(self.filepath)
@@ -46,6 +51,10 @@ class SiphraAcquisition:
         self.sipm_chs = sipm_chs
         self.n_events = n_events
         self.name = name
+        # Corrections applied on the fly to 'Ch1'...'Ch16' and 'Summed': per-channel gain
+        # equalisation first, then temperature-drift correction.
+        self.gain_calibration = resolve_gain_calibration(gain_calibration)
+        self.temperature_correction = resolve_temperature_correction(temperature_correction)
 
     def _resolve_path(self, f):
         try:
@@ -79,7 +88,9 @@ class SiphraAcquisition:
         else:
             raise ValueError("Channels outside the allowed range (1 - 16)")
 
-    def _read_column(self, col_name: str) -> numpy.ndarray:
+    def _read_column(self, col_name: str) -> np.ndarray:
+        if self.corrections and (col_name in ('Summed', 'Argmax') or col_name in self.ch_strs):
+            return next(self.iter_columns([col_name]))[col_name].to_numpy()
         try:
             if self.filepath.suffix == '.csv':
                 return pd.read_csv(self.filepath, usecols=[col_name])[col_name].to_numpy()
@@ -92,6 +103,109 @@ class SiphraAcquisition:
         except Exception as e:
             raise ValueError(f"Cannot retrieve data from field {col_name} in file {self.filepath.name}: {e}")
 
+    def column_name(self, item) -> str:
+        '''
+        Name of the register in the original file for a channel number, a
+        register name or the special key for the summed spectrum (see ``__getitem__``).
+        '''
+        if any(item == _ for _ in ('s', '+', 'S')):
+            return 'Summed'
+        return self.ch_strs[item] if isinstance(item, int) else item
+
+    @property
+    def corrections(self) -> list:
+        '''Corrections applied to the channels and 'Summed', in order.'''
+        return [c for c in (self.gain_calibration, self.temperature_correction) if c is not None]
+
+    @property
+    def corrections_key(self) -> str | None:
+        '''Identifies the corrections applied, to key cached data derived from corrected registers.'''
+        return '-'.join(c.key for c in self.corrections) or None
+
+    def iter_columns(self, items: list, chunksize: int | None = None, raw: bool = False):
+        '''
+        Yields :class:`pandas.DataFrame` chunks of ``chunksize`` events with the
+        registers in ``items`` (channel numbers, register names or special keys), read
+        in a single pass over the file. If ``chunksize`` is None or the file is a
+        ``.pkl``, the whole columns are yielded at once. The corrections (gain
+        calibration, temperature correction), if any, are applied to the channels
+        and 'Summed' unless ``raw`` is true.
+        '''
+        col_names = [self.column_name(item) for item in items]
+        corrections = [] if raw else self.corrections
+        read_names = list(col_names)
+        for correction in corrections:
+            read_names += correction.required_columns(read_names)
+        read_names = list(dict.fromkeys(read_names))
+        try:
+            if self.filepath.suffix == '.csv':
+                if chunksize:
+                    chunks = pd.read_csv(self.filepath, usecols=read_names, chunksize=chunksize)
+                else:
+                    chunks = [pd.read_csv(self.filepath, usecols=read_names)]
+            elif self.filepath.suffix == '.pkl':
+                chunks = [pd.read_pickle(self.filepath)[read_names]]
+        except (ValueError, KeyError) as e:
+            raise ValueError(f"Cannot retrieve data from fields {read_names} in file {self.filepath.name}: {e}")
+
+        for chunk in chunks:
+            for correction in corrections:
+                chunk = correction.apply_dataframe(chunk)
+            yield chunk[col_names]
+
+    def iter_column(self, item, chunksize: int = 1_000_000):
+        '''
+        Yields the data of a single register in chunks of ``chunksize`` events,
+        so that long acquisitions can be processed without loading the whole
+        column. ``.pkl`` files are read at once and yielded as a single chunk.
+        '''
+        col_name = self.column_name(item)
+        for chunk in self.iter_columns([col_name], chunksize):
+            yield chunk[col_name].to_numpy()
+
+    def spectrum_cube(self, nbins: int = 4096, split_by: str | None = None, **kwargs):
+        '''
+        Spectra of the 16 channels and of 'Summed' as a :class:`SpectrumCube`,
+        built in a single pass and cached next to the file. ``kwargs`` are passed
+        to :func:`processing.spectrumcube.spectrum_cube`.
+        '''
+        from .spectrumcube import spectrum_cube
+        return spectrum_cube(self, nbins=nbins, split_by=split_by, **kwargs)
+
+    def histogram_pyramid(self, base_nbins: int = 4096, **kwargs):
+        '''
+        Multi-resolution spectra of the 16 channels and of 'Summed' as a
+        :class:`HistogramPyramid`, built in a single pass and cached next to the
+        file. ``kwargs`` are passed to :func:`processing.histpyramid.histogram_pyramid`.
+        '''
+        from .histpyramid import histogram_pyramid
+        return histogram_pyramid(self, base_nbins=base_nbins, **kwargs)
+
+    def histogram(self, item, nbins: int | None = None, hist_range: tuple | None = None):
+        '''
+        ``(counts, edges)`` of a channel or 'Summed' for any binning, served from
+        the cached histogram pyramid (see :meth:`histogram_pyramid`).
+        '''
+        return self.histogram_pyramid().histogram(item, nbins, hist_range)
+
+    def hit_map(self, layout=None, mode: str = 'argmax', weight: str = 'counts', **kwargs):
+        '''
+        2D pixel hit map as a :class:`HitMap`, built in a single pass and cached
+        next to the file. ``kwargs`` (energy and time windows, time slicing...) are
+        passed to :func:`processing.hitmap.hit_map`.
+        '''
+        from .hitmap import hit_map
+        return hit_map(self, layout=layout, mode=mode, weight=weight, **kwargs)
+
+    def run_statistics(self, interval: float = 1., **kwargs):
+        '''
+        Rate time series, inter-event times, event-ID gaps, dead time and live
+        time of the run as :class:`RunStatistics`, cached next to the file.
+        ``kwargs`` are passed to :func:`processing.rateanalytics.run_statistics`.
+        '''
+        from .rateanalytics import run_statistics
+        return run_statistics(self, interval=interval, **kwargs)
+
     # def _get_ch_data(self, ch: int) -> np.ndarray:
     #     return self._read_column(self.ch_strs[ch])
 
@@ -0,0 +1,156 @@
+# *****************************************************************************
+#   Description: Definition of the :class:`SpectrumCube`, the spectra of the 16
+#   channels and of the 'Summed' register of an acquisition, built in a single
+#   pass over the data and optionally split by trigger type or Argmax.
+#....
+#   Date: 10/2026
+
+import numpy as np
+from dataclasses import dataclass
+
+from analysis.histfill import bin_indices
+
+from .acquisitionindex import AcquisitionIndex
+
+CUBE_COLUMNS = ['Summed'] + [f"Ch{_}" for _ in range(1, 17)] # Row i of the cube is 'Summed' (i = 0) or channel i.
+CHANNEL_RANGE = (0., 4096.) # 12-bit channel readings
+SUMMED_RANGE = (0., 16 * 4096.)
+
+
+@dataclass
+class SpectrumCube:
+    '''
+    Spectra of all the channels of an acquisition.
+
+    ``counts`` has shape ``(17, nbins)``, or ``(n_groups, 17, nbins)`` when split, where row 0 is the 'Summed'
+    register and row ``ch`` is channel ``ch``, matching ``SiphraAcquisition.ch_strs``. ``edges`` has shape
+    ``(17, nbins + 1)`` since 'Summed' is binned over a wider range. ``groups`` holds the values of the split
+    column (e.g. the Argmax channel) for each group, and is empty if the cube is not split.
+    '''
+    counts: np.ndarray
+    edges: np.ndarray
+    groups: np.ndarray
+    split_by: str | None = None
+
+    @property
+    def nbins(self) -> int:
+        return self.counts.shape[-1]
+
+    def _row(self, item) -> int:
+        if any(item == _ for _ in ('s', '+', 'S', 'Summed')):
+            return 0
+        return CUBE_COLUMNS.index(item) if isinstance(item, str) else item
+
+    def spectrum(self, item, group=None):
+        '''
+        ``(counts, edges)`` of one register, as returned by ``np.histogram``.
+
+        ``item`` is a channel number, a register name or 's' for 'Summed'. For a
+        split cube, ``group`` selects the value of the split column (e.g.
+        ``group=5`` with ``split_by='Argmax'``); if None, all groups are summed.
+        '''
+        row = self._row(item)
+        if self.split_by is None:
+            counts = self.counts[row]
+        elif group is None:
+            counts = self.counts[:, row].sum(axis=0)
+        else:
+            idx = np.flatnonzero(self.groups == group)
+            counts = self.counts[idx[0], row] if len(idx) else np.zeros(self.nbins, dtype=self.counts.dtype)
+        return counts, self.edges[row]
+
+    def __getitem__(self, item):
+        return self.spectrum(item)
+
+    def total(self):
+        '''Cube summed over all the groups, with shape ``(17, nbins)``.'''
+        return self.counts if self.split_by is None else self.counts.sum(axis=0)
+
+
+def _bin_chunk(values, edges):
+    '''Flat bin index ``row * nbins + bin`` of every entry of ``values`` (events x 17), -1 if out of range.'''
+    nbins = edges.shape[-1] - 1
+    idx = bin_indices(values, edges)
+    valid = (idx >= 0) & (idx < nbins)
+    flat = np.where(valid, idx, 0) + np.arange(values.shape[1]) * nbins
+    flat[~valid] = -1
+    return flat
+
+
+def build_spectrum_cube(acquisition, nbins=4096, hist_range=None, summed_range=None, split_by=None,
+                        chunksize=None, raw=False):
+    '''
+    Builds the :class:`SpectrumCube` of an acquisition. All the registers are
+    binned at once: each value gets a flat index ``(group * 17 + row) * nbins +
+    bin`` and the whole cube is obtained with a single ``np.bincount`` per chunk.
+
+    Parameters
+    ----------
+    acquisition : SiphraAcquisition
+    nbins : int
+        Number of bins of every spectrum.
+    hist_range : tuple, optional
+        Range of the channel spectra. Default: full 12-bit range.
+    summed_range : tuple, optional
+        Range of the 'Summed' spectrum. Default: 16 times the 12-bit range.
+    split_by : str, optional
+        Register whose values split the spectra in groups, e.g. 'Trigger' or 'Argmax'.
+    chunksize : int, optional
+        Stream the file in chunks of this many events.
+    raw : bool
+        Ignore the corrections (gain calibration, temperature correction) of the acquisition, if any.
+    '''
+    ranges = [summed_range or SUMMED_RANGE] + [hist_range or CHANNEL_RANGE] * 16
+    lo = np.array([r[0] for r in ranges], dtype=np.float64)
+    hi = np.array([r[1] for r in ranges], dtype=np.float64)
+    edges = lo[:, None] + (hi - lo)[:, None] * np.linspace(0., 1., nbins + 1)
+
+    n_rows = len(CUBE_COLUMNS)
+    cube_size = n_rows * nbins
+    columns = CUBE_COLUMNS + ([split_by] if split_by else [])
+    counts = {}
+    for chunk in acquisition.iter_columns(columns, chunksize, raw=raw):
+        values = chunk[CUBE_COLUMNS].to_numpy(dtype=np.float64)
+        flat = _bin_chunk(values, edges)
+        if split_by:
+            groups, inverse = np.unique(chunk[split_by].to_numpy(), return_inverse=True)
+            flat = np.where(flat >= 0, flat + inverse.reshape(-1, 1) * cube_size, -1)
+        else:
+            groups = [None]
+        chunk_counts = np.bincount(flat[flat >= 0], minlength=len(groups) * cube_size)
+        for group, c in zip(groups, chunk_counts.reshape(len(groups), n_rows, nbins)):
+            counts[group] = counts[group] + c if group in counts else c
+
+    if split_by:
+        groups = np.array(sorted(counts))
+        cube = np.stack([counts[g] for g in groups]) if len(groups) else np.zeros((0, n_rows, nbins), np.int64)
+    else:
+        groups = np.array([])
+        cube = counts.get(None, np.zeros((n_rows, nbins), dtype=np.int64))
+    return SpectrumCube(cube, edges, groups, split_by)
+
+
+def _corrections_key(acquisition, raw=False):
+    return None if raw else getattr(acquisition, 'corrections_key', None)
+
+
+def spectrum_cube(acquisition, nbins=4096, hist_range=None, summed_range=None, split_by=None, chunksize=None,
+                  raw=False, use_cache=True):
+    '''
+    :func:`build_spectrum_cube`, persisted in the :class:`AcquisitionIndex` of
+    the acquisition file. After the first build, per-channel spectra of the
+    same binning are read from the cache without touching the data.
+    '''
+    if not use_cache:
+        return build_spectrum_cube(acquisition, nbins, hist_range, summed_range, split_by, chunksize, raw)
+
+    def compute():
+        cube = build_spectrum_cube(acquisition, nbins, hist_range, summed_range, split_by, chunksize, raw)
+        return {'counts': cube.counts, 'edges': cube.edges, 'groups': cube.groups}
+
+    entry = AcquisitionIndex.entry_name('cube', nbins=nbins,
+                                        hist_range=None if hist_range is None else tuple(hist_range),
+                                        summed_range=None if summed_range is None else tuple(summed_range),
+                                        split_by=split_by, corrections=_corrections_key(acquisition, raw))
+    stored = AcquisitionIndex(acquisition.filepath, persist=True).get(entry, compute)
+    return SpectrumCube(stored['counts'], stored['edges'], stored['groups'], split_by)
@@ -0,0 +1,226 @@
+# *****************************************************************************
+#   Description: Temperature-drift gain correction. The photopeak position is
+#   fitted in time slices of a run and related to the mean 'Temp' of every
+#   slice; the resulting gain(T) is stored as a versioned JSON correction and
+#   applied event by event to the channels and 'Summed' by the converter or by
+#   :class:`SiphraAcquisition`.
+#....
+#   Date: 10/2026
+
+import json
+import numpy as np
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import TypeVar
+from pathlib import Path
+
+from analysis.histfill import bin_indices
+
+from .acquisitionindex import identity_key
+from .summingsiphras import SUBSEC_PER_SEC, _absolute_ticks
+
+PathLike = TypeVar("PathLike", str, Path, None)
+
+SCHEMA_VERSION = "1.0"
+CORRECTED_COLUMNS = [f"Ch{_}" for _ in range(1, 17)] + ['Summed']
+
+
+@dataclass
+class TemperatureCorrection:
+    '''
+    Linear gain drift ``gain(T) = 1 + slope * (T - reference_temp)``, relative
+    to the gain at ``reference_temp`` (in the units of 'Temp', deg C). Readings
+    are corrected to the reference temperature by dividing them by ``gain(T)``.
+
+    ``temps``, ``positions`` and ``errors`` are the fitted points, one per time slice.
+    '''
+    reference_temp: float
+    slope: float
+    temps: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    positions: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    errors: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    source: str | None = None
+    created: str = field(default_factory=lambda: datetime.now().isoformat(timespec='seconds'))
+    schema_version: str = SCHEMA_VERSION
+
+    @property
+    def key(self) -> str:
+        '''Hash of the coefficients, used to tell cached data of different corrections apart.'''
+        return identity_key(self.reference_temp, self.slope)
+
+    def factor(self, temps) -> np.ndarray:
+        '''Multiplicative correction of every event, ``1 / gain(T)``.'''
+        return 1. / (1. + self.slope * (np.asarray(temps, dtype=np.float64) - self.reference_temp))
+
+    def apply(self, values, temps) -> np.ndarray:
+        '''Corrects ``values`` of shape ``(n_events,)`` or ``(n_events, n_columns)``.'''
+        factor = self.factor(temps)
+        values = np.asarray(values, dtype=np.float64)
+        return values * (factor if values.ndim == 1 else factor[:, None])
+
+    @staticmethod
+    def required_columns(col_names: list[str]) -> list[str]:
+        '''Registers that must be read to correct ``col_names``.'''
+        return ['Temp'] if any(col in CORRECTED_COLUMNS for col in col_names) else []
+
+    def apply_dataframe(self, df):
+        '''Copy of ``df`` with the channel columns and 'Summed' corrected with its 'Temp' column.'''
+        df = df.copy()
+        factor = self.factor(df['Temp'].to_numpy())
+        for col in CORRECTED_COLUMNS:
+            if col in df:
+                df[col] = df[col].to_numpy(dtype=np.float64) * factor
+        return df
+
+    def save(self, path: PathLike):
+        raw = {
+            "schema_version": self.schema_version,
+            "correction": {
+                "type": "temperature_gain",
+                "model": "linear",
+                "reference_temp": self.reference_temp,
+                "slope": self.slope,
+            },
+            "fit": {
+                "temps": self.temps.tolist(),
+                "positions": self.positions.tolist(),
+                "errors": self.errors.tolist(),
+                "source": self.source,
+                "created": self.created,
+            },
+        }
+        with open(path, "w") as f:
+            json.dump(raw, f, indent=2)
+
+
+class TemperatureCorrectionLoader:
+
+    @staticmethod
+    def load(path: PathLike) -> TemperatureCorrection:
+        with open(path, "r") as f:
+            raw = json.load(f)
+
+        version = raw.get("schema_version", "1.0")
+
+        if version == "1.0":
+            return TemperatureCorrectionLoader._parse_v1(raw)
+        else:
+            raise ValueError(f"Unsupported schema version: {version}")
+
+    @staticmethod
+    def _parse_v1(raw: dict) -> TemperatureCorrection:
+        cor = raw["correction"]
+        fit = raw.get("fit", {})
+        if cor.get("type") != "temperature_gain" or cor.get("model", "linear") != "linear":
+            raise ValueError(f"Not a linear temperature gain correction: {cor.get('type')}")
+
+        return TemperatureCorrection(
+            reference_temp=float(cor["reference_temp"]),
+            slope=float(cor["slope"]),
+            temps=np.array(fit.get("temps", []), dtype=np.float64),
+            positions=np.array(fit.get("positions", []), dtype=np.float64),
+            errors=np.array(fit.get("errors", []), dtype=np.float64),
+            source=fit.get("source"),
+            created=fit.get("created", ""),
+            schema_version="1.0",
+        )
+
+
+def resolve_temperature_correction(correction) -> TemperatureCorrection | None:
+    '''Accepts a :class:`TemperatureCorrection`, the path to a saved one, or None.'''
+    if correction is None or isinstance(correction, TemperatureCorrection):
+        return correction
+    return TemperatureCorrectionLoader.load(correction)
+
+
+def fit_temperature_drift(acquisition, energy_range=None, time_slice=600., nbins=1024, hist_range=None,
+                          reference_temp=None, min_counts=500, peak_finder=None, chunksize=None):
+    '''
+    Fits the drift of the gain with temperature from the position of one
+    photopeak of 'Summed' in consecutive time slices of a run.
+
+    The spectra of all the slices and their mean temperatures are built in a
+    single pass (one ``np.bincount`` per chunk), the peak is fitted in all the
+    slices at once with the NumPy backend, and a weighted straight line
+    ``position(T)`` gives the relative gain slope.
+
+    Parameters
+    ----------
+    acquisition : SiphraAcquisition
+        If it has a gain calibration, it is applied; its temperature correction is not.
+    energy_range : tuple, optional
+        Fit window ``(xl, xr)`` of the photopeak in 'Summed' units. Default: the
+        most significant peak of the whole run (see ``analysis.peakfind``).
+    time_slice : float
+        Duration, in seconds, of every slice.
+    nbins, hist_range :
+        Binning of the spectra. Default range: 16 times the 12-bit range.
+    reference_temp : float, optional
+        Temperature the readings are corrected to. Default: mean temperature of the run.
+    min_counts : int
+        Slices with fewer events in the fit window are skipped.
+    peak_finder : dict, optional
+        Options passed to ``analysis.peakfind.find_peaks``.
+    chunksize : int, optional
+        Stream the file in chunks of this many events.
+    '''
+    from analysis.npfit import fit_peaks_expbg_batch
+    from analysis.peakfind import peak_ranges
+
+    lo, hi = (0., 16 * 4096.) if hist_range is None else hist_range
+    edges = np.linspace(lo, hi, nbins + 1)
+    gains = acquisition.gain_calibration
+    columns = ['Summed', 'Temp', 'Time_sec', 'Time_sub']
+    columns += gains.required_columns(columns) if gains is not None else []
+
+    counts = np.zeros(0)
+    temp_sum = np.zeros(0)
+    n_slice = np.zeros(0)
+    t0 = None
+    slice_ticks = int(round(time_slice * SUBSEC_PER_SEC))
+    for chunk in acquisition.iter_columns(columns, chunksize, raw=True):
+        if gains is not None:
+            chunk = gains.apply_dataframe(chunk)
+        ticks = _absolute_ticks(chunk)
+        t0 = ticks.min() if t0 is None and len(ticks) else t0
+        slices = np.maximum((ticks - t0) // slice_ticks, 0)
+        n = int(slices.max()) + 1 if len(slices) else 0
+        if n > len(n_slice):
+            counts = np.pad(counts, (0, (n - len(n_slice)) * nbins))
+            temp_sum = np.pad(temp_sum, (0, n - len(n_slice)))
+            n_slice = np.pad(n_slice, (0, n - len(n_slice)))
+
+        summed = chunk['Summed'].to_numpy(dtype=np.float64)
+        bins = bin_indices(summed, edges)
+        inside = (bins >= 0) & (bins < nbins)
+        flat = slices[inside] * nbins + bins[inside]
+        counts += np.bincount(flat, minlength=len(counts))
+        temp_sum += np.bincount(slices, chunk['Temp'].to_numpy(dtype=np.float64), minlength=len(temp_sum))
+        n_slice += np.bincount(slices, minlength=len(n_slice))
+
+    counts = counts.reshape(-1, nbins)
+    temps = temp_sum / np.maximum(n_slice, 1)
+    if energy_range is None:
+        energy_range = peak_ranges(counts.sum(axis=0), edges, 1, **(peak_finder or {}))[0]
+    xl, xr = energy_range
+
+    centres = 0.5 * (edges[:-1] + edges[1:])
+    in_window = counts[:, (centres >= xl) & (centres <= xr)].sum(axis=1)
+    used = np.flatnonzero(in_window >= min_counts)
+    if len(used) < 2:
+        raise RuntimeError(f"Only {len(used)} time slices with at least {min_counts} counts in the peak window. "
+                           "Use longer slices.")
+
+    params, errors, chi2, _ = fit_peaks_expbg_batch(counts[used], edges, xl, xr, peak_finder=peak_finder)
+    positions, pos_errors = params[:, 3], errors[:, 3]
+    good = np.isfinite(chi2) & (positions >= xl) & (positions <= xr) & np.isfinite(pos_errors) & (pos_errors > 0)
+    temps, positions, pos_errors = temps[used][good], positions[good], pos_errors[good]
+    if len(np.unique(temps)) < 2:
+        raise RuntimeError("The peak position could not be related to temperature: "
+                           "less than two fitted slices with different temperatures.")
+
+    if reference_temp is None:
+        reference_temp = float(np.average(temps, weights=n_slice[used][good]))
+    slope, intercept = np.polyfit(temps - reference_temp, positions, 1, w=1 / pos_errors)
+    return TemperatureCorrection(reference_temp, float(slope / intercept), temps, positions, pos_errors,
+                                 source=str(acquisition.filepath))
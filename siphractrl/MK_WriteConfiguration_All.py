@@ -21,7 +21,9 @@ if not os.path.isfile(sys.argv[1]):
 ucd_det = D2a()
 ucd_det.sysclk(6)
 ucd_det.reset('All')
-ucd_det.writeSIPHRAfromFile(sys.argv[1], 'All')
+# Registers already at their power-on value are not rewritten
+for report in ucd_det.writeSIPHRAfromFile(sys.argv[1], 'All', diff=True):
+    print(report)
 time.sleep(1)
 ucd_det.hold1Hz()
 print()
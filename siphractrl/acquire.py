@@ -7,6 +7,7 @@
 
 import argparse
 import subprocess
+import sys
 import json
 from pathlib import Path
 import time
@@ -38,6 +39,12 @@ def parse_args():
                         help="[DO NOT CHANGE UNLESS CHANGING dma_to_raw_file SETTINGS]. Block size. Default is 4095.")
     parser.add_argument("--device", default="/dev/D2A_DMA",
                         help = "[DO NOT CHANGE UNLESS CHANGING dma_to_raw_file SETTINGS].")
+    parser.add_argument("--tuning-file", type=str, default=None,
+                        help="Json file written by threshold_tuning.py. The thresholds it records are added to the metadata.")
+    parser.add_argument("--monitor", action="store_true",
+                        help="Show running spectra and rates during the acquisition (processing.livemonitor).")
+    parser.add_argument("--monitor-args", nargs=argparse.REMAINDER, default=[],
+                        help="Options passed to the monitor, e.g. --monitor-args --plot --nbins 512. Must be last.")
 
 
     return parser.parse_args()
@@ -56,14 +63,26 @@ def run_acquisition(args):
         "-b"
     ]
 
+    monitor = None
+    if args.monitor:
+        # The monitor runs from the project root, where the processing package lives.
+        project_root = Path(__file__).resolve().parents[1]
+        monitor = subprocess.Popen([sys.executable, "-m", "processing.livemonitor", str(dat_file),
+                                    *args.monitor_args], cwd=project_root)
+
     start = time.time()
-    subprocess.run(cmd, check=True)
-    end = time.time()
+    try:
+        subprocess.run(cmd, check=True)
+    finally:
+        end = time.time()
+        if monitor is not None:
+            monitor.terminate()
+            monitor.wait()
 
     exposure = end - start
     return exposure, output_base
 
-def write_metadata(output_base, exposure, args):
+def write_metadata(output_base, exposure, args, extra=None):
     with open(args.siphra_config_file) as f:
         siphra_config = f.readline().strip()
     metadata = {
@@ -91,6 +110,8 @@ def write_metadata(output_base, exposure, args):
             "notes": args.notes,
         }
     }
+    # Additional sections, e.g. the parameters of a scan step (see scan.py)
+    metadata.update(extra or {})
 
     json_file = output_base.with_suffix(".json")
     with open(json_file, "w") as f:
@@ -98,8 +119,12 @@ def write_metadata(output_base, exposure, args):
 
 def main():
     args = parse_args()
+    extra = None
+    if args.tuning_file is not None:
+        with open(args.tuning_file) as f:
+            extra = {"threshold_tuning": json.load(f)["threshold_tuning"]}
     exposure, output_base = run_acquisition(args)
-    write_metadata(output_base, exposure, args)
+    write_metadata(output_base, exposure, args, extra=extra)
     print(f"\n\nAcquisition complete.\n\tWritten to: {output_base}\n\tTotal exposure: {exposure:,.2f} seconds.")
 
 if __name__ == "__main__":
@@ -0,0 +1,166 @@
+'''
+Software model of the D2a board, to run and time the SIPHRA control code
+without /dev/uio0 or spidev:
+
+    d2a = D2a(backend=SimulatedBackend())
+    siphra = SIPHRA(backend=SimulatedBackend())
+
+The uio register file is a plain byte array. The SPI device decodes the
+chip select and reset lines from the CTRL register and forwards transfers
+to one SiphraModel per chip, which stores registers masked to their
+significant bits (SIPHRA_REG_LENS) as the ASIC does. A NoiseModel per chip
+gives the noise trigger rate of its channels from their qc_threshold, for
+code tuning thresholds against the simulated board.
+'''
+import numpy as np
+
+try:
+    from .d2a_lib import SIPHRA_REG_LENS, CHIP2BIN, CTRL_ADDR_0, UIO_SIZE
+    from .regs_codec import REGISTER_CODECS
+except ImportError: # Run as a script from this directory, like the MK_ scripts
+    from d2a_lib import SIPHRA_REG_LENS, CHIP2BIN, CTRL_ADDR_0, UIO_SIZE
+    from regs_codec import REGISTER_CODECS
+
+CHIPS = ['A', 'B', 'C', 'D']
+
+
+class SiphraModel:
+    '''
+    Register file of one SIPHRA. Registers hold only their
+    SIPHRA_REG_LENS least significant bits; reset clears them.
+    '''
+    def __init__(self):
+        self.regs = [0] * len(SIPHRA_REG_LENS)
+        self.n_reads = 0
+        self.n_writes = 0
+
+    def reset(self):
+        self.regs = [0] * len(SIPHRA_REG_LENS)
+
+    def write(self, addr, val):
+        self.n_writes += 1
+        if addr < len(self.regs):
+            self.regs[addr] = int.from_bytes(bytes(val), byteorder='big') & (2**SIPHRA_REG_LENS[addr] - 1)
+
+    def read(self, addr):
+        self.n_reads += 1
+        value = self.regs[addr] if addr < len(self.regs) else 0
+        return value.to_bytes(4, byteorder='big')
+
+    def transfer(self, bytelist):
+        '''One SPI frame: [addr << 1 | write] + 4 data bytes. Returns the bytes clocked out.'''
+        addr, write = bytelist[0] >> 1, bytelist[0] & 1
+        if write:
+            self.write(addr, bytelist[1:5])
+            return [0] * len(bytelist)
+        return [0] + list(self.read(addr))
+
+
+class NoiseModel:
+    '''
+    Noise trigger rate of the 17 channels of one chip (index 0 = channel 1,
+    16 = summing channel) as a function of their qc_threshold. Gaussian noise
+    of ``width`` around ``baseline`` crosses a threshold at
+    ``rate0 * exp(-(threshold - baseline)**2 / (2 * width**2))`` (Rice
+    formula), and at ``rate0`` below the baseline.
+    '''
+    def __init__(self, baseline, width, rate0=1e5):
+        self.baseline = np.broadcast_to(np.asarray(baseline, dtype=np.float64), (17,))
+        self.width = np.broadcast_to(np.asarray(width, dtype=np.float64), (17,))
+        self.rate0 = np.broadcast_to(np.asarray(rate0, dtype=np.float64), (17,))
+
+    @classmethod
+    def random(cls, rng, baseline=(20., 60.), width=(4., 12.), rate0=1e5):
+        '''Channels with baselines and widths drawn uniformly from the given ranges.'''
+        return cls(rng.uniform(*baseline, 17), rng.uniform(*width, 17), rate0)
+
+    def rates(self, thresholds):
+        '''Noise trigger rate, in Hz, of every channel for an array of 17 thresholds.'''
+        excess = np.maximum(np.asarray(thresholds, dtype=np.float64) - self.baseline, 0.)
+        return self.rate0 * np.exp(-excess**2 / (2 * self.width**2))
+
+
+class SimulatedUIO:
+    '''
+    Byte array standing in for the mmap of /dev/uio0. Writes to the CTRL
+    register are passed to [on_ctrl], so that the model sees reset pulses.
+    '''
+    def __init__(self, size=UIO_SIZE, on_ctrl=None):
+        self.data = bytearray(size)
+        self.on_ctrl = on_ctrl
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, idx):
+        return bytes(self.data[idx])
+
+    def __setitem__(self, idx, value):
+        self.data[idx] = value
+        if self.on_ctrl is not None and isinstance(idx, slice) and idx.start <= CTRL_ADDR_0 + 1 \
+                and idx.stop > CTRL_ADDR_0:
+            self.on_ctrl(self.data[CTRL_ADDR_0:CTRL_ADDR_0 + 2])
+
+
+class SimulatedSPI:
+    '''
+    spidev.SpiDev look-alike. Each transfer goes to the chips whose
+    chip select is asserted (low) in the CTRL register and that are not
+    held in reset. Read-backs of several chips are ORed together.
+    '''
+    def __init__(self, uio, chips):
+        self.uio = uio
+        self.chips = chips
+        self.mode = 0
+        self.n_transfers = 0
+
+    def xfer2(self, bytelist, speed_hz=0):
+        self.n_transfers += 1
+        # CTRL bytes: hold | reset, cs | sysclk (one nibble each, see d2a_lib.CTRL_0)
+        reset, cs = self.uio.data[CTRL_ADDR_0] & 0xF, self.uio.data[CTRL_ADDR_0 + 1] >> 4
+        readback = [0] * len(bytelist)
+        for name, chip in self.chips.items():
+            if not cs & CHIP2BIN[name] and not reset & CHIP2BIN[name]:
+                readback = [a | b for a, b in zip(readback, chip.transfer(bytelist))]
+        return readback
+
+
+class SimulatedBackend:
+    '''
+    Simulated D2a board with four SIPHRA chips (see d2a_lib.HardwareBackend
+    for the backend interface). The chip models are available in
+    [chips] to inspect or preset their registers, and their noise
+    models, drawn from [seed], in [noise].
+    '''
+    def __init__(self, seed=0):
+        self.chips = {name: SiphraModel() for name in CHIPS}
+        self.uio = SimulatedUIO(on_ctrl=self._ctrl_written)
+        self.spi = SimulatedSPI(self.uio, self.chips)
+        self.rng = np.random.default_rng(seed)
+        self.noise = {name: NoiseModel.random(self.rng) for name in CHIPS}
+
+    def _ctrl_written(self, ctrl):
+        reset = ctrl[0] & 0xF
+        for name, chip in self.chips.items():
+            if reset & CHIP2BIN[name]:
+                chip.reset()
+
+    def open_uio(self):
+        return self.uio
+
+    def open_spi(self):
+        return self.spi
+
+    def trigger_rate(self, chip):
+        '''Expected noise trigger rate, in Hz, of ``chip``: the sum over its channels with triggering enabled.'''
+        thresholds, enabled = np.zeros(17), np.zeros(17, dtype=bool)
+        for addr in range(17):
+            codec, value = REGISTER_CODECS[addr], self.chips[chip].regs[addr]
+            thresholds[addr] = codec.get(value, 'qc_threshold')
+            enabled[addr] = codec.get(value, 'enable_triggering')
+        rates = self.noise[chip].rates(thresholds)
+        return float(rates[enabled].sum())
+
+    def count_triggers(self, chip, seconds):
+        '''Noise triggers of ``chip`` counted during ``seconds`` (Poisson distributed).'''
+        return int(self.rng.poisson(self.trigger_rate(chip) * seconds))
@@ -3,7 +3,7 @@ import mmap
 import logging
 from construct import BitStruct, Nibble, BitsInteger, ByteSwapped, BitsSwapped
 import time
-import spidev
+from collections import namedtuple
 
 # define Python user-defined exceptions
 
@@ -22,6 +22,9 @@ class SIPHRAWriteError(Exception):
         self.chip = chip
         self.reg = reg
 
+    def __str__(self):
+        return f"SIPHRA {self.chip}: write to register {self.reg} failed verification"
+
 
 
 
@@ -35,6 +38,46 @@ def compareUpTo(a, b, len):
     return a_zeroed == b_zeroed
 
 
+def readImageFile(filename):
+    '''
+    Register image stored in a binary configuration file:
+    a list of four-byte values, the index being the register address.
+    '''
+    vals = []
+    with open(filename, 'rb') as f:
+        while (val := f.read(4)):
+            vals.append(val)
+    return vals
+
+
+def writeImageFile(filename, vals):
+    '''
+    Store a register image (four-byte values, index = address)
+    as a binary configuration file, read by readImageFile.
+    '''
+    with open(filename, 'wb') as f:
+        for val in vals:
+            f.write(bytes(val))
+
+
+class UploadReport(namedtuple('UploadReport', ['chip', 'written', 'unchanged', 'failed',
+                                               'read_sec', 'write_sec', 'verify_sec'])):
+    '''
+    Result of D2a.uploadSIPHRAimage: addresses written, left unchanged
+    (already holding the desired value) and failing verification,
+    and the time spent reading the current state, writing and verifying.
+    '''
+    @property
+    def total_sec(self):
+        return self.read_sec + self.write_sec + self.verify_sec
+
+    def __str__(self):
+        return (f"SIPHRA {self.chip}: {len(self.written)} written, {len(self.unchanged)} unchanged, "
+                f"{len(self.failed)} failed in {1e3 * self.total_sec:.1f} ms "
+                f"(read {1e3 * self.read_sec:.1f}, write {1e3 * self.write_sec:.1f}, "
+                f"verify {1e3 * self.verify_sec:.1f})")
+
+
 CHIP2BIN = {'A':1, 'B':2, 'C':4, 'D':8, 'All':15}
 ANTICHIP2BIN = {'A':0b1110, 'B':0b1101, 'C':0b1011, 'D':0b0111, 'All':0b0000}
 HOLDRATES = {'Off':0, '1Hz':2, '1kHz':1}
@@ -63,42 +106,71 @@ DATA_1 = BitsSwapped(BitStruct(
     ))
 
 
+UIO_SIZE = 4108 # bytes mapped from the uio device
+
+
+class HardwareBackend:
+    '''
+    Devices of the flight board. A backend provides the two devices D2a talks to:
+
+      open_uio(): the memory mapped register file, an object
+                  supporting byte slicing (reg[a:b], reg[a:b] = val)
+                  of at least UIO_SIZE bytes.
+      open_spi(): an object with spidev's xfer2(bytelist, speed_hz).
+
+    See d2a_backend.SimulatedBackend for a software model of the board.
+    '''
+    def __init__(self, uio='/dev/uio0', spi_bus=1, spi_device=0):
+        self.uio = uio
+        self.spi_bus = spi_bus
+        self.spi_device = spi_device
+
+    def open_uio(self):
+        with open(self.uio, "r+b", 0) as f:
+            return mmap.mmap(f.fileno(), length = UIO_SIZE)
+
+    def open_spi(self):
+        import spidev # Only available on the board
+        spi = spidev.SpiDev()
+        spi.open(self.spi_bus, self.spi_device)
+        spi.mode = 0
+        return spi
+
+
 class D2a:
     '''
     Contains all functions required to interface with hardware devices through OS.
+
+    The devices are provided by [backend], by default the
+    HardwareBackend of the uio device [uio].
     '''
-    def __init__(self, uio='/dev/uio0', spi='/dev/spi'):
+    def __init__(self, uio='/dev/uio0', spi='/dev/spi', backend=None):
+        self.backend = backend if backend is not None else HardwareBackend(uio)
         try:
             self.uio = uio
-            with open(self.uio, "r+b", 0) as f:
-                self.reg = mmap.mmap(f.fileno(), length = 4108)
+            self.reg = self.backend.open_uio()
+            self._initCtrl()
             self.deassertCS()
         except Exception as exc:
             raise UIOError from exc
 
         try:
-            self.spi = spidev.SpiDev()
-            self.spi.open(1,0)
-            self.spi.mode = 0
+            self.spi = self.backend.open_spi()
         except Exception as exc:
-            raise SPIError from exc        
+            raise SPIError from exc
 
     def readMMap(self, addr, len=2):
         '''
         Read [len] bytes at [addr] from the memory mapped uio file.
         '''
-        self.reg.seek(addr)
-        print(self.reg.read(4))
-        self.reg.seek(addr)
-        return self.reg.read(4)
+        return self.reg[addr:addr + len]
 
     def writeMMap(self, val, addr):
         '''
         Write however many bytes are supplied to the memory mapped
         uio file beginning at [addr].
         '''
-        self.reg.seek(addr)
-        self.reg.write(val)
+        self.reg[addr:addr + len(val)] = val
 
     def readStruct(self, addr, struct):
         '''
@@ -115,7 +187,6 @@ class D2a:
         contained within the struct.
         '''
         parsedStruct = self.readStruct(addr, struct)
-        print(parsedStruct)
         return parsedStruct[param]
 
     def writeParam(self, param, addr, struct, value, clearbits=False):
@@ -124,8 +195,12 @@ class D2a:
         If the value given is one of the keys of CHIP2BIN (i.e. 'A', 'B', 'C', 'D', 'All'),
         then only the bit corresponding to that chip will be set, respecting the existing values
         of other chips' bits. Setting clearbits to True clears bits instead of setting them.
-        '''        
-        parsedStruct = self.readStruct(addr, struct)
+
+        The CTRL register is only written by this object, so its
+        current value is taken from the cached copy instead of the mmap.
+        '''
+        ctrl = addr == CTRL_ADDR_0 and struct is CTRL_0
+        parsedStruct = dict(self._ctrl) if ctrl else self.readStruct(addr, struct)
 
         if value in CHIP2BIN:
             if clearbits:
@@ -138,6 +213,28 @@ class D2a:
 
         bytesToWrite = struct.build(parsedStruct)
         self.writeMMap(bytesToWrite, addr)
+        if ctrl:
+            self._setCtrl(parsedStruct)
+
+    def _initCtrl(self):
+        '''
+        Cache the CTRL register (read once from the mmap) and the bytes
+        to write to it to select each chip, so that chip-select
+        toggling is a single write without parsing.
+        '''
+        ctrl = self.readStruct(CTRL_ADDR_0, CTRL_0)
+        self._setCtrl({name: ctrl[name] for name in ('hold', 'reset', 'cs', 'sysclk')})
+
+    def _setCtrl(self, ctrl):
+        self._ctrl = ctrl
+        self._csBytes = {chip: CTRL_0.build({**ctrl, 'cs': cs}) for chip, cs in ANTICHIP2BIN.items()}
+        self._csBytes[None] = CTRL_0.build({**ctrl, 'cs': 15})
+
+    def _writeCS(self, key):
+        '''Write one of the precomputed CTRL patterns (see _initCtrl).'''
+        value = self._csBytes[key]
+        self.reg[CTRL_ADDR_0:CTRL_ADDR_0 + len(value)] = value
+        self._ctrl['cs'] = 15 if key is None else ANTICHIP2BIN[key]
 
 
     def keepReset(self, chip):
@@ -198,14 +295,14 @@ class D2a:
         and make sure all the others are high. Probably shouldn't call this with 'All',
         but I won't stop you!
         '''
-        self.writeParam('cs', CTRL_ADDR_0, CTRL_0, ANTICHIP2BIN[chip])
+        self._writeCS(chip)
 
     def deassertCS(self):
         '''
         CS is active low. There isn't really a use case to deassert one at a time.
         So we'll just deassert everything by setting them high.
         '''
-        self.writeParam('cs', CTRL_ADDR_0, CTRL_0, 15)
+        self._writeCS(None)
 
 
     def error(self):
@@ -268,53 +365,86 @@ class D2a:
         bytes_to_send = [read_addr] + [0] * 4
         return bytes(self.spiXfer(bytes_to_send, chip)[1:])
 
-    def writeSIPHRAwithCheck(self, val, addr, chip):
+    def writeSIPHRAwithCheck(self, val, addr, chip, tries=3):
         '''
-        Keep writing a register to SIPHRA until 
-        the value you get when reading it back out 
-        matches the expected input.
-        
-        TODO: Make the function give up eventually
-        or try something else like resetting SIPHRA.
+        Write a register to SIPHRA and read it back,
+        writing it again (up to [tries] times in total)
+        until the read-back value matches the input.
         '''
-        self.writeSIPHRA(val, addr, chip)
-        remaining_tries = 3
-        match = False
-        while remaining_tries > 0 and match is False:
+        for _ in range(tries):
+            self.writeSIPHRA(val, addr, chip)
             readback = self.readSIPHRA(addr, chip)
-            match = compareUpTo(val, readback, SIPHRA_REG_LENS[addr])
-            if match is True:
+            if compareUpTo(val, readback, SIPHRA_REG_LENS[addr]):
+                return
+        raise SIPHRAWriteError(chip = chip,reg = addr)
+
+    def uploadSIPHRAimage(self, vals, chip, current=None, diff=True, tries=3):
+        '''
+        Write a whole register image to one SIPHRA, touching
+        only the registers that differ from its current state.
+
+          vals:    four-byte register values, index = address.
+          chip:    'A', 'B', 'C' or 'D'.
+          current: {address: four-byte value} known state of the chip,
+                   e.g. a shadow copy. Registers not in it are read back.
+          diff:    if False, every register is written.
+          tries:   writes of a register before giving up on it.
+
+        The registers written are then verified in one batch:
+        all are read back once, and only mismatches are written
+        again. Returns an UploadReport; registers failing
+        verification are listed in it instead of raising.
+        '''
+        if chip not in ('A', 'B', 'C', 'D'):
+            raise ValueError(f"Upload to one chip at a time, got {chip!r}")
+        current = {} if current is None else current
+        t0 = time.perf_counter()
+        if diff:
+            state = {addr: current[addr] if addr in current else self.readSIPHRA(addr, chip)
+                     for addr in range(len(vals))}
+            pending = [addr for addr, val in enumerate(vals)
+                       if not compareUpTo(val, state[addr], SIPHRA_REG_LENS[addr])]
+        else:
+            pending = list(range(len(vals)))
+        unchanged = sorted(set(range(len(vals))) - set(pending))
+        written = list(pending)
+        read_sec = time.perf_counter() - t0
+
+        write_sec = verify_sec = 0.
+        for _ in range(tries):
+            if not pending:
                 break
-            else:
-                remaining_tries -= 1
-        if remaining_tries == 0 and match is False:
-            raise SIPHRAWriteError(chip = chip,reg = addr)
-
-    def writeSIPHRAfromFile(self, filename, chip):
+            t1 = time.perf_counter()
+            for addr in pending:
+                self.writeSIPHRA(vals[addr], addr, chip)
+            t2 = time.perf_counter()
+            pending = [addr for addr in pending
+                       if not compareUpTo(vals[addr], self.readSIPHRA(addr, chip), SIPHRA_REG_LENS[addr])]
+            write_sec += t2 - t1
+            verify_sec += time.perf_counter() - t2
+        return UploadReport(chip, written, unchanged, pending, read_sec, write_sec, verify_sec)
+
+    def writeSIPHRAfromFile(self, filename, chip, diff=False):
         '''
         Write registers to a given SIPHRA chip.
-        
+
         Assumes every four bytes in a binary file
-        is a new register value. Will start at 
+        is a new register value. Will start at
         register 0 and keep going while there are
-        bytes in the file.
+        bytes in the file. With [diff], only registers
+        differing from the values read back are written
+        (see uploadSIPHRAimage).
 
         If 'All' is selected for chip, every SIPHRA
         gets the same configuration.
         '''
         chips = ['A', 'B', 'C', 'D'] if chip == 'All' else [chip]
-        
-        vals = []
-        with open(filename, 'r+b', 0) as f:
-            while (val := f.read(4)):
-                vals.append(val)
+        vals = readImageFile(filename)
 
+        reports = []
         for chip in chips:
-            for addr, val in enumerate(vals):
-               print("value:",val)
-               print("address:",addr)
-               print("chp:",chip)
-               self.writeSIPHRAwithCheck(val, addr, chip)
-
-
-
+            report = self.uploadSIPHRAimage(vals, chip, diff=diff)
+            if report.failed:
+                raise SIPHRAWriteError(chip = chip, reg = report.failed[0])
+            reports.append(report)
+        return reports
@@ -0,0 +1,165 @@
+'''
+Compiled bit-field codecs of the SIPHRA registers.
+
+The construct BitStructs of regs_bit_structure.py are turned, once, into a
+(shift, mask) pair per field, so that registers are decoded and modified
+with integer operations instead of construct parsing and building. Whole
+register images (one 32-bit word per address) of any number of chips or
+configurations are encoded, decoded and compared with NumPy.
+'''
+from collections import namedtuple
+from functools import lru_cache
+
+import numpy as np
+from construct import Flag
+
+try:
+    from .d2a_lib import SIPHRA_REG_LENS
+    from .regs_bit_structure import reg_str_lst
+except ImportError: # Run as a script from this directory, like the MK_ scripts
+    from d2a_lib import SIPHRA_REG_LENS
+    from regs_bit_structure import reg_str_lst
+
+REG_BITS = 32
+# Register names used by SIPHRA, index = address.
+REGISTER_NAMES = [*[f"ch{i}" for i in range(1, 17)], "ch17", "ch_config", "ch_control", "adc_config", "cal_dac",
+                  "pd_modules", "cal_ctrl", "readout_list", "readout_mode"]
+
+FieldCodec = namedtuple('FieldCodec', ['shift', 'mask', 'flag'])
+
+
+class RegisterCodec:
+    '''Fields of one register as ``FieldCodec`` (shift, mask, is a flag), in register order.'''
+    def __init__(self, structure):
+        subcons = structure.subcon.subcons
+        total = sum(field.sizeof() for field in subcons)
+        if total != REG_BITS:
+            raise ValueError(f"Register structure has {total} bits, expected {REG_BITS}")
+        self.fields = {}
+        offset = 0
+        for field in subcons:
+            size = field.sizeof()
+            if field.name:
+                self.fields[field.name] = FieldCodec(REG_BITS - offset - size, (1 << size) - 1,
+                                                     isinstance(field.subcon, type(Flag)))
+            offset += size
+        self.significant = 0 # Mask of the bits of all the fields (padding excluded)
+        for codec in self.fields.values():
+            self.significant |= codec.mask << codec.shift
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    @staticmethod
+    def to_int(value):
+        return int.from_bytes(value, byteorder='big') if isinstance(value, (bytes, bytearray)) else int(value)
+
+    def get(self, value, name):
+        codec = self.fields[name]
+        field = (self.to_int(value) >> codec.shift) & codec.mask
+        return bool(field) if codec.flag else field
+
+    def decode(self, value):
+        '''All the fields of a register value (4 bytes, big endian, or int), like ``structure.parse``.'''
+        word = self.to_int(value)
+        decoded = {}
+        for name, codec in self.fields.items():
+            field = (word >> codec.shift) & codec.mask
+            decoded[name] = bool(field) if codec.flag else field
+        return decoded
+
+    def encode(self, fields, base=0):
+        '''
+        4-byte value with ``fields`` ({name: value}) set over ``base``. Padding
+        bits are cleared, as ``structure.build`` does.
+        '''
+        word = self.to_int(base)
+        for name, value in fields.items():
+            codec = self.fields[name]
+            value = int(value)
+            if not 0 <= value <= codec.mask:
+                raise ValueError(f"Value {value} does not fit in field {name} ({codec.mask.bit_length()} bits)")
+            word = (word & ~(codec.mask << codec.shift)) | (value << codec.shift)
+        return (word & self.significant).to_bytes(REG_BITS // 8, byteorder='big')
+
+    def set(self, value, name, field_value):
+        '''Register value with one field changed.'''
+        return self.encode({name: field_value}, value)
+
+
+@lru_cache(maxsize=None)
+def compile_register(structure):
+    '''Compiled codec of a register BitStruct (compiled once per structure).'''
+    return RegisterCodec(structure)
+
+
+REGISTER_CODECS = [compile_register(structure) for structure in reg_str_lst] # index = address
+N_REGISTERS = len(SIPHRA_REG_LENS) # Registers of a configuration file, some without a bit structure
+# Significant bits of every address: the fields of the registers with a bit
+# structure, the SIPHRA_REG_LENS least significant bits of the others.
+SIGNIFICANT_MASKS = np.array([REGISTER_CODECS[addr].significant if addr < len(REGISTER_CODECS) else (1 << n) - 1
+                              for addr, n in enumerate(SIPHRA_REG_LENS)], dtype=np.uint32)
+
+
+def _address(reg):
+    return REGISTER_NAMES.index(reg) if isinstance(reg, str) else reg
+
+
+def encode_images(fields, base=None, n_images=None):
+    '''
+    Register images of many chips or configurations at once.
+
+    ``fields`` maps ``(register, field)`` (register name or address) to one
+    value or an array of values, one per image. ``base`` is an array of
+    images of shape ``(n_images, n_registers)`` to modify; default: all zeros,
+    with ``N_REGISTERS`` registers. Returns a ``uint32`` array of shape ``(n_images, n_registers)``.
+    '''
+    if base is None:
+        if n_images is None:
+            n_images = max([np.size(v) for v in fields.values()] + [1])
+        words = np.zeros((n_images, N_REGISTERS), dtype=np.uint32)
+    else:
+        words = np.array(base, dtype=np.uint32, ndmin=2)
+    for (reg, name), values in fields.items():
+        addr = _address(reg)
+        codec = REGISTER_CODECS[addr].fields[name]
+        values = np.asarray(values, dtype=np.int64)
+        if np.any((values < 0) | (values > codec.mask)):
+            raise ValueError(f"Values of {name} do not fit in {codec.mask.bit_length()} bits")
+        cleared = words[:, addr] & np.uint32(~(codec.mask << codec.shift) & 0xFFFFFFFF)
+        words[:, addr] = cleared | (values.astype(np.uint32) << np.uint32(codec.shift))
+    return words & SIGNIFICANT_MASKS[:words.shape[1]]
+
+
+def decode_images(words, fields=None):
+    '''
+    Field values of register images of shape ``(n_images, n_registers)``:
+    ``{(register name, field): array of n_images values}``, for all the fields or only ``fields``.
+    '''
+    words = np.array(words, dtype=np.uint32, ndmin=2)
+    if fields is None:
+        fields = [(REGISTER_NAMES[addr], name) for addr, codec in enumerate(REGISTER_CODECS[:words.shape[1]])
+                  for name in codec.fields]
+    decoded = {}
+    for reg, name in fields:
+        addr = _address(reg)
+        codec = REGISTER_CODECS[addr].fields[name]
+        values = (words[:, addr] >> np.uint32(codec.shift)) & np.uint32(codec.mask)
+        decoded[(REGISTER_NAMES[addr], name)] = values.astype(bool) if codec.flag else values
+    return decoded
+
+
+def image_differences(a, b):
+    '''True where the significant bits of two sets of images differ (same shape).'''
+    a, b = np.array(a, dtype=np.uint32, ndmin=2), np.array(b, dtype=np.uint32, ndmin=2)
+    return ((a ^ b) & SIGNIFICANT_MASKS[:a.shape[1]]) != 0
+
+
+def image_to_bytes(words):
+    '''One image (1D array of words) as the list of 4-byte values written to the chip.'''
+    return [int(w).to_bytes(REG_BITS // 8, byteorder='big') for w in np.asarray(words).ravel()]
+
+
+def image_from_bytes(vals):
+    '''Inverse of :func:`image_to_bytes`.'''
+    return np.array([int.from_bytes(v, byteorder='big') for v in vals], dtype=np.uint32)
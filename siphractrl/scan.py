@@ -0,0 +1,327 @@
+# *****************************************************************************
+# Description: Automated parameter scans. For every point of a grid of SIPHRA
+# parameters (e.g. cmis_detector_voffset, qc_threshold) the registers are
+# written through SIPHRA.write_param, an acquisition is taken with
+# dma_to_raw_file and its metadata, including the scan parameters and the
+# register image, is stored as acquire.py does. The conversion to '.csv' and
+# a summary analysis of each step run in background processes while the next
+# step acquires, so a scan takes about as long as its acquisitions.
+# Usage: python path/to/siphractrl/scan.py -o DIR --prefix NAME -p qc_threshold[2] 10 20 30 [options]
+#        (run from the directory of dma_to_raw_file, as acquire.py; from the project
+#        root, ``python -m siphractrl.scan`` works too)
+#....
+#   Date: 10/2026
+
+import argparse
+import itertools
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+try:
+    from .acquire import run_acquisition, write_metadata
+    from .d2a_lib import readImageFile, SIPHRAWriteError
+    from .siphra_controller import SIPHRA
+except ImportError: # Run as a script, e.g. from the directory of dma_to_raw_file
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from siphractrl.acquire import run_acquisition, write_metadata
+    from siphractrl.d2a_lib import readImageFile, SIPHRAWriteError
+    from siphractrl.siphra_controller import SIPHRA
+
+# Fields of write_metadata taken from the scan options, with the defaults of acquire.py
+METADATA_DEFAULTS = {
+    "active_chs": [],
+    "sipm_chs": '',
+    "source": '[NOT SPECIFIED]',
+    "source_description": '[NOT SPECIFIED]',
+    "notes": '[NONE]',
+    "siphra_config_file": 'D2a/Ongoing.txt',
+}
+
+_SETTING_RE = re.compile(r"^(\w+)(?:\[([\d,\-\s]+)\])?$")
+
+
+def parse_setting(label):
+    '''
+    Parameter and channels of a scan setting: ``'cal_dac'`` (channel 0),
+    ``'qc_threshold[2]'``, ``'qc_threshold[2,4,6]'`` or ``'qc_threshold[1-16]'``.
+    '''
+    match = _SETTING_RE.match(label.strip())
+    if match is None:
+        raise ValueError(f"Invalid scan setting \"{label}\"")
+    name, chs = match.groups()
+    if chs is None:
+        return name, [0]
+    channels = []
+    for part in chs.split(','):
+        first, _, last = part.strip().partition('-')
+        channels.extend(range(int(first), int(last or first) + 1))
+    return name, channels
+
+
+def expand_grid(grid):
+    '''
+    Steps of a scan: one dict ``{setting: value}`` per combination of the
+    values in ``grid`` ({setting: values}). The last setting varies fastest,
+    so the first ones are rewritten as rarely as possible.
+    '''
+    settings = list(grid)
+    return [dict(zip(settings, values)) for values in itertools.product(*(grid[s] for s in settings))]
+
+
+def step_name(index, prefix, params):
+    '''
+    File name of a step, starting with its index as expected by SiphraAcquisition.
+    Dots in the values are written as 'p' (27.5 -> 27p5), since ``Path.with_suffix``
+    would take them as a suffix.
+    '''
+    parts = [f"{re.sub(r'[^0-9A-Za-z_]+', '_', str(s)).strip('_')}_{str(v).replace('.', 'p')}"
+             for s, v in params.items()]
+    return '_'.join([f"{index:03d}", prefix, *parts])
+
+
+class DmaAcquirer:
+    '''Acquisitions with dma_to_raw_file (see acquire.run_acquisition). Returns the exposure in seconds.'''
+
+    def __init__(self, device="/dev/D2A_DMA", size=4095):
+        self.device = device
+        self.size = size
+
+    def __call__(self, output_base, counts):
+        args = argparse.Namespace(output=str(output_base), counts=counts, device=self.device, size=self.size,
+                                  monitor=False, monitor_args=[])
+        exposure, _ = run_acquisition(args)
+        return exposure
+
+
+def convert_dat(dat_file, crystal_code=0, subtract_baselines=False):
+    '''
+    Converts a '.dat' file to a '.csv' file next to it with
+    ODR_DatConverter.process_events. Returns the path of the '.csv' file.
+    '''
+    sys.path.insert(0, str(PROJECT_ROOT / 'file_converters')) # ODR_DatConverter imports d2a_decoder
+    from ODR_DatConverter import process_events
+    data, _ = process_events(dat_file, crystal_code=crystal_code, subtract_baselines=subtract_baselines)
+    csv_file = Path(dat_file).with_suffix('.csv')
+    data.to_csv(csv_file, index=False)
+    return csv_file
+
+
+def summarize_acquisition(csv_file, nbins=4096):
+    '''
+    Summary of one acquisition: its run statistics (rates, dead and live time,
+    missing IDs) and the mean of 'Summed' and of every active channel.
+    '''
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from processing import SiphraAcquisition
+    acquisition = SiphraAcquisition(csv_file)
+    summary = dict(acquisition.run_statistics().summary)
+    cube = acquisition.spectrum_cube(nbins=nbins)
+    for item in ['Summed', *[f"Ch{ch}" for ch in acquisition.active_chs]]:
+        counts, edges = cube.spectrum(item)
+        total = counts.sum()
+        summary[f"{item}_mean"] = float(np.dot(counts, (edges[:-1] + edges[1:]) / 2) / total) if total else np.nan
+    return summary
+
+
+def process_step(dat_file, crystal_code=0, subtract_baselines=False):
+    '''Default background work of a scan step: :func:`convert_dat`, then :func:`summarize_acquisition`.'''
+    csv_file = convert_dat(dat_file, crystal_code, subtract_baselines)
+    return {'csv_file': str(csv_file), **summarize_acquisition(csv_file)}
+
+
+class ParameterScan:
+    '''
+    Scan of SIPHRA parameters over a grid.
+
+    ``grid`` maps settings (see :func:`parse_setting`) to the values to scan.
+    Settings listed in ``setters`` are not registers: their callable is given
+    the value instead (e.g. to change the SiPM bias voltage). Every step is
+    acquired with ``acquirer(output_base, counts)``, which returns the exposure
+    (default: :class:`DmaAcquirer`), and is then handed to
+    ``processor(dat_file)`` in one of ``max_workers`` background processes
+    (default: :func:`process_step`); ``processor`` must be picklable and return
+    a dict of summary values. ``metadata`` holds the fields of acquire.py
+    metadata (see ``METADATA_DEFAULTS``).
+    '''
+
+    def __init__(self, siphra, grid, output_dir, prefix='scan', counts=100_000, chip='A', acquirer=None,
+                 processor=None, setters=None, settle_sec=0., max_workers=1, metadata=None):
+        self.siphra = siphra
+        self.grid = {setting: list(values) for setting, values in grid.items()}
+        self.output_dir = Path(output_dir).resolve()
+        self.prefix = prefix
+        self.counts = counts
+        self.chip = chip
+        self.acquirer = acquirer or DmaAcquirer()
+        self.processor = processor or process_step
+        self.setters = setters or {}
+        self.settle_sec = settle_sec
+        self.max_workers = max_workers
+        self.metadata = {**METADATA_DEFAULTS, **(metadata or {})}
+        # Resolved once, so that a typo fails before the first acquisition.
+        self._params = {s: parse_setting(s) for s in self.grid if s not in self.setters}
+        self._check_values()
+
+    def _check_values(self):
+        '''Raises if a register setting does not exist or one of its values does not fit in its field.'''
+        for setting, (name, channels) in self._params.items():
+            for ch in channels:
+                reg_name, _ = self.siphra._resolve_param(name, ch)
+                mask = self.siphra._regs[reg_name].codec.fields[name].mask
+                bad = [v for v in self.grid[setting] if not 0 <= v <= mask]
+                if bad:
+                    raise ValueError(f"Values {bad} of {setting} do not fit in {mask.bit_length()} bits")
+
+    @property
+    def steps(self):
+        return expand_grid(self.grid)
+
+    def apply(self, params):
+        '''
+        Writes the parameters of one step. Registers already holding the value
+        are not rewritten. Raises ``SIPHRAWriteError`` if a write cannot be verified.
+        '''
+        for setting, value in params.items():
+            if setting in self.setters:
+                self.setters[setting](value)
+                continue
+            name, channels = self._params[setting]
+            for ch in channels:
+                # The step must not be acquired and recorded with a value that is not on the chip.
+                if self.siphra.write_param(name, value, ch=ch, chip=self.chip) != 0:
+                    raise SIPHRAWriteError(chip=self.chip, reg=self.siphra._resolve_param(name, ch)[1])
+
+    def _scan_metadata(self, index, n_steps, params):
+        return {"scan": {
+            "name": self.prefix,
+            "step": index,
+            "n_steps": n_steps,
+            "chip": self.chip,
+            "parameters": params,
+            "register_image": [f"0x{w:08x}" for w in self.siphra.image(self.chip)],
+        }}
+
+    def run(self, verbose=True):
+        '''
+        Runs all the steps and returns one row per step with its parameters,
+        files, exposure and the summary returned by the processor (or the
+        error it raised). The table is also written to ``<prefix>_scan.csv``,
+        with the steps completed so far if the scan is interrupted by an error.
+        '''
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        steps = self.steps
+        rows, futures = [], []
+        t_start = time.monotonic()
+        try:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                try:
+                    for index, params in enumerate(steps):
+                        self.apply(params)
+                        time.sleep(self.settle_sec)
+                        output_base = self.output_dir / step_name(index, self.prefix, params)
+                        exposure = self.acquirer(output_base, self.counts)
+                        write_metadata(output_base, exposure,
+                                       argparse.Namespace(counts=self.counts, **self.metadata),
+                                       extra=self._scan_metadata(index, len(steps), params))
+
+                        dat_file = output_base.with_suffix('.dat')
+                        # Processed while the next step is acquired
+                        futures.append(executor.submit(self.processor, dat_file))
+                        rows.append({'step': index, **params, 'data_file': str(dat_file), 'exposure_sec': exposure})
+                        if verbose:
+                            pending = sum(not f.done() for f in futures)
+                            settings = ', '.join(f"{s}={v}" for s, v in params.items())
+                            print(f"[{index + 1}/{len(steps)}] {settings}: {exposure:,.1f} s acquired, "
+                                  f"{pending} step(s) being processed")
+                finally:
+                    # Steps already acquired are processed and reported even if a later one fails
+                    for row, future in zip(rows, futures):
+                        try:
+                            row.update(future.result())
+                            row['status'] = 'ok'
+                        except Exception as e:
+                            row.update(status='failed', error=repr(e))
+        finally:
+            results = pd.DataFrame(rows)
+            results.to_csv(self.output_dir / f"{self.prefix}_scan.csv", index=False)
+
+        if verbose:
+            print(f"Scan done in {time.monotonic() - t_start:,.1f} s "
+                  f"({results['exposure_sec'].sum():,.1f} s of acquisition).")
+        return results
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Scan SIPHRA parameters: configure, acquire with dma_to_raw_file, convert and summarise every step."
+    )
+    parser.add_argument("-o", "--output-dir", required=True, type=Path,
+                        help="Directory of the scan files.")
+    parser.add_argument("--prefix", default="scan",
+                        help="Name of the scan, used in the file names. Default: scan")
+    parser.add_argument("-p", "--param", nargs="+", action="append", required=True, metavar=("SETTING", "VALUE"),
+                        help="Setting and values to scan, e.g. -p qc_threshold[2,4] 10 20 30 -p cmis_detector_voffset 0 127. "
+                             "Can be repeated; all combinations are acquired, the last setting varying fastest.")
+    parser.add_argument("-c", "--counts", type=int, default=100_000,
+                        help="Number of events acquired at every step.")
+    parser.add_argument("--chip", default="A", choices=["A", "B", "C", "D"],
+                        help="SIPHRA whose registers are scanned. Default: A")
+    parser.add_argument("--config", type=Path, default=None,
+                        help="Binary configuration file uploaded to the chip before the scan.")
+    parser.add_argument("--cry", type=int, default=0,
+                        help="Crystal code used for the conversion. Default: 0")
+    parser.add_argument("--sb", "--subtract-baselines", action="store_true",
+                        help="Subtract the baselines when converting.")
+    parser.add_argument("--settle", type=float, default=0.,
+                        help="Seconds waited after writing the registers of a step. Default: 0")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Background processes converting and summarising the steps. Default: 1")
+    parser.add_argument("--active-chs", nargs="*", type=int, default=[],
+                        help="SIPHRA active channels, as in acquire.py.")
+    parser.add_argument("--sipm-chs", nargs="*", default='',
+                        help="Configuration of SIPM channels, as in acquire.py.")
+    parser.add_argument("--source", type=str, default='[NOT SPECIFIED]')
+    parser.add_argument("--source-description", type=str, default='[NOT SPECIFIED]')
+    parser.add_argument("--notes", type=str, default='[NONE]')
+    parser.add_argument("--siphra-config-file", type=str, default='D2a/Ongoing.txt',
+                        help="Text file whose first line is stored in the metadata, as in acquire.py.")
+    parser.add_argument("-s", "--size", type=int, default=4095,
+                        help="[DO NOT CHANGE UNLESS CHANGING dma_to_raw_file SETTINGS]. Block size. Default is 4095.")
+    parser.add_argument("--device", default="/dev/D2A_DMA",
+                        help="[DO NOT CHANGE UNLESS CHANGING dma_to_raw_file SETTINGS].")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    grid = {}
+    for setting, *values in args.param:
+        if not values:
+            sys.exit(f"No values given for {setting}")
+        grid[setting] = [int(v, 0) for v in values]
+
+    siphra = SIPHRA()
+    if args.config is not None:
+        for report in siphra.upload_config(readImageFile(args.config), chip=args.chip):
+            if report.failed:
+                raise SIPHRAWriteError(chip=report.chip, reg=report.failed[0])
+    metadata = {key: getattr(args, key) for key in METADATA_DEFAULTS}
+    scan = ParameterScan(siphra, grid, args.output_dir, prefix=args.prefix, counts=args.counts, chip=args.chip,
+                         acquirer=DmaAcquirer(args.device, args.size),
+                         processor=partial(process_step, crystal_code=args.cry, subtract_baselines=args.sb),
+                         settle_sec=args.settle, max_workers=args.workers, metadata=metadata)
+    results = scan.run()
+    print(results.drop(columns=['data_file', 'csv_file'], errors='ignore').to_string(index=False))
+
+
+if __name__ == "__main__":
+    main()
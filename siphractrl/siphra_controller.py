@@ -2,9 +2,13 @@ from unittest import case
 
 from .d2a_lib import *
 from .regs_bit_structure import *
+from .regs_codec import compile_register, image_from_bytes, image_to_bytes
 from collections import namedtuple
+from pathlib import Path
+import numpy as np
 
 CH_ADDRS = []
+CHIPS = ['A', 'B', 'C', 'D']
 SIPHRA_RETURN_SIZE = 15 # bytes. Returned by SIPHRA when D2a.readSIPHRA is called
 # TODO: Check the size of the packet returned by D2a.readSIPHRA
 REG_SIZE = 4 # bytes. Size of the bytearray passed to D2a.writeSIPHRA
@@ -19,6 +23,7 @@ class SIPHRARegister:
         self.fields = self.structure.subcon.subcons # Includes padding
         self.field_names = [field.name for field in self.fields if field.name]
         self.size = sum([field.sizeof() for field in self.fields if field.name]) # Number of significant bits in the register
+        self.codec = compile_register(structure) # Field shifts and masks, used instead of construct parse/build
 
     def __getitem__(self, idx):
         '''Returns the name and bit-size of a given field. Index 0 is the padding.'''
@@ -34,23 +39,37 @@ class SIPHRARegister:
 
     def __contains__(self, field_name):
         '''True if the register has a field named ``field_name``.'''
-        return field_name in self.field_names
+        return field_name in self.codec
 
     def parse(self, value):
-        return self.structure.parse(value)
+        '''Dictionary with the value of every field, as ``structure.parse`` returns.'''
+        return self.codec.decode(value)
+
+    def get_param(self, param_name, content):
+        return self.codec.get(content, param_name)
 
     def set_param(self, param_name, value, current_content):
-        reg_content = parse(current_content)
-        reg_content[param_name] = value
-        return self.structure.build(reg_content)
+        return self.codec.set(current_content, param_name, value)
 
 class SIPHRA:
-    def __init__(self):
-        self._d2a = D2a()
+    '''
+    Register-level access to the SIPHRA ASICs of a D2a board.
+
+    A shadow copy of the registers of every chip is kept in memory. Registers are read over SPI the first time they
+    are needed (or all at once with :meth:`fill_shadow`), the copy is updated after every verified write and it is
+    discarded when a chip is reset. Reads and read-modify-write operations are then served from memory; pass
+    ``force=True`` to read the hardware instead.
+
+    ``backend`` selects the devices of the D2a board (see ``d2a_lib.HardwareBackend``), e.g.
+    ``d2a_backend.SimulatedBackend()`` to run without the hardware.
+    '''
+    def __init__(self, backend=None):
+        self._d2a = D2a(backend=backend)
         self._regs = {}
+        self._shadow = {chip: {} for chip in CHIPS} # chip -> {addr: 4-byte register content}
 
         for i in range(1, 17):
-            self._regs[f"ch{i}"] = SIPHRARegister(i, CHANNEL)
+            self._regs[f"ch{i}"] = SIPHRARegister(i - 1, CHANNEL)
 
         self._regs["ch17"] = SIPHRARegister(0x10, SUM_CHANNEL)
         self._regs["ch_config"] = SIPHRARegister(0x11, CHANNEL_CONFIG)
@@ -62,6 +81,11 @@ class SIPHRA:
         self._regs["readout_list"] = SIPHRARegister(0x17, READOUT_FIXED_LIST)
         self._regs["readout_mode"] = SIPHRARegister(0x18, READOUT_MODE)
 
+        # Lookup tables: address -> register name and parameter -> register name. For parameters present in
+        # several registers (channel fields), the last register wins, as in a scan of ``_regs``.
+        self._addr_index = {reg.addr: name for name, reg in self._regs.items()}
+        self._param_index = {param: name for name, reg in self._regs.items() for param in reg.field_names}
+
     def _resolve_reg_id(self, reg_id: str | int) -> tuple[str, int]:
         """Resolves a register name or address to a (name, addr) tuple."""
         match reg_id:
@@ -69,9 +93,8 @@ class SIPHRA:
                 if reg_id in self._regs:
                     return reg_id, self._regs[reg_id].addr
             case int():
-                for name, reg in self._regs.items():
-                    if reg.addr == reg_id:
-                        return name, reg_id
+                if reg_id in self._addr_index:
+                    return self._addr_index[reg_id], reg_id
             case _:
                 raise TypeError(f"reg_id must be str or int, got {type(reg_id).__name__}")
         raise ValueError(f"{reg_id!r} is not a valid register id")
@@ -88,61 +111,147 @@ class SIPHRA:
         if not 0 <= ch <= 17:
             raise ValueError(f"Channel {ch} is out of range. Use channels 1-16 and 17 for summing channel")
         if ch == 0: # Not a channel register
-            for n, reg in self._regs.items():
-                if parameter in reg:
-                    name = n
-                    addr = reg.addr
+            name = self._param_index.get(parameter)
+            addr = None if name is None else self._regs[name].addr
         else: # Channel register
             # Verify that the given field exists
             reg = self._regs[f"ch{ch}"]
             if parameter in reg:
                 addr = reg.addr
                 name = f"ch{ch}"
-        if not addr:
+        if addr is None:
             raise NameError(f"Parameter {parameter} does not exist or the register containing it is not implemented.")
         return name, addr
 
-    def get_reg_value(self, reg_id, chip='A'):
-        _, addr = self._resolve_reg_id(reg_id)
-        return self._d2a.readSIPHRA(addr, chip)
+    @staticmethod
+    def _chips(chip):
+        return CHIPS if chip == 'All' else [chip]
+
+    def fill_shadow(self, chip='A'):
+        '''Reads every register of ``chip`` (all the addresses of SIPHRA_REG_LENS) over SPI into the shadow copy.'''
+        for c in self._chips(chip):
+            for addr in range(len(SIPHRA_REG_LENS)):
+                self._shadow[c][addr] = bytes(self._d2a.readSIPHRA(addr, c))
+
+    def invalidate_shadow(self, chip='All', reg_id=None):
+        '''Forgets the shadow copy of one register (``reg_id``) or of all the registers of ``chip``.'''
+        for c in self._chips(chip):
+            if reg_id is None:
+                self._shadow[c].clear()
+            else:
+                self._shadow[c].pop(self._resolve_reg_id(reg_id)[1], None)
+
+    def reset(self, chip='All'):
+        '''Resets ``chip``. Its registers return to their power-on values, so its shadow copy is discarded.'''
+        self._d2a.reset(chip)
+        self.invalidate_shadow(chip)
+
+    def upload_config(self, image, chip='A', force_read=False):
+        '''
+        Brings ``chip`` to the register image ``image`` (a binary configuration
+        file, a list of four-byte values indexed by address or an array of 32-bit
+        words as built by ``regs_codec.encode_images``), writing only the
+        registers whose content differs from the shadow copy; registers missing
+        from it, or all of them if ``force_read``, are read back first. Writes are
+        verified in one batch (see ``D2a.uploadSIPHRAimage``).
+
+        Returns the list of ``UploadReport`` of the chips, with the time spent.
+        '''
+        if isinstance(image, (str, Path)):
+            vals = readImageFile(image)
+        elif isinstance(image, np.ndarray):
+            vals = image_to_bytes(image)
+        else:
+            vals = [bytes(v) for v in image]
+        reports = []
+        for c in self._chips(chip):
+            report = self._d2a.uploadSIPHRAimage(vals, c, current=None if force_read else self._shadow[c])
+            for addr, val in enumerate(vals):
+                self._shadow[c][addr] = bytes(val)
+            for addr in report.failed:
+                self._shadow[c].pop(addr, None) # State of the register unknown
+            reports.append(report)
+        return reports
+
+    def image(self, chip='A', force=False):
+        '''
+        Registers of ``chip`` as an array of 32-bit words indexed by address (see
+        ``regs_codec``), for every address of a configuration file (SIPHRA_REG_LENS),
+        including those without a bit structure.
+        '''
+        return image_from_bytes([self.get_reg_value(addr, chip=chip, force=force)
+                                 for addr in range(len(SIPHRA_REG_LENS))])
+
+    def save_config(self, filename, chip='A', force=False):
+        '''Stores the registers of ``chip`` as a binary configuration file, to be loaded with :meth:`upload_config`.'''
+        writeImageFile(filename, image_to_bytes(self.image(chip, force=force)))
+
+    def get_reg_value(self, reg_id, chip='A', force=False):
+        '''
+        Content of a register: from the shadow copy if available, otherwise (or if ``force``) read over SPI.
+        Any address of SIPHRA_REG_LENS is accepted, also those without a bit structure.
+        '''
+        if isinstance(reg_id, int) and 0 <= reg_id < len(SIPHRA_REG_LENS):
+            addr = reg_id
+        else:
+            _, addr = self._resolve_reg_id(reg_id)
+        shadow = self._shadow[chip] if chip in self._shadow else {}
+        if force or addr not in shadow:
+            value = bytes(self._d2a.readSIPHRA(addr, chip))
+            if chip in self._shadow:
+                self._shadow[chip][addr] = value
+            return value
+        return shadow[addr]
 
-    def read_register(self, reg_id, chip='A'):
-        name, addr = self._resolve_reg_id(reg_id)
-        reg_value = self._d2a.readSIPHRA(addr, chip)
+    def read_register(self, reg_id, chip='A', force=False):
+        name, _ = self._resolve_reg_id(reg_id)
+        reg_value = self.get_reg_value(name, chip=chip, force=force)
         return self._regs[name].parse(reg_value)
 
     def write_register(self, reg_id, value, chip='A'):
         _, addr = self._resolve_reg_id(reg_id)
         try:
-            self._d2a.writeSIPHRAwithCheck(addr, chip, value)
+            self._d2a.writeSIPHRAwithCheck(value, addr, chip)
         except Exception as e:
             print(e)
+            self.invalidate_shadow(chip, addr) # State of the register unknown
             return -1
+        for c in self._chips(chip):
+            self._shadow[c][addr] = bytes(value)
         return 0
 
-    def read_param(self, parameter, ch=0, reg_id=None, chip='A'):
-        '''``reg_id`` can be the register name or its address'''
-        if reg_id:
+    def _resolve_param(self, parameter, ch=0, reg_id=None):
+        if reg_id is not None:
             name, addr = self._resolve_reg_id(reg_id)
-            if not parameter in _regs[name]:
+            if not parameter in self._regs[name]:
                 raise NameError(f"Parameter {parameter} does not exist in register {reg_id}.")
-        else:
-            name, addr = self._find_reg_containing_param(parameter, ch)
+            return name, addr
+        return self._find_reg_containing_param(parameter, ch)
 
-        return  self.read_register(name, chip=chip)[parameter]
-
-    def write_param(self, parameter, value, ch=0, reg_id=None, chip='A'):
-        if reg_id:
-            name, addr = self._resolve_reg_id(reg_id)
-            if not parameter in _regs[name]:
-                raise NameError(f"Parameter {parameter} does not exist in register {reg_id}.")
-        else:
-            name, addr = self._find_reg_containing_param(parameter, ch)
+    def read_param(self, parameter, ch=0, reg_id=None, chip='A', force=False):
+        '''``reg_id`` can be the register name or its address'''
+        name, _ = self._resolve_param(parameter, ch, reg_id)
+        return self._regs[name].get_param(parameter, self.get_reg_value(name, chip=chip, force=force))
 
+    def write_param(self, parameter, value, ch=0, reg_id=None, chip='A', force=False):
+        '''
+        Changes one field of a register, keeping the others. The current content
+        is taken from the shadow copy unless ``force`` is true, and nothing is
+        written if the field already has ``value``. With ``chip='All'`` every chip
+        is compared with its own shadow copy; the write is broadcast only if all
+        the chips hold the same content.
+        '''
+        name, _ = self._resolve_param(parameter, ch, reg_id)
         reg = self._regs[name]
-        old_value = self.get_reg_value(reg_id, chip=chip)
-        new_value = reg.set_param(parameter, value, old_value)
-        self.write_register(name, new_value, chip=chip)
+        old_values = {c: self.get_reg_value(name, chip=c, force=force) for c in self._chips(chip)}
+        new_values = {c: reg.set_param(parameter, value, old) for c, old in old_values.items()}
+        changed = [c for c in new_values if new_values[c] != old_values[c]]
+        if not changed:
+            return 0
+        if len(set(old_values.values())) == 1:
+            return self.write_register(name, new_values[changed[0]], chip=chip)
+        status = [self.write_register(name, new_values[c], chip=c) for c in changed]
+        return -1 if -1 in status else 0
 
 
 
@@ -0,0 +1,313 @@
+# *****************************************************************************
+# Description: Automatic tuning of the qc_threshold of the SIPHRA channels.
+# Each channel is tuned on its own, with triggering disabled on all the
+# others: its threshold is binary-searched for the lowest value whose noise
+# trigger rate does not exceed a target rate. Rates come from short
+# acquisitions with dma_to_raw_file, from counting the events of a running
+# acquisition, or from the noise model of the simulated board. The thresholds
+# found are written through the register layer and recorded in a binary
+# configuration file and a json metadata file (see acquire.py --tuning-file).
+# Usage: python path/to/siphractrl/threshold_tuning.py --target-rate 10 [options]
+#        (run from the directory of dma_to_raw_file, as acquire.py; from the project
+#        root, ``python -m siphractrl.threshold_tuning`` works too)
+#....
+#   Date: 10/2026
+
+import argparse
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timezone
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+try:
+    from .d2a_backend import SimulatedBackend
+    from .d2a_lib import SIPHRAWriteError
+    from .siphra_controller import SIPHRA, CHIPS
+except ImportError: # Run as a script, e.g. from the directory of dma_to_raw_file
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from siphractrl.d2a_backend import SimulatedBackend
+    from siphractrl.d2a_lib import SIPHRAWriteError
+    from siphractrl.siphra_controller import SIPHRA, CHIPS
+
+THRESHOLD_MAX = 255 # qc_threshold is 8 bits wide
+
+
+class ChannelTuning(namedtuple('ChannelTuning', ['channel', 'threshold', 'rate_hz', 'converged', 'measurements'])):
+    '''
+    Result of the tuning of one channel: the threshold found, the rate measured
+    there, whether that rate is within the target (False if even the highest
+    threshold searched is too noisy) and the (threshold, rate) measurements.
+    '''
+
+
+def _count_events(dat_file, chip):
+    '''Internal-trigger events of the crystal read out by ``chip`` in a '.dat' file.'''
+    sys.path.insert(0, str(PROJECT_ROOT))
+    from processing.datstream import DatTail, select_events
+    tail = DatTail(dat_file)
+    n_events = 0
+    while len(rows := tail.read_new()):
+        n_events += len(select_events(rows, CHIPS.index(chip)))
+    return n_events
+
+
+class AcquisitionRateSource:
+    '''
+    Trigger rate of a chip from a short acquisition with dma_to_raw_file,
+    stopped after ``counts`` events or ``max_sec`` seconds, whichever comes
+    first. With ``counts = target rate * max_sec``, an acquisition stopped by
+    the time limit means a rate under the target and a complete one a rate above it.
+    '''
+    def __init__(self, counts=1000, max_sec=5., device="/dev/D2A_DMA", size=4095, work_dir=None):
+        self.counts = counts
+        self.max_sec = max_sec
+        self.device = device
+        self.size = size
+        self.work_dir = Path(work_dir or tempfile.mkdtemp(prefix='siphra_tuning_'))
+
+    def __call__(self, chip):
+        dat_file = self.work_dir / f"rate_{chip}.dat"
+        dat_file.unlink(missing_ok=True)
+        cmd = ["./dma_to_raw_file", "-i", self.device, "-o", str(dat_file), "-s", str(self.size),
+               "-c", str(self.counts), "-b"]
+        start = time.time()
+        try:
+            subprocess.run(cmd, check=True, timeout=self.max_sec, stdout=subprocess.DEVNULL)
+        except subprocess.TimeoutExpired:
+            pass
+        elapsed = time.time() - start
+        return _count_events(dat_file, chip) / elapsed if dat_file.exists() else 0.
+
+
+class LiveRateSource:
+    '''
+    Trigger rate of a chip counted from the '.dat' file of an acquisition kept
+    running during the tuning: events appended during ``duration`` seconds,
+    after discarding those written before the measurement started.
+    '''
+    def __init__(self, dat_file, duration=1.):
+        sys.path.insert(0, str(PROJECT_ROOT))
+        from processing.datstream import DatTail, select_events
+        self._select_events = select_events
+        self.tail = DatTail(dat_file)
+        self.duration = duration
+
+    def _drain(self, chip):
+        n_events = 0
+        while len(rows := self.tail.read_new()):
+            n_events += len(self._select_events(rows, CHIPS.index(chip)))
+        return n_events
+
+    def __call__(self, chip):
+        self._drain(chip)
+        start = time.monotonic()
+        time.sleep(self.duration)
+        n_events = self._drain(chip)
+        return n_events / (time.monotonic() - start)
+
+
+class SimulatedRateSource:
+    '''Trigger rate of a chip of a ``SimulatedBackend``, counted over ``duration`` simulated seconds.'''
+    def __init__(self, backend, duration=1.):
+        self.backend = backend
+        self.duration = duration
+
+    def __call__(self, chip):
+        return self.backend.count_triggers(chip, self.duration) / self.duration
+
+
+class ThresholdTuner:
+    '''
+    Binary search of the qc_threshold of the ``channels`` of ``chip`` (1-16,
+    17 for the summing channel) towards ``target_rate`` noise triggers per
+    second. ``rate_source(chip)`` measures the trigger rate of the chip with
+    the current settings. ``margin`` is added to the thresholds found.
+    '''
+    def __init__(self, siphra, rate_source, target_rate, chip='A', channels=None, lo=0, hi=THRESHOLD_MAX,
+                 margin=0, settle_sec=0.):
+        self.siphra = siphra
+        self.rate_source = rate_source
+        self.target_rate = target_rate
+        self.chip = chip
+        self.channels = list(channels or range(1, 17))
+        self.lo, self.hi = lo, hi
+        self.margin = margin
+        self.settle_sec = settle_sec
+
+    def _write(self, parameter, value, ch):
+        '''write_param, raising SIPHRAWriteError if the value could not be verified on the chip.'''
+        if self.siphra.write_param(parameter, value, ch=ch, chip=self.chip) != 0:
+            raise SIPHRAWriteError(chip=self.chip, reg=self.siphra._resolve_param(parameter, ch)[1])
+
+    def measure(self, ch, threshold):
+        self._write('qc_threshold', threshold, ch)
+        time.sleep(self.settle_sec)
+        return self.rate_source(self.chip)
+
+    def tune_channel(self, ch):
+        '''
+        Lowest threshold of channel ``ch`` whose rate is at most the target,
+        assuming the rate decreases with the threshold. Only ``ch`` must have
+        triggering enabled.
+        '''
+        lo, hi = self.lo, self.hi
+        measurements = {}
+        while lo < hi:
+            mid = (lo + hi) // 2
+            measurements[mid] = self.measure(ch, mid)
+            if measurements[mid] <= self.target_rate:
+                hi = mid
+            else:
+                lo = mid + 1
+        if lo not in measurements: # End of the range, never measured
+            measurements[lo] = self.measure(ch, lo)
+        rate = measurements[lo]
+        return ChannelTuning(ch, lo, rate, rate <= self.target_rate, sorted(measurements.items()))
+
+    def run(self, verbose=True):
+        '''
+        Tunes every channel and writes the thresholds found (plus ``margin``).
+        Triggering is enabled on one channel at a time during the search and
+        restored to its previous state afterwards. If the tuning fails (e.g. a
+        register write cannot be verified), the thresholds of the channels
+        searched so far are restored too, and the error is raised. Returns the
+        ``ChannelTuning`` of the channels.
+        '''
+        triggering = {ch: self.siphra.read_param('enable_triggering', ch=ch, chip=self.chip) for ch in range(1, 18)}
+        thresholds = {ch: self.siphra.read_param('qc_threshold', ch=ch, chip=self.chip) for ch in self.channels}
+        results, searched = [], []
+        try:
+            for ch in triggering:
+                self._write('enable_triggering', False, ch)
+            for ch in self.channels:
+                searched.append(ch)
+                self._write('enable_triggering', True, ch)
+                result = self.tune_channel(ch)
+                self._write('enable_triggering', False, ch)
+                results.append(result)
+                if verbose:
+                    print(f"Ch{ch}: threshold {result.threshold:3d}, {result.rate_hz:10.2f} Hz "
+                          f"({len(result.measurements)} measurements){'' if result.converged else ' NOT CONVERGED'}")
+            for result in results:
+                self._write('qc_threshold', min(result.threshold + self.margin, THRESHOLD_MAX), result.channel)
+        except BaseException:
+            # Best effort: the original error is the one raised.
+            for ch in searched:
+                self.siphra.write_param('qc_threshold', thresholds[ch], ch=ch, chip=self.chip)
+            raise
+        finally:
+            for ch, enabled in triggering.items():
+                self.siphra.write_param('enable_triggering', enabled, ch=ch, chip=self.chip)
+        return results
+
+    def metadata(self, results, config_file=None):
+        '''Record of a tuning, stored as the "threshold_tuning" section of the acquisition metadata.'''
+        return {
+            "timestamp_utc": datetime.now(timezone.utc).isoformat(),
+            "chip": self.chip,
+            "target_rate_hz": self.target_rate,
+            "rate_source": type(self.rate_source).__name__,
+            "margin": self.margin,
+            "config_file": None if config_file is None else str(config_file),
+            "channels": {
+                str(r.channel): {
+                    "qc_threshold": min(r.threshold + self.margin, THRESHOLD_MAX),
+                    "rate_hz": r.rate_hz,
+                    "converged": r.converged,
+                    "measurements": [[thr, rate] for thr, rate in r.measurements],
+                } for r in results
+            },
+        }
+
+
+def write_tuning_metadata(json_file, tuning):
+    with open(json_file, "w") as f:
+        json.dump({"schema-version": "1.0", "threshold_tuning": tuning}, f, indent=4)
+
+
+def parse_channels(text):
+    '''``'1-16'``, ``'2,4,6'`` or ``'1-8,17'``.'''
+    channels = []
+    for part in text.split(','):
+        first, _, last = part.strip().partition('-')
+        channels.extend(range(int(first), int(last or first) + 1))
+    return channels
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Tune the qc_threshold of SIPHRA channels towards a target noise trigger rate."
+    )
+    parser.add_argument("--target-rate", type=float, required=True,
+                        help="Noise trigger rate, in Hz, allowed per channel.")
+    parser.add_argument("--chip", default="A", choices=CHIPS,
+                        help="SIPHRA to tune. Default: A")
+    parser.add_argument("--channels", type=parse_channels, default=list(range(1, 17)),
+                        help="Channels to tune, e.g. 1-16 or 2,4,6 (17: summing channel). Default: 1-16")
+    parser.add_argument("--margin", type=int, default=0,
+                        help="Added to the thresholds found. Default: 0")
+    parser.add_argument("--config", type=Path, default=None,
+                        help="Binary configuration file uploaded to the chip before tuning.")
+    parser.add_argument("--save-config", type=Path, default=None,
+                        help="Binary configuration file written with the tuned registers.")
+    parser.add_argument("-o", "--output", type=Path, default=Path("threshold_tuning.json"),
+                        help="Json file recording the tuning. Default: threshold_tuning.json")
+    parser.add_argument("--rate-source", choices=["acquisition", "live", "simulated"], default="acquisition",
+                        help="acquisition: short runs of dma_to_raw_file; live: count events of the running "
+                             "acquisition given with --live-file; simulated: simulated board. Default: acquisition")
+    parser.add_argument("--live-file", type=Path, default=None,
+                        help="\'.dat\' file being written by a running acquisition (with --rate-source live).")
+    parser.add_argument("--duration", type=float, default=2.,
+                        help="Seconds per rate measurement (longest acquisition with --rate-source acquisition). "
+                             "Default: 2")
+    parser.add_argument("--counts", type=int, default=None,
+                        help="Events ending a measurement acquisition early. Default: the target rate times "
+                             "the duration, so that a complete acquisition means a rate above the target")
+    parser.add_argument("--settle", type=float, default=0.,
+                        help="Seconds waited after every threshold change. Default: 0")
+    parser.add_argument("-s", "--size", type=int, default=4095,
+                        help="[DO NOT CHANGE UNLESS CHANGING dma_to_raw_file SETTINGS]. Block size. Default is 4095.")
+    parser.add_argument("--device", default="/dev/D2A_DMA",
+                        help="[DO NOT CHANGE UNLESS CHANGING dma_to_raw_file SETTINGS].")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.rate_source == "simulated":
+        backend = SimulatedBackend()
+        rate_source = SimulatedRateSource(backend, args.duration)
+    elif args.rate_source == "live":
+        if args.live_file is None:
+            sys.exit("--rate-source live needs --live-file")
+        backend = None
+        rate_source = LiveRateSource(args.live_file, args.duration)
+    else:
+        backend = None
+        counts = args.counts or max(int(args.target_rate * args.duration), 1)
+        rate_source = AcquisitionRateSource(counts, args.duration, args.device, args.size)
+
+    siphra = SIPHRA(backend=backend)
+    if args.config is not None:
+        for report in siphra.upload_config(args.config, chip=args.chip):
+            if report.failed:
+                raise SIPHRAWriteError(chip=report.chip, reg=report.failed[0])
+    tuner = ThresholdTuner(siphra, rate_source, args.target_rate, chip=args.chip, channels=args.channels,
+                           margin=args.margin, settle_sec=args.settle)
+    t_start = time.monotonic()
+    results = tuner.run()
+    if args.save_config is not None:
+        siphra.save_config(args.save_config, chip=args.chip)
+    write_tuning_metadata(args.output, tuner.metadata(results, args.save_config))
+    print(f"\nTuned {len(results)} channel(s) of SIPHRA {args.chip} in {time.monotonic() - t_start:,.1f} s."
+          f"\n\tRecorded in: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
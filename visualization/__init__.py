@@ -1,3 +1,24 @@
-from .hist_view import COLORS, hist_quickShow
+# ``report`` is resolved on first access (PEP 562), so that importing the
+# viewers does not load pandas and the processing package.
+import importlib
 
-__all__ = ['COLORS', 'hist_quickShow']
\ No newline at end of file
+from .hist_view import COLORS, hist_quickShow, pyramid_th1
+
+_exports = {
+    "render_report": ".report",
+    "render_run": ".report",
+}
+
+__all__ = ['COLORS', 'hist_quickShow', 'pyramid_th1'] + list(_exports)
+
+
+def __getattr__(name):
+    if name in _exports:
+        value = getattr(importlib.import_module(_exports[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,21 +1,54 @@
-import ROOT
+# ROOT EColor values, so that importing this module does not load ROOT.
+kRed, kGreen, kCyan, kMagenta, kOrange, kAzure, kGray = 632, 416, 432, 616, 800, 860, 920
 
 # COLORS = [ROOT.kRed, ROOT.kBlue, ROOT.kGreen, ROOT.kOrange, ROOT.kAzure, ROOT.kSpring, ROOT.kPink, ROOT.kMagenta, ROOT.kTeal, ROOT.kYellow, ROOT.kViolet, ROOT.kCyan]
 
-COLORS = [ROOT.kAzure-7, ROOT.kOrange+1, ROOT.kRed-7, ROOT.kCyan-5, ROOT.kGreen-5, ROOT.kOrange-4, ROOT.kMagenta-5, ROOT.kRed-9, ROOT.kOrange-7, ROOT.kGray+1]
+COLORS = [kAzure-7, kOrange+1, kRed-7, kCyan-5, kGreen-5, kOrange-4, kMagenta-5, kRed-9, kOrange-7, kGray+1]
 
-def hist_quickShow(hists, color_offset=0, tone_offset=0):
+def pyramid_th1(source, item='s', nbins=None, hist_range=None, name=None, title=None):
+    '''
+    ROOT ``TH1D`` of a channel or 'Summed' with any binning, taken from the
+    histogram pyramid of ``source`` (a ``SiphraAcquisition`` or a
+    ``HistogramPyramid``) instead of re-histogramming the data.
+    '''
+    from analysis.spectrum import Spectrum
+
+    pyramid = source.histogram_pyramid() if hasattr(source, 'histogram_pyramid') else source
+    counts, edges = pyramid.histogram(item, nbins, hist_range)
+    name = name or f"{getattr(source, 'name', None) or 'pyramid'}_{item}_{len(counts)}"
+    return Spectrum.from_counts(counts, edges, name).to_th1(title=title)
+
+
+def hist_quickShow(hists, color_offset=0, tone_offset=0, canvas_name='cv', batch=False, output=None,
+                   nbins=None, hist_range=None):
+    '''
+    Draws ``hists`` on one canvas with log y. Only a previous canvas with the
+    same ``canvas_name`` is closed, so several canvases can coexist. With
+    ``batch``, ROOT draws off screen; ``output`` saves the canvas to a file
+    (the format is taken from the extension, e.g. '.png' or '.pdf').
+
+    Besides ROOT histograms, ``hists`` may contain ``(source, item)`` pairs,
+    e.g. ``(acquisition, 's')``, drawn with ``nbins`` bins over ``hist_range``
+    from the histogram pyramid of the source (see :func:`pyramid_th1`).
+    '''
+    import ROOT
+
+    hists = [pyramid_th1(*hist, nbins=nbins, hist_range=hist_range) if isinstance(hist, tuple) else hist
+             for hist in hists]
+
+    was_batch = ROOT.gROOT.IsBatch() # Batch mode is global: restored once the canvas is drawn
+    if batch:
+        ROOT.gROOT.SetBatch(True)
     l_colors = len(COLORS)
-    if ROOT.gROOT.FindObject('cv'):
-        ROOT.gROOT.FindObject('cv').Close()
+    if ROOT.gROOT.FindObject(canvas_name):
+        ROOT.gROOT.FindObject(canvas_name).Close()
 
-    cv = ROOT.TCanvas('cv', 'cv', 800, 600)
+    cv = ROOT.TCanvas(canvas_name, canvas_name, 800, 600)
 
     ROOT.gStyle.SetOptStat(11)
     ROOT.gStyle.SetStatFontSize(0.03)
     ROOT.gStyle.SetStatW(0.16)
 
-    list(hists)
     counter = 0
 
     for hist in hists:
@@ -27,4 +60,7 @@ def hist_quickShow(hists, color_offset=0, tone_offset=0):
         counter += 1
     cv.SetLogy()
     cv.Draw()
+    if output is not None:
+        cv.SaveAs(str(output))
+    ROOT.gROOT.SetBatch(was_batch)
     return cv
\ No newline at end of file
@@ -0,0 +1,300 @@
+# *****************************************************************************
+#   Description: Headless batch rendering of per-run report panels (spectra,
+#   timing, hit map) to PNG/PDF. Runs are rendered in parallel on worker
+#   processes with matplotlib (Agg) or ROOT in batch mode, and panels whose
+#   inputs have not changed since the last report are skipped.
+#   Usage: python -m visualization.report OUTPUT_DIR FILE [FILE ...] [options]
+#....
+#   Date: 10/2026
+
+import argparse
+import json
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from processing.acquisitionindex import file_identity, identity_key
+
+PANELS = ('spectrum', 'timing', 'hitmap')
+BACKENDS = ('matplotlib', 'root')
+RENDERER_VERSION = 1 # Increase to re-render all the panels after changing their appearance
+STAMP_NAME = "stamps.json"
+
+
+# ---------- Panel data (cached in the acquisition index) ----------
+
+def _panel_data(acquisition, panel, options):
+    if panel == 'spectrum':
+        cube = acquisition.spectrum_cube(nbins=options['nbins'])
+        channels = acquisition.active_chs or list(range(1, 17))
+        return {'summed': cube.spectrum('s'),
+                'channels': {ch: cube.spectrum(ch) for ch in channels}}
+    if panel == 'timing':
+        stats = acquisition.run_statistics(interval=options['interval'])
+        return {'rate': (stats.rate_counts / options['interval'], stats.rate_edges),
+                'dt': (stats.dt_counts[:-1], stats.dt_seconds), # The last entry counts the overflow
+                'summary': stats.summary}
+    if panel == 'hitmap':
+        return {'image': acquisition.hit_map().image}
+    raise ValueError(f"Unknown panel {panel!r}. Available: {PANELS}")
+
+
+# ---------- Drawing ----------
+
+def _draw_matplotlib(panel, data, title, paths):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    if panel == 'spectrum':
+        fig, (ax_s, ax_c) = plt.subplots(1, 2, figsize=(12, 4.5))
+        counts, edges = data['summed']
+        ax_s.stairs(counts, edges, color='tab:blue')
+        ax_s.set(yscale='log', xlabel='Summed [ADC]', ylabel='Counts', title='Summed')
+        for ch, (counts, edges) in data['channels'].items():
+            ax_c.stairs(counts, edges, label=f'Ch{ch}')
+        ax_c.set(yscale='log', xlabel='Channel [ADC]', ylabel='Counts', title='Channels')
+        ax_c.legend(ncol=2, fontsize='x-small')
+    elif panel == 'timing':
+        fig, (ax_r, ax_dt) = plt.subplots(1, 2, figsize=(12, 4.5))
+        rate, edges = data['rate']
+        ax_r.stairs(rate, edges)
+        ax_r.set(xlabel='Time since first event [s]', ylabel='Rate [1/s]', title='Event rate')
+        counts, dt = data['dt']
+        ax_dt.stairs(counts, dt)
+        filled = np.flatnonzero(counts)
+        if len(filled):
+            ax_dt.set_xlim(0, dt[filled[-1] + 1])
+        ax_dt.set(yscale='log', xlabel='Time between events [s]', ylabel='Counts', title='Inter-event times')
+        s = data['summary']
+        ax_dt.text(0.98, 0.95, f"live fraction {s['live_fraction']:.3f}\ndead time {1e6 * s['dead_time_sec']:.0f} us",
+                   transform=ax_dt.transAxes, ha='right', va='top', fontsize='small')
+    else:
+        fig, ax = plt.subplots(figsize=(5.5, 4.5))
+        im = ax.imshow(data['image'], cmap='viridis')
+        fig.colorbar(im, ax=ax, label='Counts')
+        ax.set(xlabel='Column', ylabel='Row', title='Hit map (Argmax)')
+
+    fig.suptitle(title)
+    fig.tight_layout()
+    for path in paths:
+        fig.savefig(path)
+    plt.close(fig)
+
+
+def _draw_root(panel, data, title, paths):
+    import ROOT
+    from analysis.spectrum import Spectrum
+    from .hist_view import COLORS
+
+    was_batch = ROOT.gROOT.IsBatch()
+    ROOT.gROOT.SetBatch(True)
+    try:
+        name = f"{panel}_{identity_key(title, panel)}"
+        keep = [] # ROOT objects must outlive the drawing
+        if panel == 'spectrum':
+            cv = ROOT.TCanvas(name, title, 1200, 450)
+            cv.Divide(2, 1)
+            cv.cd(1).SetLogy()
+            summed = Spectrum.from_counts(*data['summed'], name=f"{name}_s").to_th1(title=f"{title}: Summed;Summed [ADC];Counts")
+            summed.Draw('hist')
+            cv.cd(2).SetLogy()
+            legend = ROOT.TLegend(0.7, 0.5, 0.95, 0.95)
+            keep += [summed, legend]
+            for k, (ch, (counts, edges)) in enumerate(data['channels'].items()):
+                hist = Spectrum.from_counts(counts, edges, name=f"{name}_ch{ch}").to_th1(
+                    title=f"{title}: Channels;Channel [ADC];Counts")
+                hist.SetLineColor(COLORS[k % len(COLORS)])
+                hist.Draw('hist' if k == 0 else 'hist same')
+                legend.AddEntry(hist, f"Ch{ch}", 'l')
+                keep.append(hist)
+            legend.Draw()
+        elif panel == 'timing':
+            cv = ROOT.TCanvas(name, title, 1200, 450)
+            cv.Divide(2, 1)
+            cv.cd(1)
+            rate, edges = data['rate']
+            hist = Spectrum(rate, rate, edges, f"{name}_rate").to_th1(
+                title=f"{title}: Event rate;Time since first event [s];Rate [1/s]")
+            hist.Draw('hist')
+            cv.cd(2).SetLogy()
+            counts, dt = data['dt']
+            filled = np.flatnonzero(counts)
+            n = filled[-1] + 1 if len(filled) else len(counts)
+            dt_hist = Spectrum.from_counts(counts[:n], dt[:n + 1], f"{name}_dt").to_th1(
+                title=f"{title}: Inter-event times;Time between events [s];Counts")
+            dt_hist.Draw('hist')
+            s = data['summary']
+            text = ROOT.TPaveText(0.6, 0.75, 0.95, 0.9, 'NDC')
+            text.AddText(f"live fraction {s['live_fraction']:.3f}")
+            text.AddText(f"dead time {1e6 * s['dead_time_sec']:.0f} us")
+            text.Draw()
+            keep += [hist, dt_hist, text]
+        else:
+            image = data['image']
+            rows, cols = image.shape
+            hist = ROOT.TH2D(f"{name}_map", f"{title};Column;Row", cols, 0, cols, rows, 0, rows)
+            for r in range(rows):
+                for c in range(cols):
+                    hist.SetBinContent(c + 1, rows - r, image[r, c]) # Row 0 at the top, as in the matplotlib panel
+            cv = ROOT.TCanvas(name, name, 600, 500)
+            ROOT.gStyle.SetOptStat(0)
+            hist.Draw('colz')
+        for path in paths:
+            cv.SaveAs(str(path))
+        cv.Close()
+    finally:
+        ROOT.gROOT.SetBatch(was_batch)
+
+
+# ---------- Stamps ----------
+
+def _stamp(acquisition, panel, options, backend, formats):
+    '''Hash of everything a panel depends on: file identity, corrections and rendering options.'''
+    return identity_key(file_identity(acquisition.filepath), acquisition.corrections_key, panel,
+                        sorted(options.items()), backend, tuple(formats), RENDERER_VERSION)
+
+
+def _run_id(acquisition):
+    '''
+    Name of the report directory of a run: the file stem and a short hash of
+    its directory, so that runs with the same name in different directories
+    do not overwrite each other.
+    '''
+    return f"{acquisition.filepath.stem}-{identity_key(str(acquisition.filepath.resolve().parent))[:8]}"
+
+
+def _load_stamps(run_dir):
+    try:
+        with open(run_dir / STAMP_NAME) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def render_run(acquisition, output_dir, panels=PANELS, formats=('png',), backend='matplotlib', nbins=1024,
+               interval=1., force=False):
+    '''
+    Renders the report panels of one run to ``output_dir/<run id>/<panel>.<format>`` (see :func:`_run_id`).
+
+    A panel is skipped if its stamp (file identity, corrections and options)
+    matches the one stored by the previous rendering and its files exist,
+    unless ``force``. Returns a list of ``(panel, status, paths)`` with status
+    'rendered', 'skipped' or 'failed: <reason>'.
+    '''
+    run_dir = Path(output_dir) / _run_id(acquisition)
+    run_dir.mkdir(parents=True, exist_ok=True)
+    stamps = _load_stamps(run_dir)
+    options = {'nbins': nbins, 'interval': interval}
+    title = acquisition.name or acquisition.filepath.stem
+    draw = _draw_root if backend == 'root' else _draw_matplotlib
+
+    results = []
+    for panel in panels:
+        paths = [run_dir / f"{panel}.{fmt}" for fmt in formats]
+        stamp = _stamp(acquisition, panel, options, backend, formats)
+        if not force and stamps.get(panel) == stamp and all(p.is_file() for p in paths):
+            results.append((panel, 'skipped', paths))
+            continue
+        try:
+            draw(panel, _panel_data(acquisition, panel, options), title, paths)
+        except Exception as e:
+            stamps.pop(panel, None)
+            results.append((panel, f"failed: {e}", paths))
+            continue
+        stamps[panel] = stamp
+        results.append((panel, 'rendered', paths))
+
+    with open(run_dir / STAMP_NAME, 'w') as f:
+        json.dump(stamps, f, indent=2)
+    return results
+
+
+def render_report(acquisitions, output_dir, panels=PANELS, formats=('png',), backend='matplotlib', nbins=1024,
+                  interval=1., force=False, max_workers=None):
+    '''
+    Renders the report panels of many runs in parallel (one run per task) and
+    writes an ``index.html`` linking all the PNG panels.
+
+    Parameters
+    ----------
+    acquisitions : list of SiphraAcquisition
+    output_dir : str or Path
+    panels : tuple of str
+        Any of 'spectrum' (Summed and channel spectra), 'timing' (event rate and
+        inter-event times) and 'hitmap' (Argmax hit map).
+    formats : tuple of str
+        File formats, e.g. ``('png', 'pdf')``.
+    backend : str
+        'matplotlib' (Agg) or 'root' (batch mode).
+    nbins, interval :
+        Number of bins of the spectra and width, in seconds, of the rate bins.
+    force : bool
+        Render all the panels even if their inputs have not changed.
+    max_workers : int, optional
+        Maximum number of worker processes. With 1, runs are rendered in the calling process.
+
+    Returns
+    -------
+    pandas.DataFrame
+        One row per run and panel with the columns 'run', 'panel', 'status' and 'path'.
+    '''
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}. Available: {BACKENDS}")
+    output_dir = Path(output_dir)
+    args = (output_dir, tuple(panels), tuple(formats), backend, nbins, interval, force)
+    if max_workers == 1:
+        results = [render_run(acq, *args) for acq in acquisitions]
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as pool:
+            results = list(pool.map(render_run, acquisitions, *[[a] * len(acquisitions) for a in args]))
+
+    rows = [{'run': _run_id(acq), 'panel': panel, 'status': status, 'path': str(paths[0])}
+            for acq, run in zip(acquisitions, results) for panel, status, paths in run]
+    report = pd.DataFrame(rows, columns=['run', 'panel', 'status', 'path'])
+    write_index(output_dir, report)
+    return report
+
+
+def write_index(output_dir, report):
+    '''Writes ``output_dir/index.html`` with one row of panels per run.'''
+    lines = ["<!DOCTYPE html>", "<html><head><meta charset='utf-8'><title>SIPHRA runs report</title></head><body>"]
+    for run, panels in report.groupby('run', sort=True):
+        lines.append(f"<h2>{run}</h2><div>")
+        for _, row in panels.iterrows():
+            png = Path(row['path']).with_suffix('.png')
+            if png.is_file():
+                lines.append(f"<img src='{png.relative_to(output_dir)}' style='max-width:48%'>")
+            elif row['status'].startswith('failed'):
+                lines.append(f"<p>{row['panel']}: {row['status']}</p>")
+        lines.append("</div>")
+    lines.append("</body></html>")
+    (Path(output_dir) / "index.html").write_text("\n".join(lines))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog='python -m visualization.report',
+        description='Renders spectra, timing and hit-map panels of many runs to PNG/PDF',
+    )
+    parser.add_argument("output", type=Path, help="Output directory")
+    parser.add_argument("files", type=Path, nargs='+', help="Converted \'.csv\' or \'.pkl\' files")
+    parser.add_argument("--panels", nargs='+', default=list(PANELS), choices=PANELS)
+    parser.add_argument("--formats", nargs='+', default=['png'])
+    parser.add_argument("--backend", default='matplotlib', choices=BACKENDS)
+    parser.add_argument("--nbins", type=int, default=1024)
+    parser.add_argument("-j", "--jobs", type=int, default=None, help="Maximum number of worker processes")
+    parser.add_argument("-f", "--force", action="store_true", help="Render even unchanged panels")
+    return parser
+
+
+if __name__ == "__main__":
+    from processing import SiphraAcquisition
+
+    args = build_parser().parse_args()
+    acquisitions = [SiphraAcquisition(f) for f in args.files]
+    report = render_report(acquisitions, args.output, panels=args.panels, formats=args.formats,
+                           backend=args.backend, nbins=args.nbins, force=args.force, max_workers=args.jobs)
+    print(report.groupby(['panel', 'status']).size().to_string())
+    print(f"\nReport written to {args.output / 'index.html'}")